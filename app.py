@@ -1,12 +1,32 @@
 """Streamlit frontend for the Omani AI Therapist."""
 
-import numpy as np
 import streamlit as st
+import streamlit.components.v1 as components
 import time
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from services.admission import admission_stats
+from services.session_analytics import analytics_stats
 from services.session_manager import SessionManager
+from services.session_store import get_session_store
+from services.turn_checkpoint import checkpoint_stats
+from services.turn_record import Turn
 from utils.audio_utils import AudioRecorder, AudioPlayer
-from utils.logging_config import setup_logging
+from utils.audio_devices import SoundDeviceOutput
+from utils.capture_engine import get_capture_engine
+from utils.barge_in import DuplexPlayer
+from utils.pipeline_client import RemoteSessionManager
+from utils.logging_config import logging_stats, setup_logging
+from utils.rate_limiter import rate_limit_stats
+from utils.cancellation import CancellationToken, cancellation_stats
+from utils.circuit_breaker import circuit_breaker_stats
+from utils.cassette import session_cassette
+from utils.chat_view import (APP_CSS, css_injector_html, history_html, history_size, message_html,
+                             turn_block_html)
+from utils.token_usage import token_usage_stats
+from utils.response_budget import response_budget_stats
 from config import CONFIG, validate_config
 import sounddevice as sd
 
@@ -21,88 +41,68 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+def inject_css():
+    """Copy the stylesheet into the page once per browser session; it stays there across reruns."""
+    if not st.session_state.get('css_injected'):
+        components.html(css_injector_html(APP_CSS), height=0)
+        st.session_state.css_injected = True
+
 # Custom CSS
-st.markdown("""
-<style>
-.main-header {
-    text-align: center;
-    color: #2E8B57;
-    font-size: 2.5em;
-    margin-bottom: 30px;
-    font-weight: bold;
-}
-
-.status-box {
-    color: #031a2e;
-    padding: 20px;
-    border-radius: 10px;
-    margin: 20px 0;
-    text-align: center;
-}
-
-.status-listening {
-    border: 2px solid #4CAF50;
-}
-
-.status-processing {
-    border: 2px solid #FF9800;
-}
-
-.status-ready {
-    border: 2px solid #2196F3;
-}
-
-.response-box {
-    background-color: #F5F5F5;
-    padding: 20px;
-    border-radius: 10px;
-    margin: 20px 0;
-    border-left: 5px solid #2E8B57;
-}
-
-.emotion-indicator {
-    display: inline-block;
-    padding: 5px 15px;
-    border-radius: 20px;
-    margin: 5px;
-    font-weight: bold;
-}
-
-.emotion-positive {
-    background-color: #4CAF50;
-    color: white;
-}
-
-.emotion-negative {
-    background-color: #F44336;
-    color: white;
-}
-
-.emotion-neutral {
-    background-color: #9E9E9E;
-    color: white;
-}
-
-.sidebar-info {
-    background-color: #031a2e;
-    padding: 15px;
-    border-radius: 10px;
-    margin: 10px 0;
-}
-
-.arabic-text {
-    font-family: 'Tahoma', 'Arial Unicode MS', sans-serif;
-    font-size: 1.2em;
-    line-height: 1.6;
-    direction: rtl;
-}
-</style>
-""", unsafe_allow_html=True)
+inject_css()
+
+# Fragments rerun only the chat history (e.g. "show earlier") instead of the whole app
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+@st.cache_resource
+def turn_executor() -> ThreadPoolExecutor:
+    """Runs pipeline turns off the script thread, for all browser sessions of this process."""
+    return ThreadPoolExecutor(max_workers=CONFIG.server_max_workers, thread_name_prefix="turn")
+
+def start_turn(store, session_id: str):
+    """Submit the pending turn (new audio or a retry) to the turn executor; returns its future."""
+    cancel_token = CancellationToken()
+    st.session_state.cancel_token = cancel_token
+    manager = st.session_state.session_manager
+    history = store.history(session_id)
+    retry_turn_id = st.session_state.pop('retry_turn_id', None)
+    if retry_turn_id:
+        run = partial(manager.retry_turn, retry_turn_id, history,
+                      cancel_token=cancel_token,
+                      cassette=session_cassette(session_id),
+                      session_id=session_id)
+    else:
+        run = partial(manager.process_voice_input, st.session_state.audio_bytes, history,
+                      cancel_token=cancel_token,
+                      prewarm=st.session_state.pop('prewarm', None),
+                      cassette=session_cassette(session_id),
+                      session_id=session_id)
+    return turn_executor().submit(run)
+
+def wait_for_turn(job):
+    """Wait for a running turn while letting Streamlit act on clicks.
+
+    Streamlit only stops a script run (to handle a click such as Stop) at
+    a Streamlit call, so the wait updates an element every 0.2s instead of
+    blocking on the pipeline. The turn keeps its future in session state:
+    a rerun picks the wait up again, and Stop cancels the turn.
+    """
+    progress = st.empty()
+    started = st.session_state.setdefault('turn_started', time.time())
+    while not job.done():
+        progress.caption(f"⏳ {time.time() - started:.0f}s")
+        time.sleep(0.2)
+    progress.empty()
+    st.session_state.pop('turn_job', None)
+    st.session_state.pop('turn_started', None)
+    return job.result()
 
 def initialize_session_state():
     """Initialize session state variables."""
     if 'session_manager' not in st.session_state:
-        st.session_state.session_manager = SessionManager()
+        if CONFIG.backend_url:
+            st.session_state.session_manager = RemoteSessionManager(CONFIG.backend_url)
+        else:
+            st.session_state.session_manager = SessionManager()
     
     if 'audio_recorder' not in st.session_state:
         st.session_state.audio_recorder = AudioRecorder()
@@ -110,8 +110,17 @@ def initialize_session_state():
     if 'audio_player' not in st.session_state:
         st.session_state.audio_player = AudioPlayer()
     
-    if 'conversation_history' not in st.session_state:
-        st.session_state.conversation_history = []
+    if 'duplex_player' not in st.session_state:
+        st.session_state.duplex_player = DuplexPlayer(
+            get_capture_engine().reader(),
+            SoundDeviceOutput(sample_rate=CONFIG.playback_sample_rate or None)
+        )
+    
+    if 'session_store' not in st.session_state:
+        st.session_state.session_store = get_session_store()
+    
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = current_session_id(st.session_state.session_store)
     
     if 'current_status' not in st.session_state:
         st.session_state.current_status = "ready"
@@ -122,6 +131,35 @@ def initialize_session_state():
     if 'stop_signal' not in st.session_state:
         st.session_state.stop_signal = False
 
+    if 'chat_turns' not in st.session_state:
+        # Rendered window of the conversation; new turns are appended here
+        # instead of reloading the history from the store on every rerun
+        turns, cursor = st.session_state.session_store.recent_turns(
+            st.session_state.session_id, CONFIG.chat_window_turns)
+        st.session_state.chat_turns = turns
+        st.session_state.chat_cursor = cursor
+        st.session_state.chat_window = CONFIG.chat_window_turns
+        settle_chat()
+
+    if 'render_times' not in st.session_state:
+        st.session_state.render_times = deque(maxlen=50)
+
+def current_session_id(store) -> str:
+    """Session id kept in the URL so a page refresh resumes the conversation."""
+    if hasattr(st, "query_params"):
+        session_id = st.query_params.get("session")
+    else:
+        session_id = st.experimental_get_query_params().get("session", [None])[0]
+    
+    if not session_id or not store.session_exists(session_id):
+        session_id = store.create_session()
+        if hasattr(st, "query_params"):
+            st.query_params["session"] = session_id
+        else:
+            st.experimental_set_query_params(session=session_id)
+    
+    return session_id
+
 def display_header():
     """Display the main header."""
     st.markdown("""
@@ -228,13 +266,121 @@ def display_sidebar():
                 "Anthropic API": bool(CONFIG.anthropic_api_key),
                 "Voice File": os.path.exists(CONFIG.voice_file_path),
                 "Max Response Time": CONFIG.max_response_time,
-                "Sample Rate": CONFIG.sample_rate
+                "Sample Rate": CONFIG.sample_rate,
+                "STT Sample Rate": CONFIG.stt_sample_rate
             })
+            st.markdown("### Rate Limits")
+            st.json(rate_limit_stats())
+            st.markdown("### Prewarm Time Saved (s)")
+            st.json(st.session_state.get('prewarm_saved', {}))
+            st.markdown("### Voice Cues (last turn)")
+            st.json(st.session_state.get('turn_prosody') or {})
+            st.markdown("### Tokens")
+            st.json({"last_turn": st.session_state.get('turn_tokens', {}), "totals": token_usage_stats()})
+            st.markdown("### Reply Budget")
+            st.json(response_budget_stats())
+            st.markdown("### Admission Control")
+            st.json(admission_stats())
+            st.markdown("### Analytics Log")
+            st.json(analytics_stats())
+            st.markdown("### Turn Checkpoints")
+            st.json({"last_turn": st.session_state.get('turn_resumed') or {}, "totals": checkpoint_stats()})
+            st.markdown("### Circuit Breakers")
+            st.json(circuit_breaker_stats())
+            st.markdown("### Logging")
+            st.json({"last_turn": st.session_state.get('turn_logging', {}), "totals": logging_stats()})
+            st.markdown("### Cancelled Stages")
+            st.json(cancellation_stats())
+            st.markdown("### Chat Render Time")
+            st.json(render_time_report())
+            st.markdown("### Session Memory")
+            st.json(st.session_state.session_store.memory_report(st.session_state.session_id))
+
+def render_time_report() -> dict:
+    """Chat render time of recent reruns against the size of the history."""
+    samples = list(st.session_state.render_times)
+    if not samples:
+        return {}
+    return {
+        "last_ms": round(samples[-1][2], 2),
+        "avg_ms": round(sum(sample[2] for sample in samples) / len(samples), 2),
+        "samples (turns rendered one by one, total turns, ms)": [
+            [rendered, total, round(ms, 2)] for rendered, total, ms in samples[-10:]
+        ],
+    }
+
+def load_earlier_turns():
+    """Prepend the next page of older turns to the chat window."""
+    cursor = st.session_state.chat_cursor
+    if cursor is None:
+        return
+    turns, cursor = st.session_state.session_store.recent_turns(
+        st.session_state.session_id, CONFIG.chat_page_turns, before=cursor)
+    st.session_state.chat_turns = turns + st.session_state.chat_turns
+    st.session_state.chat_cursor = cursor
+    st.session_state.chat_window += len(turns)
+    settle_chat()
+
+def settle_chat():
+    """Pre-render the window as one block; turns appended later render on their own until the next settle."""
+    st.session_state.chat_html = history_html(st.session_state.chat_turns)
+    st.session_state.chat_settled = len(st.session_state.chat_turns)
+
+def append_chat_turn(turn: Turn, seq: int):
+    """Add a new turn to the chat window, sliding older turns out when full."""
+    turns = st.session_state.chat_turns
+    turns.append(turn)
+    if len(turns) > st.session_state.chat_window:
+        # Slide by several turns at once, so the block is rebuilt now and then rather than every turn
+        window = st.session_state.chat_window
+        del turns[:len(turns) - window + min(CONFIG.chat_page_turns, window // 2)]
+        st.session_state.chat_cursor = seq - len(turns) + 1
+        settle_chat()
+
+def keyed_container(key: str):
+    try:
+        return st.container(key=key)
+    except TypeError:  # Streamlit before 1.42
+        return st.container()
+
+@fragment
+def display_history():
+    """Render the conversation window: the settled turns as one pre-built block, then each newer turn."""
+    started = time.perf_counter()
+    turns = st.session_state.chat_turns
+    cursor = st.session_state.chat_cursor
+    settled = st.session_state.chat_settled
+    
+    if cursor is not None:
+        st.button("⬆️ عرض الرسائل السابقة - Show earlier messages",
+                  key="show_earlier_btn",
+                  on_click=load_earlier_turns)
+    
+    if settled:
+        st.markdown(st.session_state.chat_html, unsafe_allow_html=True)
+    # Keyed by position in the session, so earlier ones keep their place when a turn is added
+    first_seq = cursor or 1
+    for index in range(settled, len(turns)):
+        with keyed_container(f"chat_turn_{first_seq + index}"):
+            st.markdown(turn_block_html(turns[index]), unsafe_allow_html=True)
+    
+    st.session_state.render_times.append(
+        (len(turns) - settled, history_size(turns, cursor), (time.perf_counter() - started) * 1000))
 
 def stop_talking():
     """Stops current recording/playback and resets state."""
     logger.info("Stop button clicked. Setting stop_signal.")
     st.session_state.stop_signal = True # Signal to stop
+    st.session_state.audio_recorder.stop()
+    st.session_state.duplex_player.stop()
+    
+    # Abort any in-flight pipeline turn so it stops using CPU and API quota; its
+    # script run was stopped at wait_for_turn, so the result is not waited for
+    cancel_token = st.session_state.get('cancel_token')
+    if cancel_token is not None:
+        cancel_token.cancel("stop button")
+    st.session_state.pop('turn_job', None)
+    st.session_state.pop('turn_started', None)
     
     # Try to stop sounddevice playback immediately
     try:
@@ -250,8 +396,7 @@ def stop_talking():
     # Reset statuses
     st.session_state.current_status = "ready"
     st.session_state.audio_bytes = None # Clear any pending audio
-    # The record_audio function itself needs to check st.session_state.stop_signal
-    # and exit gracefully if it's set. This requires a change in audio_utils.py as well.
+    st.session_state.pop('pending_audio', None)
     st.rerun() # Rerun to update the UI and stop any loops
 
 
@@ -273,16 +418,12 @@ def main():
         # Create a container for the chat messages
         chat_container = st.container()
 
+        store = st.session_state.session_store
+        session_id = st.session_state.session_id
+        
         # Display conversation history in the chat container first
         with chat_container:
-            for entry in st.session_state.conversation_history:
-                with st.chat_message("user"):
-                    st.markdown(f'<p class="arabic-text">{entry["user"]}</p>', unsafe_allow_html=True)
-                with st.chat_message("assistant"):
-                    st.markdown(f'<p class="arabic-text">{entry["therapist"]}</p>', unsafe_allow_html=True)
-                    if entry.get('emotions'):
-                        # Optionally display emotions here, or in debug only
-                        pass # display_emotions(entry['emotions'])
+            display_history()
         
         # Display current status
         display_status(st.session_state.current_status)
@@ -314,12 +455,24 @@ def main():
                     st.session_state.current_status = "listening"
                     st.rerun()
             
+            # The failed turn's finished stages are checkpointed, so a retry picks up where it stopped
+            if st.session_state.get('failed_turn_id') and st.session_state.current_status in ("ready", "listening"):
+                if st.button("🔁 إعادة المحاولة - Retry last turn", key="retry_btn", use_container_width=True):
+                    st.session_state.retry_turn_id = st.session_state.pop('failed_turn_id')
+                    st.session_state.current_status = "processing"
+                    st.rerun()
+            
             # Processing area
             if st.session_state.current_status == "listening":
                 with st.spinner("جاري التسجيل... Recording..."):
                     try:
+                        def on_speech_end():
+                            # Warm connections and models while the audio is still being packaged
+                            st.session_state.prewarm = st.session_state.session_manager.prepare_turn(
+                                store.history(session_id))
+                        
                         # Record audio
-                        audio_bytes = st.session_state.audio_recorder.record_audio()
+                        audio_bytes = st.session_state.audio_recorder.record_audio(on_speech_end=on_speech_end)
 
                         if st.session_state.stop_signal:
                             logger.info("Recording stopped by user.")
@@ -351,7 +504,7 @@ def main():
                         with st.chat_message("user"):
                             # Create an empty placeholder to update later with actual transcription
                             st.session_state.user_message_placeholder = st.empty()
-                            st.session_state.user_message_placeholder.markdown(f'<p class="arabic-text">...</p>', unsafe_allow_html=True)
+                            st.session_state.user_message_placeholder.markdown(message_html("..."), unsafe_allow_html=True)
                 with st.spinner("جاري المعالجة... Processing..."):
                     if st.session_state.stop_signal:
                         logger.info("Processing skipped due to stop signal.")
@@ -360,16 +513,29 @@ def main():
                         st.rerun()
                         return # Exit the function to prevent further processing
                     try:
-                        # Process through pipeline
-                        result = st.session_state.session_manager.process_voice_input(st.session_state.audio_bytes, st.session_state.conversation_history)
+                        # Process through pipeline, on a worker thread so Stop can cancel it
+                        if st.session_state.get('turn_job') is None:
+                            st.session_state.turn_job = start_turn(store, session_id)
+                        result = wait_for_turn(st.session_state.turn_job)
+                        st.session_state.turn_resumed = result.get("resumed")
+                        st.session_state.cancel_token = None
 
                         st.session_state.audio_bytes = None  # Clear audio bytes after processing
                         
+                        if not result["success"] or result.get("audio_failed"):
+                            st.session_state.failed_turn_id = result.get("turn_id")
+                        
+                        if result["cancelled"]:
+                            logger.info("Processing cancelled by user.")
+                            st.session_state.stop_signal = False
+                            st.session_state.current_status = "ready"
+                            st.rerun()
+                        
                         if result["success"]:
                             # --- MODIFIED: Update the user's displayed transcription placeholder ---
                             if st.session_state.user_message_placeholder:
                                 st.session_state.user_message_placeholder.markdown(
-                                    f'<p class="arabic-text">{result["transcription"]}</p>', 
+                                    message_html(result["transcription"]), 
                                     unsafe_allow_html=True
                                 )
                                 # Clear the placeholder reference so a new one is created next turn
@@ -378,30 +544,38 @@ def main():
                             # --- ADDED: Display therapist's response in real-time within the chat_container ---
                             with chat_container:
                                 with st.chat_message("assistant"):
-                                    st.markdown(f'<p class="arabic-text">{result["response_text"]}</p>', unsafe_allow_html=True)
+                                    st.markdown(message_html(result["response_text"]), unsafe_allow_html=True)
                                     if result.get('emotions'):
                                         display_emotions(result['emotions']) # Display emotions below AI response
                             
                             # Update conversation history
-                            st.session_state.conversation_history.append({
-                                "user": result["transcription"],
-                                "therapist": result["response_text"],
-                                "emotions": result["emotions"],
-                                "timestamp": time.time()
-                            })
+                            turn = Turn(
+                                result["transcription"],
+                                result["response_text"],
+                                result["emotions"]
+                            )
+                            # Audio sent twice gets the first result back, and a retry that only
+                            # re-voiced the reply repeats a turn; either is already stored
+                            resumed = result.get("resumed", {})
+                            if not (resumed.get("deduplicated") or resumed.get("revoiced")):
+                                append_chat_turn(turn, store.append_turn(session_id, turn))
+                            
+                            # Update processing time before the reruns below end this script run
+                            st.session_state.processing_time = result["processing_time"]
+                            st.session_state.prewarm_saved = result.get("prewarm_saved", {})
+                            st.session_state.turn_logging = result.get("logging", {})
+                            st.session_state.turn_tokens = result.get("tokens", {})
+                            st.session_state.turn_prosody = result.get("prosody")
                             
-                            # Play audio response
-                            if result["audio_file"]:
-                                st.session_state.audio_bytes = result["audio_file"]
+                            # Play audio response; it is dropped from session state once played
+                            if result["audio_file"] is not None:
+                                st.session_state.pending_audio = result.pop("audio_file")
                                 st.session_state.current_status = "speaking"
                                 st.rerun()
                             else: # If no audio file returned
                                 st.session_state.current_status = "ready"
                                 st.rerun()
                             
-                            # Update processing time
-                            st.session_state.processing_time = result["processing_time"]
-                            
                             # Check if response was within time limit
                             if result["processing_time"] > CONFIG.max_response_time:
                                 st.warning(f"⚠️ الرد استغرق {result['processing_time']:.1f} ثانية (أكثر من الحد المطلوب)")
@@ -423,10 +597,22 @@ def main():
                 with st.spinner("جاري التحدث... Speaking..."):
                     try:
                         # Play the audio response
-                        if 'audio_bytes' in st.session_state:
-                            audio_bytes = st.session_state.audio_bytes
-                            sd.play(np.array(audio_bytes), samplerate=CONFIG.sample_rate)
-                            sd.wait()  # Wait until playback is done
+                        audio = st.session_state.pop('pending_audio', None)
+                        if audio is not None:
+                            if CONFIG.barge_in_enabled:
+                                # Keeps listening while talking; returns the user's speech if they interrupt
+                                interruption = st.session_state.duplex_player.play(audio)
+                                del audio
+                                if interruption:
+                                    st.session_state.audio_bytes = interruption
+                                    st.session_state.current_status = "processing"
+                                    st.rerun()
+                            else:
+                                audio = audio.resample(
+                                    st.session_state.duplex_player.output_device.device_rate(audio.sample_rate))
+                                sd.play(audio.samples, samplerate=audio.sample_rate)
+                                del audio
+                                sd.wait()  # Wait until playback is done
                         
                         st.session_state.current_status = "listening"
                         st.rerun()
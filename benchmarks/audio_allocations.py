@@ -0,0 +1,67 @@
+"""Compare allocations of the old list-based audio path with AudioBuffer.
+
+Simulates one TTS reply travelling synthesis -> session result -> playback ->
+network transport, and reports the allocations still alive at the point of playback plus the
+peak memory, measured with tracemalloc.
+
+Usage:
+    python -m benchmarks.audio_allocations --seconds 10
+"""
+
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from utils.audio_buffer import AudioBuffer
+
+XTTS_SAMPLE_RATE = 24000
+CHUNK_MS = 100
+
+
+def list_path(wav: np.ndarray):
+    """What the pipeline did before: TTS.api list -> np.array for playback -> bytes."""
+    wav_output = list(wav)  # TTS.api returns a list of floats
+    playback = np.array(wav_output)  # app.py before sd.play
+    pcm = (np.clip(np.asarray(wav_output, dtype=np.float32), -1.0, 1.0) * 32767).astype('<i2').tobytes()
+    chunk = XTTS_SAMPLE_RATE * CHUNK_MS // 1000 * 2
+    # wav_output stayed alive in the session result / session state until playback
+    return wav_output, playback, [pcm[offset:offset + chunk] for offset in range(0, len(pcm), chunk)]
+
+
+def buffer_path(wav: np.ndarray):
+    """Current path: one float32 buffer for playback, one int16 encoding for transport."""
+    audio = AudioBuffer.from_float(wav, XTTS_SAMPLE_RATE)
+    return audio.samples, [bytes(chunk) for chunk in audio.iter_pcm16_chunks(CHUNK_MS)]
+
+
+def measure(path, wav: np.ndarray):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = path(wav)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, "filename")
+    allocations = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    del result
+    return allocations, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0, help="length of the simulated reply")
+    args = parser.parse_args()
+
+    samples = int(args.seconds * XTTS_SAMPLE_RATE)
+    wav = (0.3 * np.sin(np.arange(samples) * 2 * np.pi * 220 / XTTS_SAMPLE_RATE)).astype(np.float32)
+
+    print(f"reply: {args.seconds:.1f}s at {XTTS_SAMPLE_RATE} Hz ({samples} samples)")
+    for name, path in (("list", list_path), ("AudioBuffer", buffer_path)):
+        allocations, peak = measure(path, wav)
+        print(f"{name:>12}: {allocations:>9} live allocations, peak {peak / 1e6:7.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Drive the circuit breakers through simulated provider outages and check the failover.
+
+One user talks continuously to a SessionManager wired to the simulated
+providers (see provider_simulator.py). In each scenario a provider goes
+down for a while: its requests hang for ``--hang`` seconds and then fail.
+The scenario checks that
+
+- the provider's breaker opens, and closes again after the outage
+- while it is open, turns take the alternative path without waiting on
+  the provider: Claude answers when GPT is down, validation is skipped
+  when Claude is down, and the canned reply is used when both are
+- once it has closed, turns are served by the provider again
+
+Every breaker state change is printed as it happens. Exits with status 1
+if a check fails.
+
+Usage:
+    python -m benchmarks.circuit_breaker_drill
+    python -m benchmarks.circuit_breaker_drill --hang 5 --outage 15
+"""
+
+import argparse
+import sys
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+from benchmarks.load_test import build_manager, load_script
+from benchmarks.provider_simulator import ProviderProfile, TranscriptRegistry
+from config import CONFIG
+from services.turn_record import Turn
+from utils.circuit_breaker import CLOSED, add_breaker_listener, circuit_breaker_stats
+
+# Simulated providers taken down -> breakers that should open
+SCENARIOS = {
+    "gpt": {"down": ["gpt"], "breakers": ["openai.chat"]},
+    "claude": {"down": ["claude"], "breakers": ["anthropic.messages"]},
+    "both": {"down": ["gpt", "claude"], "breakers": ["openai.chat", "anthropic.messages"]},
+}
+
+
+def expected(rejected: set) -> Dict[str, str]:
+    """How a turn should be served given the breakers that turned its requests away."""
+    if {"openai.chat", "anthropic.messages"} <= rejected:
+        return {"model": "fallback"}
+    if "openai.chat" in rejected:
+        return {"model": "claude"}
+    return {"model": "gpt", "validation": "skipped"}
+
+
+def _rejected(breakers: List[str]) -> Dict[str, int]:
+    stats = circuit_breaker_stats()
+    return {breaker: stats.get(breaker, {}).get("rejected", 0) for breaker in breakers}
+
+
+def run_scenario(name: str, scenario: dict, sessions: List[List[dict]], registry: TranscriptRegistry,
+                 args) -> List[str]:
+    """Run one outage; return the failed checks."""
+    profiles = {provider: ProviderProfile(latency=0.1 if provider == "whisper" else 0.2, jitter=0.1)
+                for provider in ("whisper", "gpt", "claude")}
+    for provider in scenario["down"]:
+        profiles[provider].outage_start = args.lead
+        profiles[provider].outage_seconds = args.outage
+        profiles[provider].outage_hang = args.hang
+    manager, _ = build_manager(profiles, registry, SimpleNamespace(emotion_latency=0.01, tts_rtf=0.0), seed=1)
+
+    turns = [turn for session in sessions for turn in session]
+    history: List[Turn] = []
+    records = []
+    started = time.monotonic()
+    while time.monotonic() - started < args.lead + args.outage + args.tail:
+        turn = turns[len(records) % len(turns)]
+        before = _rejected(scenario["breakers"])
+        began = time.monotonic()
+        result = manager.process_voice_input(turn["wav"], history[-CONFIG.session_history_window:])
+        after = _rejected(scenario["breakers"])
+        records.append({
+            "at": began - started,
+            "latency": time.monotonic() - began,
+            "model": result["model"],
+            "validation": result["validation"],
+            "success": result["success"],
+            "rejected_by": {breaker for breaker in after if after[breaker] > before[breaker]},
+        })
+        if result["success"]:
+            history.append(Turn(result["transcription"], result["response_text"], result["emotions"]))
+
+    failures = []
+    breakers = circuit_breaker_stats()
+    for breaker in scenario["breakers"]:
+        stats = breakers.get(breaker, {})
+        states = [event["to"] for event in stats.get("transitions", [])]
+        if "open" not in states:
+            failures.append(f"{breaker} never opened")
+        if stats.get("state") != CLOSED:
+            failures.append(f"{breaker} still {stats.get('state')} after the outage")
+
+    short = [record for record in records if record["rejected_by"]]
+    if not short:
+        failures.append("no turn was short-circuited")
+    for record in short:
+        for key, value in expected(record["rejected_by"]).items():
+            if record[key] != value:
+                failures.append(f"turn at {record['at']:.1f}s: {key}={record[key]}, expected {value}")
+        if record["latency"] >= args.hang:
+            failures.append(f"turn at {record['at']:.1f}s waited {record['latency']:.2f}s with the circuit open")
+        if not record["success"]:
+            failures.append(f"turn at {record['at']:.1f}s failed")
+    if records[-1]["model"] != "gpt":
+        failures.append(f"last turn answered by {records[-1]['model']}, expected gpt after recovery")
+
+    waits = [record["latency"] for record in records if not record["rejected_by"]
+             and args.lead <= record["at"] < args.lead + args.outage]
+    print(f"  {len(records)} turns, {len(short)} short-circuited "
+          f"(max {max(record['latency'] for record in short) if short else 0:.2f}s), "
+          f"{len(waits)} waited on the provider during the outage "
+          f"(max {max(waits) if waits else 0:.2f}s)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="which outages to run")
+    parser.add_argument("--lead", type=float, default=1.0, help="seconds before the provider goes down")
+    parser.add_argument("--outage", type=float, default=10.0, help="seconds the provider stays down")
+    parser.add_argument("--tail", type=float, default=5.0, help="seconds of turns after the outage")
+    parser.add_argument("--hang", type=float, default=2.0, help="seconds a request hangs before failing")
+    parser.add_argument("--open", type=float, default=2.0, help="seconds a breaker stays open before probing")
+    args = parser.parse_args()
+
+    # Small numbers so a drill takes seconds; the thresholds are the configured ones
+    for settings in CONFIG.circuit_breakers.values():
+        settings.update(min_calls=2, open_s=args.open)
+    CONFIG.admission_control = False
+    CONFIG.prosody_enabled = False
+
+    started = time.monotonic()
+    add_breaker_listener(lambda event: print(f"    {time.monotonic() - started:6.2f}s  {event['breaker']}: "
+                                             f"{event['from']} -> {event['to']} ({event['reason']})"))
+    registry = TranscriptRegistry(CONFIG.stt_sample_rate)
+    sessions = load_script("", registry)
+
+    results: Dict[str, List[str]] = {}
+    for name in (name.strip() for name in args.scenarios.split(",") if name.strip()):
+        print(f"{name} down for {args.outage:.0f}s (requests hang {args.hang:.1f}s):")
+        started = time.monotonic()
+        results[name] = run_scenario(name, SCENARIOS[name], sessions, registry, args)
+        for failure in results[name]:
+            print(f"  FAIL: {failure}")
+    sys.exit(1 if any(results.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
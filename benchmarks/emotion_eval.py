@@ -0,0 +1,190 @@
+"""Measure emotion and crisis detection quality and throughput on a labeled corpus.
+
+The corpus is JSONL (or CSV with a header) with one utterance per line:
+
+    {"text": "...", "emotion": "negative", "crisis": true}
+
+``emotion`` is one of negative/neutral/positive and ``crisis`` whether a
+counsellor would treat the utterance as a crisis. EmotionService runs
+over the whole corpus at each ``--batch-sizes`` value, and the keyword
+crisis detector once. Reported:
+
+- emotion accuracy, precision/recall/F1 per label and the confusion matrix
+- crisis precision/recall and its confusion matrix
+- per batch size: utterances/s and per-batch latency (p50/p90/max)
+- whether the predictions differ between batch sizes (padding should not
+  change them)
+
+benchmarks/emotion_eval_sample.jsonl is a small example corpus for
+trying the command; quality figures need a hand-labeled corpus of
+realistic size.
+
+Usage:
+    python -m benchmarks.emotion_eval benchmarks/emotion_eval_sample.jsonl
+    python -m benchmarks.emotion_eval corpus.jsonl --batch-sizes 1,8,32,64 --output reports/emotion_eval.json
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from typing import Dict, List
+
+from benchmarks.load_test import git_revision
+from benchmarks.ws_load_test import percentile
+from config import CONFIG
+from services.emotion_service import EmotionService
+from services.turn_record import EMOTION_LABELS
+from utils.text_utils import detect_crisis_keywords
+
+
+def load_corpus(path: str) -> List[dict]:
+    """Labeled utterances as dicts with ``text``, ``emotion`` and ``crisis``."""
+    with open(path, encoding="utf-8") as corpus_file:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(corpus_file))
+        else:
+            rows = [json.loads(line) for line in corpus_file if line.strip()]
+    corpus = []
+    for row in rows:
+        crisis = row.get("crisis", False)
+        if isinstance(crisis, str):
+            crisis = crisis.strip().lower() in ("1", "true", "yes")
+        corpus.append({"text": row["text"], "emotion": row["emotion"].strip().lower(), "crisis": bool(crisis)})
+    return corpus
+
+
+def top_label(emotions: Dict[str, float]) -> str:
+    return max(emotions, key=emotions.get) if emotions else "neutral"
+
+
+def classification_report(expected: List, predicted: List, labels: List) -> dict:
+    """Accuracy, per-label precision/recall/F1 and the confusion matrix (rows are expected labels)."""
+    confusion = {str(truth): {str(guess): 0 for guess in labels} for truth in labels}
+    for truth, guess in zip(expected, predicted):
+        if truth in labels and guess in labels:
+            confusion[str(truth)][str(guess)] += 1
+    per_label = {}
+    for label in labels:
+        name = str(label)
+        hits = confusion[name][name]
+        predicted_count = sum(confusion[str(truth)][name] for truth in labels)
+        expected_count = sum(confusion[name].values())
+        precision = hits / predicted_count if predicted_count else 0.0
+        recall = hits / expected_count if expected_count else 0.0
+        per_label[name] = {
+            "support": expected_count,
+            "precision": round(precision, 4),
+            "recall": round(recall, 4),
+            "f1": round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+        }
+    correct = sum(1 for truth, guess in zip(expected, predicted) if truth == guess)
+    return {
+        "accuracy": round(correct / len(expected), 4) if expected else 0.0,
+        "per_label": per_label,
+        "confusion": confusion,
+    }
+
+
+def time_batches(service: EmotionService, texts: List[str], batch_size: int) -> dict:
+    """Run the corpus in batches of ``batch_size`` and time each batch."""
+    service.detect_emotions(texts[:batch_size], batch_size)  # warm up at this batch shape
+    predictions, latencies = [], []
+    started = time.perf_counter()
+    for start in range(0, len(texts), batch_size):
+        batch_started = time.perf_counter()
+        predictions.extend(service.detect_emotions(texts[start:start + batch_size], batch_size))
+        latencies.append(time.perf_counter() - batch_started)
+    elapsed = time.perf_counter() - started
+    return {
+        "batch_size": batch_size,
+        "batches": len(latencies),
+        "seconds": round(elapsed, 3),
+        "utterances_per_s": round(len(texts) / elapsed, 1) if elapsed else 0.0,
+        "batch_latency_ms": {
+            "p50": round(1000 * percentile(latencies, 0.5), 2),
+            "p90": round(1000 * percentile(latencies, 0.9), 2),
+            "max": round(1000 * max(latencies), 2),
+        },
+        "predictions": [top_label(emotions) for emotions in predictions],
+    }
+
+
+def evaluate_crisis(corpus: List[dict]) -> dict:
+    started = time.perf_counter()
+    flagged = [detect_crisis_keywords(row["text"], CONFIG.crisis_keywords) for row in corpus]
+    elapsed = time.perf_counter() - started
+    report = classification_report([row["crisis"] for row in corpus], flagged, [True, False])
+    crisis = report["per_label"]["True"]
+    return {
+        "recall": crisis["recall"],
+        "precision": crisis["precision"],
+        "confusion": report["confusion"],
+        "missed": [row["text"] for row, flag in zip(corpus, flagged) if row["crisis"] and not flag],
+        "over_flagged": [row["text"] for row, flag in zip(corpus, flagged) if flag and not row["crisis"]],
+        "utterances_per_s": round(len(corpus) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def print_report(report: dict):
+    emotion = report["emotion"]
+    print(f"{report['utterances']} utterances, model {report['model']} ({report['backend']})")
+    print(f"emotion accuracy {emotion['accuracy']:.2%}")
+    for label, stats in emotion["per_label"].items():
+        print(f"    {label:<9} precision {stats['precision']:.2%}  recall {stats['recall']:.2%}  "
+              f"f1 {stats['f1']:.2%}  n={stats['support']}")
+    print("    confusion (rows expected, columns predicted): " + "  ".join(EMOTION_LABELS))
+    for label, row in emotion["confusion"].items():
+        print(f"    {label:<9} " + "  ".join(f"{row[guess]:>8}" for guess in EMOTION_LABELS))
+    crisis = report["crisis"]
+    print(f"crisis recall {crisis['recall']:.2%}  precision {crisis['precision']:.2%}  "
+          f"missed={len(crisis['missed'])} over-flagged={len(crisis['over_flagged'])}  "
+          f"{crisis['utterances_per_s']:.0f} utterances/s")
+    for text in crisis["missed"]:
+        print(f"    missed: {text}")
+    print("throughput:")
+    for run in report["throughput"]:
+        latency = run["batch_latency_ms"]
+        print(f"    batch {run['batch_size']:>4}: {run['utterances_per_s']:8.1f} utterances/s  "
+              f"batch p50={latency['p50']:.1f}ms p90={latency['p90']:.1f}ms max={latency['max']:.1f}ms")
+    if not report["consistent_across_batch_sizes"]:
+        print("WARNING: predictions differ between batch sizes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", help="labeled utterances (.jsonl or .csv)")
+    parser.add_argument("--batch-sizes", default="1,8,32", help="EmotionService batch sizes to time")
+    parser.add_argument("--output", default="", help="write the JSON report here")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    texts = [row["text"] for row in corpus]
+    service = EmotionService()
+    runs = [time_batches(service, texts, int(size))
+            for size in args.batch_sizes.split(",") if size.strip()]
+    predictions = runs[0]["predictions"]
+
+    report = {
+        "revision": git_revision(),
+        "corpus": args.corpus,
+        "utterances": len(corpus),
+        "model": service.model_name,
+        "backend": "model" if service.model else "rule-based fallback",
+        "emotion": classification_report([row["emotion"] for row in corpus], predictions, EMOTION_LABELS),
+        "crisis": evaluate_crisis(corpus),
+        "throughput": [{key: value for key, value in run.items() if key != "predictions"} for run in runs],
+        "consistent_across_batch_sizes": all(run["predictions"] == predictions for run in runs),
+    }
+    print_report(report)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, ensure_ascii=False, indent=2)
+        print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
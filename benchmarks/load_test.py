@@ -0,0 +1,333 @@
+"""Multi-session load test of SessionManager against simulated providers.
+
+N simulated users each replay a scripted multi-turn session, from
+pre-transcribed text or from audio files, against one shared
+SessionManager, the way server.py runs it. Whisper, GPT and Claude are
+simulated with configurable latency, error rates and provider-side rate
+limits (see provider_simulator.py). The client-side rate limiters, retries
+and priority queue are the real ones. The emotion model and XTTS are
+replaced by fixed CPU costs.
+
+Each concurrency level gets fresh limiters and services. Reported per
+level:
+- throughput
+- turn latency percentiles
+- time spent queued in the client rate limiters
+- provider 429s and errors
+- input and output tokens per request stage
+- how often replies kept to the sentence budget, and what stopping early saved
+- turns served per admission control tier, and crisis turns exempted
+- circuit breaker state changes and calls they turned away
+- resident memory growth
+
+The JSON report is meant to be kept and compared across commits.
+
+Script format (JSON): a list of sessions, each a list of turns, each turn
+either {"text": "..."} or {"audio": "path.wav", "text": "what was said"}.
+
+Usage:
+    python -m benchmarks.load_test --levels 10,50,200 --turns 3 --output reports/load_test.json
+    python -m benchmarks.load_test --latency gpt=2.0 --error-rate claude=0.05 --provider-rps whisper=5
+    python -m benchmarks.load_test --levels 10 --outage-start gpt=5 --outage-seconds gpt=60 --outage-hang gpt=20
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from benchmarks.provider_simulator import (
+    ProviderProfile,
+    SimulatedAnthropic,
+    SimulatedEmotionService,
+    SimulatedOpenAI,
+    SimulatedProvider,
+    SimulatedTTSService,
+    TranscriptRegistry,
+)
+from benchmarks.ws_load_test import load_pcm16_wav, percentile
+from config import CONFIG
+from services.admission import admission_stats, reset_admission_controller
+from services.gpt_service import GPTService
+from services.session_manager import SessionManager
+from services.stt_engines import OpenAIWhisperEngine
+from services.stt_service import STTService
+from services.turn_checkpoint import reset_checkpoint_store
+from services.turn_record import Turn
+from utils.audio_buffer import AudioBuffer
+from utils.circuit_breaker import circuit_breaker_stats, reset_circuit_breakers
+from utils.rate_limiter import rate_limit_stats, reset_rate_limiters
+from utils.response_budget import reset_response_budget_stats, response_budget_stats
+from utils.token_usage import reset_token_usage, token_usage_stats
+
+DEFAULT_SCRIPT = [
+    [
+        {"text": "السلام عليكم، أحس بضيق من فترة وما أعرف السبب"},
+        {"text": "الشغل كثير وما عندي وقت للأهل"},
+        {"text": "إن شاء الله أحاول أرتب وقتي، شكراً لك"},
+    ],
+    [
+        {"text": "ما أقدر أنام زين، أفكر كثير في المستقبل"},
+        {"text": "أخاف ما ألقى وظيفة بعد التخرج"},
+        {"text": "الحمد لله، كلامك طمني شوي"},
+    ],
+    [
+        {"text": "تعبت من كل شي، أحس ما أبي أعيش"},
+        {"text": "ما أحد يفهمني في البيت"},
+        {"text": "طيب، بتصل على الرقم"},
+    ],
+]
+
+DEFAULT_PROFILES = {
+    "whisper": ProviderProfile(latency=0.6, error_rate=0.01),
+    "gpt": ProviderProfile(latency=1.5, error_rate=0.01),
+    "claude": ProviderProfile(latency=1.2, error_rate=0.01),
+}
+
+
+def parse_overrides(values: List[str]) -> Dict[str, float]:
+    """Parse ``provider=value`` pairs given on the command line."""
+    overrides = {}
+    for item in values or []:
+        for pair in item.split(","):
+            name, _, value = pair.partition("=")
+            overrides[name.strip()] = float(value)
+    return overrides
+
+
+def load_script(path: str, registry: TranscriptRegistry) -> List[List[dict]]:
+    """Load sessions and prepare the WAV bytes and transcript of every turn."""
+    sessions = DEFAULT_SCRIPT
+    base = "."
+    if path:
+        with open(path, encoding="utf-8") as script_file:
+            sessions = json.load(script_file)
+        base = os.path.dirname(path)
+
+    prepared = []
+    for session in sessions:
+        turns = []
+        for turn in session:
+            if turn.get("audio"):
+                audio = AudioBuffer.from_wav_bytes(load_pcm16_wav(os.path.join(base, turn["audio"])))
+                registry.register(audio, turn.get("text", ""))
+            else:
+                audio = registry.synthesize(turn["text"], CONFIG.sample_rate)
+            turns.append({"text": turn.get("text", ""), "wav": audio.to_wav_bytes()})
+        prepared.append(turns)
+    return prepared
+
+
+def build_manager(profiles: Dict[str, ProviderProfile], registry: TranscriptRegistry, args, seed: int):
+    """Fresh limiters, simulated providers and a SessionManager wired to them."""
+    reset_rate_limiters()
+    reset_token_usage()
+    reset_response_budget_stats()
+    reset_admission_controller()
+    reset_checkpoint_store()
+    reset_circuit_breakers()
+    providers = {name: SimulatedProvider(name, profile, seed + index)
+                 for index, (name, profile) in enumerate(profiles.items())}
+    openai_sim = SimulatedOpenAI(providers["gpt"], providers["whisper"], registry)
+    manager = SessionManager(
+        stt_service=STTService([OpenAIWhisperEngine(openai_sim)]),
+        emotion_service=SimulatedEmotionService(args.emotion_latency),
+        gpt_service=GPTService(openai_module=openai_sim,
+                               anthropic_client=SimulatedAnthropic(providers["claude"])),
+        tts_service=SimulatedTTSService(args.tts_rtf),
+    )
+    return manager, providers
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak, on platforms without /proc
+
+
+def run_user(manager: SessionManager, session: List[dict], think_time: float,
+             start: threading.Event, rng: random.Random, records: list):
+    history: List[Turn] = []
+    start.wait()
+    for turn in session:
+        began = time.perf_counter()
+        result = manager.process_voice_input(turn["wav"], history[-CONFIG.session_history_window:])
+        records.append({
+            "latency": time.perf_counter() - began,
+            "success": result["success"],
+            "error": result["error"],
+        })
+        if result["success"]:
+            history.append(Turn(result["transcription"], result["response_text"], result["emotions"]))
+        if think_time:
+            time.sleep(rng.uniform(0, think_time))
+
+
+def run_level(users: int, sessions: List[List[dict]], profiles, registry, args) -> dict:
+    manager, providers = build_manager(profiles, registry, args, seed=args.seed + users)
+    rng = random.Random(args.seed)
+    records: list = []
+    start = threading.Event()
+    threads = [
+        threading.Thread(target=run_user,
+                         args=(manager, sessions[index % len(sessions)], args.think_time,
+                               start, random.Random(rng.random()), records),
+                         name=f"user-{index}")
+        for index in range(users)
+    ]
+
+    rss_before = rss_mb()
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    start.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    rss_after = rss_mb()
+
+    latencies = [record["latency"] for record in records if record["success"]]
+    errors: Dict[str, int] = {}
+    for record in records:
+        if not record["success"]:
+            errors[record["error"]] = errors.get(record["error"], 0) + 1
+
+    queueing = {
+        name: {
+            "requests": stats["total_requests"],
+            "avg_wait": round(stats["avg_wait"], 3),
+            "max_wait": round(stats["max_wait"], 3),
+            "throttled_responses": stats["throttled_responses"],
+        }
+        for name, stats in rate_limit_stats().items()
+    }
+
+    return {
+        "users": users,
+        "turns": len(records),
+        "completed": len(latencies),
+        "failed": len(records) - len(latencies),
+        "wall_seconds": round(elapsed, 2),
+        "throughput_turns_per_s": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency_s": {
+            "p50": round(percentile(latencies, 0.5), 3),
+            "p90": round(percentile(latencies, 0.9), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "max": round(max(latencies), 3) if latencies else 0.0,
+        },
+        "queueing": queueing,
+        "providers": {name: provider.stats() for name, provider in providers.items()},
+        "tokens": {stage: {"requests": stats["requests"], "avg_input": stats["avg_input_tokens"],
+                           "avg_output": stats["avg_output_tokens"], "over_budget": stats["over_budget"]}
+                   for stage, stats in token_usage_stats().items()},
+        "reply_budget": response_budget_stats(),
+        "admission": admission_stats(),
+        "circuit_breakers": circuit_breaker_stats(),
+        "errors": errors,
+        "memory_mb": {
+            "rss_before": round(rss_before, 1),
+            "rss_after": round(rss_after, 1),
+            "growth": round(rss_after - rss_before, 1),
+        },
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def print_level(level: dict):
+    latency = level["latency_s"]
+    print(f"users={level['users']:>4}  turns={level['completed']}/{level['turns']}  "
+          f"throughput={level['throughput_turns_per_s']:.2f}/s  "
+          f"p50={latency['p50']:.2f}s p90={latency['p90']:.2f}s p99={latency['p99']:.2f}s  "
+          f"rss +{level['memory_mb']['growth']:.1f} MB")
+    for name, queue in level["queueing"].items():
+        print(f"    {name:<10} queued avg={queue['avg_wait']:.2f}s max={queue['max_wait']:.2f}s "
+              f"429s={queue['throttled_responses']}")
+    for stage, tokens in level["tokens"].items():
+        print(f"    {stage:<18} tokens in={tokens['avg_input']:.0f} out={tokens['avg_output']:.0f} "
+              f"over budget={tokens['over_budget']}")
+    budget = level["reply_budget"]
+    print(f"    replies within budget={budget['adherence']:.0%} stopped early={budget['stopped_early']} "
+          f"trimmed chars={budget['trimmed_chars']} max_tokens unused={budget['max_tokens_unused']}")
+    admission = level["admission"]
+    print(f"    admitted per tier={admission.get('admitted', {})} "
+          f"crisis overrides={admission.get('crisis_overrides', 0)} final tier={admission['tier_name']}")
+    for name, breaker in level["circuit_breakers"].items():
+        changes = " ".join(f"{event['from']}->{event['to']}" for event in breaker["transitions"])
+        print(f"    breaker {name:<18} {breaker['state']:<9} rejected={breaker['rejected']} "
+              f"failures={breaker['failures']} slow={breaker['slow_calls']} {changes}".rstrip())
+    for error, count in sorted(level["errors"].items(), key=lambda item: -item[1])[:3]:
+        print(f"    error x{count}: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="10,50,200", help="comma-separated concurrent user counts")
+    parser.add_argument("--turns", type=int, default=0, help="turns per user (default: whole script session)")
+    parser.add_argument("--script", default="", help="JSON script of sessions (default: built-in)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="max random pause between turns, seconds")
+    parser.add_argument("--latency", action="append", help="median provider latency, e.g. gpt=1.5")
+    parser.add_argument("--error-rate", action="append", help="provider error rate, e.g. claude=0.05")
+    parser.add_argument("--provider-rps", action="append", help="provider-side rate limit, e.g. whisper=5")
+    parser.add_argument("--outage-start", action="append", help="seconds into each level a provider goes down")
+    parser.add_argument("--outage-seconds", action="append", help="how long the provider stays down")
+    parser.add_argument("--outage-hang", action="append", help="seconds a request hangs before failing while down")
+    parser.add_argument("--emotion-latency", type=float, default=0.05)
+    parser.add_argument("--tts-rtf", type=float, default=0.3, help="simulated TTS real-time factor")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="", help="write the JSON report here")
+    args = parser.parse_args()
+
+    profiles = {name: ProviderProfile(**vars(profile)) for name, profile in DEFAULT_PROFILES.items()}
+    for attribute, option in (("latency", args.latency), ("error_rate", args.error_rate),
+                              ("requests_per_second", args.provider_rps), ("outage_start", args.outage_start),
+                              ("outage_seconds", args.outage_seconds), ("outage_hang", args.outage_hang)):
+        for name, value in parse_overrides(option).items():
+            setattr(profiles[name], attribute, value)
+
+    registry = TranscriptRegistry(CONFIG.stt_sample_rate)
+    sessions = load_script(args.script, registry)
+    if args.turns:
+        sessions = [(session * args.turns)[:args.turns] for session in sessions]
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "providers": {name: vars(profile) for name, profile in profiles.items()},
+        "client_rate_limits": CONFIG.rate_limits,
+        "settings": {"think_time": args.think_time, "emotion_latency": args.emotion_latency,
+                     "tts_rtf": args.tts_rtf, "seed": args.seed},
+        "levels": [],
+    }
+    for users in (int(level) for level in args.levels.split(",") if level.strip()):
+        level = run_level(users, sessions, profiles, registry, args)
+        print_level(level)
+        report["levels"].append(level)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, ensure_ascii=False, indent=2)
+        print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
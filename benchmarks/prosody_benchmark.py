@@ -0,0 +1,114 @@
+"""Check and time the prosodic feature extractor.
+
+A synthetic utterance with known pitch, syllable rate and pauses (voiced
+harmonic syllables grouped into words, silence between words) is
+analysed at the capture and STT rates, and the features are compared
+with the values it was built with. Cost is reported as milliseconds of
+CPU per second of audio for several utterance lengths; it runs alongside
+transcription, so it only has to stay well below Whisper's latency.
+WAV files given on the command line are analysed and timed too.
+
+Usage:
+    python -m benchmarks.prosody_benchmark
+    python -m benchmarks.prosody_benchmark --lengths 2,10,30 recordings/*.wav
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.ws_load_test import load_pcm16_wav
+from utils.audio_buffer import AudioBuffer
+from utils.prosody import extract_prosody, prosody_emotions
+
+RATES = [22050, 16000]
+
+
+def synthetic_utterance(seconds: float, sample_rate: int, pitch_hz: float = 140.0,
+                        syllables_per_s: float = 5.0, syllables_per_word: int = 3,
+                        pause_s: float = 0.3, glide_st: float = 2.0):
+    """Speech-like audio and the pause ratio it was built with."""
+    rng = np.random.default_rng(0)
+    syllable = int(sample_rate / syllables_per_s)
+    word = syllable * syllables_per_word
+    gap = int(sample_rate * pause_s)
+    pieces, spoken, paused = [], 0, 0
+    while spoken + paused < seconds * sample_rate:
+        t = np.arange(word) / sample_rate
+        # Pitch glides up and down across the word
+        f0 = pitch_hz * 2 ** (glide_st / 12 * np.sin(np.pi * t / t[-1]))
+        phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+        voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+        # Loud syllable nuclei with quieter (not silent) transitions between them
+        envelope = 0.25 + 0.75 * np.sin(np.pi * (np.arange(word) % syllable) / syllable) ** 2
+        pieces.append(0.2 * voice * envelope)
+        pieces.append(np.zeros(gap))
+        spoken += word
+        paused += gap
+    samples = np.concatenate(pieces[:-1])  # no pause after the last word
+    samples += rng.normal(0, 1e-4, samples.shape[0])
+    pause_ratio = (paused - gap) / samples.shape[0]
+    return AudioBuffer.from_float(samples, sample_rate), pause_ratio
+
+
+def check(sample_rate: int) -> list:
+    """Return a list of failures for one sample rate."""
+    audio, pause_ratio = synthetic_utterance(6.0, sample_rate)
+    features = extract_prosody(audio)
+    print(f"    {sample_rate} Hz: {features._asdict()}")
+    failures = []
+    # The glide spends most of each word near its top: median about +1.4 st, spread about 0.6 st
+    if abs(features.pitch_hz - 152.0) > 6.0:
+        failures.append(f"pitch {features.pitch_hz} Hz, expected about 152")
+    if not 0.3 < features.pitch_range_st < 1.2:
+        failures.append(f"pitch range {features.pitch_range_st} st, expected about 0.6")
+    if abs(features.speaking_rate - 5.0) > 1.0:
+        failures.append(f"speaking rate {features.speaking_rate}/s, expected 5")
+    if abs(features.pause_ratio - pause_ratio) > 0.05:
+        failures.append(f"pause ratio {features.pause_ratio}, expected {pause_ratio:.3f}")
+    return failures
+
+
+def ms_per_audio_second(audio: AudioBuffer, repeats: int = 5) -> float:
+    extract_prosody(audio)  # window and FFT setup
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        extract_prosody(audio)
+        times.append(time.perf_counter() - started)
+    return 1000 * statistics.median(times) / audio.duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wavs", nargs="*", help="recordings to analyse and time")
+    parser.add_argument("--lengths", default="2,5,10,30", help="utterance lengths to time, seconds")
+    args = parser.parse_args()
+
+    print("features of the synthetic utterance (140 Hz gliding up 2 st, 5 syllables/s):")
+    failed = False
+    for sample_rate in RATES:
+        failures = check(sample_rate)
+        if failures:
+            print("    FAIL: " + "; ".join(failures))
+            failed = True
+
+    print("cost:")
+    for sample_rate in RATES:
+        for seconds in (float(length) for length in args.lengths.split(",") if length.strip()):
+            audio, _ = synthetic_utterance(seconds, sample_rate)
+            print(f"    {sample_rate:>6} Hz {seconds:5.1f}s: {ms_per_audio_second(audio):6.2f} ms per second of audio")
+
+    for path in args.wavs:
+        audio = AudioBuffer.from_wav_bytes(load_pcm16_wav(path))
+        features = extract_prosody(audio)
+        print(f"{path}: {ms_per_audio_second(audio):.2f} ms/s  {features._asdict() if features else None}  "
+              f"-> {prosody_emotions(features)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
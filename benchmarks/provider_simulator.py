@@ -0,0 +1,251 @@
+"""Local stand-ins for the Whisper, GPT and Claude APIs, and for the local models.
+
+The simulated clients expose the same call shapes the services use
+(``openai.ChatCompletion.create``, ``openai.Audio.transcribe`` and
+``anthropic.Anthropic().messages.with_raw_response.create``). That lets
+``GPTService`` and ``OpenAIWhisperEngine`` run unchanged, including their
+client-side rate limiters and retry logic.
+
+Each provider has a latency distribution, an error rate and its own
+server-side rate limit that answers with 429 and Retry-After. An outage
+window makes every request in it hang and then fail, like a provider
+that has stopped answering.
+"""
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+import numpy as np
+
+from utils.audio_buffer import AudioBuffer
+from utils.rate_limiter import TokenBucket
+from utils.text_utils import estimate_tokens
+
+REPLIES = [
+    "أتفهم تمامًا ما تشعر به يا أخي الكريم. هل تود أن تخبرني أكثر عن الموقف الذي أزعجك؟",
+    "الحمد لله على كل حال، وما تمر به شعور طبيعي. لنفكر سوياً في خطوة صغيرة تريحك اليوم.",
+    "أشكرك على ثقتك ومشاركتك. ما الذي يساعدك عادة على الهدوء في مثل هذه الأوقات؟",
+    # Longer than the prompt asks for, as real replies sometimes are
+    "أسمعك يا أخي، وأقدّر صراحتك. الضغط الذي تصفه ثقيل، ومن الطبيعي أن تشعر بالتعب. "
+    "حاول أن تخصص وقتاً قصيراً كل يوم لنفسك ولأهلك. وتذكر أن بعد العسر يسراً بإذن الله. "
+    "هل هناك شخص قريب تثق به وتستطيع أن تحدثه عن هذا؟",
+]
+
+
+@dataclass
+class ProviderProfile:
+    """Behaviour of one simulated provider."""
+
+    latency: float  # median seconds per request
+    jitter: float = 0.3  # log-normal sigma of the latency
+    error_rate: float = 0.0  # fraction of requests failing with a 500
+    requests_per_second: float = 0.0  # provider-side limit; 0 disables it
+    outage_start: float = 0.0  # seconds after the provider is created
+    outage_seconds: float = 0.0  # 0: no outage
+    outage_hang: float = 0.0  # seconds a request hangs before failing during the outage
+
+
+class SimulatedAPIError(Exception):
+    def __init__(self, message: str, http_status: int, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.http_status = http_status
+        self.headers = headers or {}
+
+
+class _Record(dict):
+    """Dict with attribute access, like the objects openai 0.28 returns."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class SimulatedProvider:
+    """Latency, failures and a server-side rate limit for one provider."""
+
+    def __init__(self, name: str, profile: ProviderProfile, seed: Optional[int] = None):
+        self.name = name
+        self.profile = profile
+        self.random = random.Random(seed)
+        self.bucket = None
+        if profile.requests_per_second:
+            self.bucket = TokenBucket(profile.requests_per_second, max(1.0, profile.requests_per_second))
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def in_outage(self) -> bool:
+        elapsed = time.monotonic() - self.started
+        return self.profile.outage_start <= elapsed < self.profile.outage_start + self.profile.outage_seconds
+
+    def handle(self):
+        """Admit or reject one request, then spend its latency."""
+        with self.lock:
+            self.requests += 1
+            now = time.monotonic()
+            if self.bucket is not None:
+                wait = self.bucket.time_until(1, now)
+                if wait > 0:
+                    self.throttled += 1
+                    raise SimulatedAPIError(f"{self.name}: rate limit exceeded", 429,
+                                            {"retry-after": f"{wait:.3f}"})
+                self.bucket.consume(1, now)
+            if self.in_outage():
+                self.errors += 1
+                down = True
+            else:
+                down = False
+                failed = self.random.random() < self.profile.error_rate
+                latency = self.profile.latency * self.random.lognormvariate(0.0, self.profile.jitter)
+        if down:
+            time.sleep(self.profile.outage_hang)
+            raise SimulatedAPIError(f"{self.name}: simulated outage, request timed out", 504)
+        time.sleep(latency)
+        if failed:
+            with self.lock:
+                self.errors += 1
+            raise SimulatedAPIError(f"{self.name}: simulated server error", 500)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"requests": self.requests, "errors": self.errors, "throttled": self.throttled}
+
+
+class TranscriptRegistry:
+    """What the simulated Whisper should "hear" for each scripted utterance.
+
+    Utterances are identified by their length in samples at the STT rate,
+    which survives the WAV and resampling round trips unchanged.
+    """
+
+    def __init__(self, stt_sample_rate: int):
+        self.stt_sample_rate = stt_sample_rate
+        self.transcripts: Dict[int, str] = {}
+        self.lock = threading.Lock()
+
+    def key(self, audio: AudioBuffer) -> int:
+        return len(audio.resample(self.stt_sample_rate))
+
+    def register(self, audio: AudioBuffer, text: str):
+        with self.lock:
+            self.transcripts[self.key(audio)] = text
+
+    def lookup(self, audio: AudioBuffer) -> str:
+        with self.lock:
+            return self.transcripts.get(self.key(audio), "")
+
+    def synthesize(self, text: str, sample_rate: int) -> AudioBuffer:
+        """Tone of speech-like length for a pre-transcribed line, with a unique length."""
+        with self.lock:
+            seconds = 0.8 + 0.06 * len(text)
+            samples = int(seconds * sample_rate)
+            while True:
+                audio = AudioBuffer.from_float(
+                    0.2 * np.sin(np.arange(samples, dtype=np.float32) * (2 * np.pi * 180 / sample_rate)),
+                    sample_rate)
+                key = len(audio.resample(self.stt_sample_rate))
+                if key not in self.transcripts:
+                    self.transcripts[key] = text
+                    return audio
+                samples += sample_rate // 100
+
+
+class SimulatedOpenAI:
+    """Drop-in for the ``openai`` module (0.28 API) used by the services."""
+
+    def __init__(self, chat: SimulatedProvider, whisper: SimulatedProvider, transcripts: TranscriptRegistry):
+        self.api_key = None
+        self.chat_provider = chat
+        self.whisper_provider = whisper
+        self.transcripts = transcripts
+        self.ChatCompletion = SimpleNamespace(create=self._chat_completion)
+        self.Audio = SimpleNamespace(transcribe=self._transcribe)
+
+    def _chat_completion(self, model: str, messages: list, max_tokens: int = 300, stream: bool = False, **kwargs):
+        self.chat_provider.handle()
+        reply = self.chat_provider.random.choice(REPLIES)
+        if stream:
+            return self._stream(reply)
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        return _Record(
+            choices=[_Record(message=_Record(role="assistant", content=reply))],
+            usage=_Record(prompt_tokens=prompt_tokens,
+                          completion_tokens=estimate_tokens(reply),
+                          total_tokens=prompt_tokens + estimate_tokens(reply)),
+        )
+
+    def _stream(self, reply: str):
+        """Word-by-word chunks, paced like generation (~30 ms per token)."""
+        for word in reply.split(" "):
+            time.sleep(0.03 * estimate_tokens(word))
+            yield _Record(choices=[_Record(delta=_Record(content=word + " "))])
+
+    def _transcribe(self, model: str, file, language: Optional[str] = None, **kwargs):
+        self.whisper_provider.handle()
+        return _Record(text=self.transcripts.lookup(AudioBuffer.from_wav_bytes(file.read())))
+
+
+class SimulatedAnthropic:
+    """Drop-in for ``anthropic.Anthropic()`` covering ``messages.with_raw_response.create``."""
+
+    def __init__(self, provider: SimulatedProvider, approve_rate: float = 0.9):
+        self.provider = provider
+        self.approve_rate = approve_rate
+        self.messages = SimpleNamespace(with_raw_response=SimpleNamespace(create=self._create))
+
+    def _create(self, model: str, max_tokens: int, messages: list, **kwargs):
+        self.provider.handle()
+        prompt = messages[-1]["content"]
+        if "validating" in prompt and self.provider.random.random() < self.approve_rate:
+            text = "APPROVED"
+        else:
+            text = self.provider.random.choice(REPLIES)
+        response = SimpleNamespace(
+            content=[SimpleNamespace(text=text)],
+            usage=SimpleNamespace(input_tokens=estimate_tokens(prompt), output_tokens=estimate_tokens(text)),
+        )
+        return SimpleNamespace(headers={}, parse=lambda: response)
+
+
+class SimulatedEmotionService:
+    """Stands in for the local emotion model with a fixed CPU cost."""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+
+    def detect_emotion(self, text: str, cancel_token=None) -> Dict[str, float]:
+        time.sleep(self.latency)
+        return {"negative": 0.2, "neutral": 0.6, "positive": 0.2}
+
+
+class SimulatedTTSService:
+    """Stands in for XTTS: silence of speech-like length after ``real_time_factor`` x its duration."""
+
+    sample_rate = 24000
+
+    def __init__(self, real_time_factor: float = 0.3, seconds_per_char: float = 0.07):
+        self.real_time_factor = real_time_factor
+        self.seconds_per_char = seconds_per_char
+
+    def synthesize_speech(self, text: str, cancel_token=None, on_segment=None,
+                          cached_only: bool = False, cached_filler: Optional[str] = None) -> Optional[AudioBuffer]:
+        if cached_only:
+            # No reply is cached; only the (precached) filler is voiced, at no synthesis cost
+            if not cached_filler:
+                return None
+            text = cached_filler
+        duration = len(text) * self.seconds_per_char
+        if not cached_only:
+            time.sleep(duration * self.real_time_factor)
+        audio = AudioBuffer(np.zeros(int(duration * self.sample_rate), dtype=np.float32), self.sample_rate)
+        if on_segment:
+            on_segment(audio)
+        return audio
@@ -0,0 +1,168 @@
+"""Re-run recorded conversations offline against the current pipeline.
+
+Each cassette (recorded with ``CASSETTE_MODE=record``, see
+utils/cassette.py) is one session. Its turns are fed through a
+SessionManager in order, with the user's recorded audio as input and the
+recorded Whisper, GPT and Claude responses played back in place of the
+live APIs. Emotions are the recorded ones unless ``--local-models``
+runs the emotion model (and XTTS instead of a fixed-cost stand-in).
+
+``--match exact`` only answers requests identical to recorded ones, so it
+reproduces the recorded turns and fails where the pipeline now asks
+something different. It needs the cassette to start at the session's
+first turn, since earlier history is not recorded. ``--match order``
+answers each endpoint's requests in recorded order whatever they contain,
+for comparing a changed pipeline against the same conversation.
+``--timing`` waits out the recorded provider latencies, so turn latencies
+are comparable with the recorded ones; without it the run is as fast as
+the pipeline allows and the client rate limits are lifted.
+
+Reported per turn: whether the reply matches the recorded one, the
+replayed and recorded latency, and requests that missed or differed.
+
+Usage:
+    python -m benchmarks.replay_cassette data/cassettes/<session>.jsonl.gz
+    python -m benchmarks.replay_cassette data/cassettes/*.jsonl.gz --match order --timing --output reports/replay.json
+"""
+
+import argparse
+import base64
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.load_test import git_revision
+from benchmarks.provider_simulator import SimulatedTTSService
+from config import CONFIG
+from services.gpt_service import GPTService
+from services.session_manager import SessionManager
+from services.stt_engines import OpenAIWhisperEngine
+from services.stt_service import STTService
+from services.turn_record import Turn
+from utils.cassette import TURN, Cassette, CassettePlayer, ReplayAnthropic, ReplayOpenAI
+from utils.circuit_breaker import reset_circuit_breakers
+from utils.rate_limiter import reset_rate_limiters
+
+
+class RecordedEmotionService:
+    """Returns the emotions recorded for each turn, in order."""
+
+    def __init__(self, emotions: List[Optional[Dict[str, float]]]):
+        self._emotions = list(emotions)
+
+    def detect_emotion(self, text: str, cancel_token=None) -> Optional[Dict[str, float]]:
+        return self._emotions.pop(0) if self._emotions else None
+
+
+def build_manager(cassette: Cassette, turns: List[dict], args) -> Tuple[SessionManager, CassettePlayer]:
+    """A SessionManager whose providers answer from ``cassette``."""
+    reset_rate_limiters()
+    reset_circuit_breakers()
+    player = CassettePlayer(cassette, match=args.match, timing=args.timing)
+    openai_replay = ReplayOpenAI(player)
+    if args.local_models:
+        from services.emotion_service import EmotionService
+        from services.tts_service import TTSService
+        emotion_service, tts_service = EmotionService(), TTSService()
+    else:
+        emotion_service = RecordedEmotionService([turn.get("emotions") for turn in turns])
+        tts_service = SimulatedTTSService(real_time_factor=0.0)
+    manager = SessionManager(
+        stt_service=STTService([OpenAIWhisperEngine(openai_replay)]),
+        emotion_service=emotion_service,
+        gpt_service=GPTService(openai_module=openai_replay, anthropic_client=ReplayAnthropic(player)),
+        tts_service=tts_service,
+    )
+    return manager, player
+
+
+def replay_session(path: str, args) -> dict:
+    cassette = Cassette.load(path)
+    turns = [entry for entry in cassette.interactions if entry["kind"] == TURN]
+    manager, player = build_manager(cassette, turns, args)
+
+    history: List[Turn] = []
+    results = []
+    for index, turn in enumerate(turns):
+        served, mismatched = player.served, player.mismatched
+        started = time.perf_counter()
+        result = manager.process_voice_input(base64.b64decode(turn["audio"]),
+                                             history[-CONFIG.session_history_window:])
+        latency = time.perf_counter() - started
+        if result["success"]:
+            history.append(Turn(result["transcription"], result["response_text"], result["emotions"]))
+        results.append({
+            "turn": index,
+            "success": result["success"],
+            "error": result["error"],
+            "same_transcription": result["transcription"] == turn["transcription"],
+            "same_response": result["response_text"] == turn["response_text"],
+            "response": result["response_text"],
+            "recorded_response": turn["response_text"],
+            "latency_s": round(latency, 3),
+            "recorded_latency_s": turn["processing_time"],
+            "requests": player.served - served,
+            "mismatched_requests": player.mismatched - mismatched,
+        })
+
+    return {
+        "cassette": path,
+        "turns": results,
+        "same_responses": sum(1 for result in results if result["same_response"]),
+        "failed": sum(1 for result in results if not result["success"]),
+        "requests_served": player.served,
+        "requests_mismatched": player.mismatched,
+        "requests_unused": player.remaining,
+    }
+
+
+def print_session(session: dict):
+    print(f"{session['cassette']}: {session['same_responses']}/{len(session['turns'])} replies as recorded, "
+          f"{session['failed']} failed, requests served={session['requests_served']} "
+          f"differing={session['requests_mismatched']} unused={session['requests_unused']}")
+    for turn in session["turns"]:
+        status = "same" if turn["same_response"] else ("FAILED" if not turn["success"] else "changed")
+        print(f"    turn {turn['turn']:>2} {status:<7} {turn['latency_s']:6.2f}s "
+              f"(recorded {turn['recorded_latency_s']:6.2f}s)  requests={turn['requests']} "
+              f"differing={turn['mismatched_requests']}")
+        if not turn["success"]:
+            print(f"        error: {turn['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cassettes", nargs="+", help="cassette files (.jsonl.gz)")
+    parser.add_argument("--match", choices=("exact", "order"), default="exact")
+    parser.add_argument("--timing", action="store_true", help="reproduce the recorded provider latencies")
+    parser.add_argument("--local-models", action="store_true", help="run the emotion model and XTTS")
+    parser.add_argument("--output", default="", help="write the JSON report here")
+    args = parser.parse_args()
+
+    # Replayed calls are not sent anywhere, so only recorded timing should slow them down
+    CONFIG.cassette_mode = "off"
+    if not args.local_models:
+        CONFIG.prosody_enabled = False  # the recorded emotions already include the voice cues
+    if not args.timing:
+        for limits in CONFIG.rate_limits.values():
+            limits.update(requests_per_second=1000.0, tokens_per_minute=0)
+
+    report = {
+        "revision": git_revision(),
+        "settings": {"match": args.match, "timing": args.timing, "local_models": args.local_models},
+        "sessions": [],
+    }
+    for path in args.cassettes:
+        session = replay_session(path, args)
+        print_session(session)
+        report["sessions"].append(session)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, ensure_ascii=False, indent=2)
+        print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Check and time the polyphase resampler on the pipeline's rate conversions.
+
+For each conversion a pure tone is resampled and compared with the same
+tone generated directly at the target rate (frequency, level and maximum
+sample error away from the edges). A tone above the target Nyquist
+frequency must be filtered out rather than aliased. Throughput is
+reported as seconds of audio converted per second.
+
+Usage:
+    python -m benchmarks.resample_benchmark --seconds 30
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from utils.resample import resample
+
+# capture -> STT, XTTS -> common device rates, and back
+CONVERSIONS = [
+    (22050, 16000),
+    (44100, 16000),
+    (48000, 16000),
+    (24000, 48000),
+    (24000, 44100),
+    (24000, 22050),
+]
+
+MAX_ERROR = 1e-3
+MAX_ALIAS_RMS = 1e-3
+
+
+def tone(frequency: float, sample_rate: int, seconds: float) -> np.ndarray:
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    return (0.5 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def dominant_frequency(samples: np.ndarray, sample_rate: int) -> float:
+    spectrum = np.abs(np.fft.rfft(samples * np.hanning(samples.shape[0])))
+    return float(np.argmax(spectrum)) * sample_rate / samples.shape[0]
+
+
+def check(from_rate: int, to_rate: int) -> list:
+    """Return a list of failures for one conversion."""
+    failures = []
+    resampled = resample(tone(1000, from_rate, 1.0), from_rate, to_rate)
+    if resampled.shape[0] != to_rate:
+        failures.append(f"length {resampled.shape[0]} != {to_rate}")
+
+    expected = tone(1000, to_rate, 1.0)
+    middle = slice(to_rate // 10, -to_rate // 10)
+    error = float(np.max(np.abs(resampled[middle] - expected[middle])))
+    if error > MAX_ERROR:
+        failures.append(f"max sample error {error:.2e}")
+    frequency = dominant_frequency(resampled, to_rate)
+    if abs(frequency - 1000) > 2:
+        failures.append(f"1 kHz tone came out at {frequency:.1f} Hz")
+
+    # A tone in the stopband: above the filter's transition band, below the source Nyquist
+    stopband = 1.2 * to_rate / 2
+    if stopband < 0.95 * from_rate / 2:
+        above = resample(tone(stopband, from_rate, 1.0), from_rate, to_rate)
+        alias = float(np.sqrt(np.mean(above[middle] ** 2)))
+        if alias > MAX_ALIAS_RMS:
+            failures.append(f"tone above Nyquist leaked through at RMS {alias:.2e}")
+    return failures
+
+
+def throughput(from_rate: int, to_rate: int, seconds: float, repeats: int = 3) -> float:
+    noise = np.random.default_rng(0).uniform(-0.5, 0.5, int(from_rate * seconds)).astype(np.float32)
+    resample(noise[:from_rate], from_rate, to_rate)  # build and cache the filter
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        resample(noise, from_rate, to_rate)
+        best = min(best, time.perf_counter() - started)
+    return seconds / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=30.0, help="length of audio timed per conversion")
+    args = parser.parse_args()
+
+    failed = False
+    for from_rate, to_rate in CONVERSIONS:
+        failures = check(from_rate, to_rate)
+        speed = throughput(from_rate, to_rate, args.seconds)
+        status = "ok" if not failures else "FAIL: " + "; ".join(failures)
+        print(f"{from_rate:>6} -> {to_rate:>6} Hz: {speed:>8.0f}x real time  {status}")
+        failed = failed or bool(failures)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
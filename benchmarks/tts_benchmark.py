@@ -0,0 +1,132 @@
+"""Wall time of segmented, pipelined TTS against one XTTS call per reply.
+
+For each reply, the whole text is synthesized once in a single model call,
+then through ``TTSService.synthesize_speech`` (segments synthesized in
+parallel on ``CONFIG.tts_workers`` threads, each on its own model
+instance, joined with crossfades). Reported per
+reply: segment count, both wall times, the speed-up, and how soon the
+first segment was ready for playback.
+
+``--simulate`` replaces XTTS with a CPU-bound stand-in whose cost grows
+with text length plus a fixed per-call overhead. That measures the
+planner and joiner without the model; the numbers that matter come from
+a run against the real model.
+
+Usage:
+    python -m benchmarks.tts_benchmark --repeats 3
+    python -m benchmarks.tts_benchmark --simulate --workers 4
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from benchmarks.provider_simulator import REPLIES
+from config import CONFIG
+from services.tts_service import TTSService
+from utils.speech_segments import plan_segments
+
+# Typical replies are one or two sentences; the last ones are the long tail
+TEXTS = REPLIES + [
+    "أتفهم شعورك الشديد بالغضب، ومن الطبيعي أن نشعر بذلك أحياناً عندما نتعرض لمواقف مزعجة. "
+    "هل يمكن أن تصف لي الموقف وما الذي أثار غضبك تحديداً؟ لعلنا نجد طريقة للتعبير عن هذه المشاعر "
+    "بشكل بناء ومهذب، يحافظ على كرامتك وعلاقاتك المهنية.",
+]
+
+
+class _StandInModel:
+    """Matrix work per character, which releases the GIL like torch; refuses overlapping calls like XTTS."""
+
+    def __init__(self):
+        self.matrix = np.random.default_rng(0).standard_normal((256, 256)).astype(np.float32)
+        self.busy = False
+        started = time.perf_counter()
+        for _ in range(50):
+            self.matrix @ self.matrix
+        self.unit = (time.perf_counter() - started) / 50
+
+    def run(self, seconds: float):
+        if self.busy:
+            raise RuntimeError("two inferences on one model instance")
+        self.busy = True
+        try:
+            for _ in range(max(1, int(seconds / self.unit))):
+                self.matrix @ self.matrix
+        finally:
+            self.busy = False
+
+
+class SimulatedXTTS(TTSService):
+    """TTSService with a stand-in model, checked out of the same per-instance pool as XTTS."""
+
+    def __init__(self, seconds_per_char: float = 0.01, call_overhead: float = 0.15):
+        self.seconds_per_char = seconds_per_char
+        self.call_overhead = call_overhead
+        self.voice_file = __file__  # only has to exist
+        self.tts = _StandInModel()
+        self._loaded = False  # more instances are deep copies
+
+    @property
+    def output_sample_rate(self) -> int:
+        return 24000
+
+    def _synthesize_chunk(self, text: str) -> np.ndarray:
+        with self._models().checkout() as model:
+            model.run(self.call_overhead + len(text) * self.seconds_per_char)
+        t = np.arange(int(len(text) * 0.07 * self.output_sample_rate)) / self.output_sample_rate
+        return (0.1 * np.sin(2 * np.pi * 180 * t)).astype(np.float32)
+
+
+def time_reply(service: TTSService, text: str, repeats: int) -> dict:
+    single, planned, first = [], [], []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        service._synthesize_chunk(text)
+        single.append(time.perf_counter() - started)
+
+        first_ready = []
+        started = time.perf_counter()
+        audio = service.synthesize_speech(
+            text, on_segment=lambda _: first_ready or first_ready.append(time.perf_counter() - started))
+        planned.append(time.perf_counter() - started)
+        first.append(first_ready[0] if first_ready else planned[-1])
+    return {
+        "chars": len(text),
+        "segments": len(plan_segments(text)),
+        "audio_s": audio.duration if audio is not None else 0.0,
+        "single_s": statistics.median(single),
+        "planned_s": statistics.median(planned),
+        "first_segment_s": statistics.median(first),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--simulate", action="store_true", help="use the CPU-bound stand-in instead of XTTS")
+    parser.add_argument("--workers", type=int, default=0, help="override CONFIG.tts_workers")
+    args = parser.parse_args()
+
+    CONFIG.tts_cache_segments = 0  # every repeat has to synthesize
+    if args.workers:
+        import services.tts_service as tts_module
+        from concurrent.futures import ThreadPoolExecutor
+        CONFIG.tts_workers = args.workers
+        tts_module._synthesis_pool = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="tts")
+
+    service = SimulatedXTTS() if args.simulate else TTSService()
+    service._models().fill()
+    service.synthesize_speech(TEXTS[0])  # load lazily-initialized state before timing
+
+    print(f"workers={CONFIG.tts_workers}  {'simulated' if args.simulate else CONFIG.tts_model_name}")
+    for text in TEXTS:
+        result = time_reply(service, text, args.repeats)
+        print(f"{result['chars']:>4} chars {result['segments']} seg  audio {result['audio_s']:5.1f}s  "
+              f"single {result['single_s']:6.2f}s  planned {result['planned_s']:6.2f}s "
+              f"(x{result['single_s'] / result['planned_s']:.2f})  first segment {result['first_segment_s']:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
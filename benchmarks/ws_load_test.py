@@ -0,0 +1,97 @@
+"""Scripted WebSocket client that load-tests a running server.py.
+
+Usage:
+    python -m benchmarks.ws_load_test --url ws://localhost:8765/ws --sessions 20 --turns 3
+"""
+
+import argparse
+import io
+import statistics
+import threading
+import time
+import wave
+
+import numpy as np
+import soundfile as sf
+
+from utils.pipeline_client import RemoteSessionManager
+
+
+def load_pcm16_wav(path: str) -> bytes:
+    """Read any WAV file and re-encode it as the 16-bit mono WAV the recorder produces."""
+    samples, sample_rate = sf.read(path, dtype="float32", always_2d=True)
+    pcm = (np.clip(samples.mean(axis=1), -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def run_session(url: str, audio_bytes: bytes, turns: int, latencies: list, first_events: list, errors: list):
+    client = RemoteSessionManager(url)
+    try:
+        for _ in range(turns):
+            start = time.perf_counter()
+            first = []
+
+            def on_event(event, payload):
+                if not first:
+                    first.append(time.perf_counter() - start)
+
+            result = client.process_voice_input(audio_bytes, on_event=on_event)
+            if result["success"]:
+                latencies.append(time.perf_counter() - start)
+                first_events.extend(first)
+            else:
+                errors.append(result["error"])
+    finally:
+        client.close()
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="ws://localhost:8765/ws")
+    parser.add_argument("--audio", default="user_input.wav")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=2)
+    args = parser.parse_args()
+
+    audio_bytes = load_pcm16_wav(args.audio)
+    latencies, first_events, errors = [], [], []
+    threads = [
+        threading.Thread(target=run_session,
+                         args=(args.url, audio_bytes, args.turns, latencies, first_events, errors))
+        for _ in range(args.sessions)
+    ]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"sessions={args.sessions} turns/session={args.turns} wall={elapsed:.1f}s")
+    print(f"completed={len(latencies)} failed={len(errors)} throughput={len(latencies) / elapsed:.2f} turns/s")
+    if latencies:
+        print(f"turn latency  p50={percentile(latencies, 0.5):.2f}s "
+              f"p90={percentile(latencies, 0.9):.2f}s p99={percentile(latencies, 0.99):.2f}s "
+              f"mean={statistics.mean(latencies):.2f}s")
+    if first_events:
+        print(f"first event   p50={percentile(first_events, 0.5):.2f}s p90={percentile(first_events, 0.9):.2f}s")
+    for error in sorted(set(errors))[:5]:
+        print(f"error: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Real-time factor of XTTS on the CPU under each CPU profile setting.
+
+Each profile loads a fresh copy of the model on the CPU with the given
+thread counts, int8 quantization of the GPT, vocoder compilation and
+inference mode, then synthesizes typical replies one call each. The
+real-time factor (RTF) is synthesis time divided by the duration of the
+audio produced, so below 1.0 is faster than real time.
+
+Profiles run in the order listed. Intra-op threads stay as the last
+profile set them, so the baseline runs first. Inter-op threads can only
+be set once per process: ``--interop-threads`` applies to the whole run,
+so compare values with one profile per process.
+
+Usage:
+    python -m benchmarks.xtts_cpu_benchmark --threads 8 --repeats 3
+    python -m benchmarks.xtts_cpu_benchmark --profiles baseline,int8 --output reports/xtts_cpu.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+import torch
+
+from benchmarks.tts_benchmark import TEXTS
+from config import CONFIG
+from services.tts_service import CPUProfile, TTSService, build_tts_model
+
+
+def profiles(threads: int, interop: int) -> dict:
+    return {
+        "baseline": CPUProfile(inference_mode=False),
+        "threads": CPUProfile(threads, interop, inference_mode=False),
+        "inference_mode": CPUProfile(threads, interop, inference_mode=True),
+        "int8": CPUProfile(threads, interop, quantize=True),
+        "int8+compile": CPUProfile(threads, interop, quantize=True, compile="compile"),
+        "int8+script": CPUProfile(threads, interop, quantize=True, compile="script"),
+    }
+
+
+def run_profile(name: str, profile: CPUProfile, repeats: int) -> dict:
+    started = time.perf_counter()
+    model = build_tts_model(CONFIG.tts_model_name, "cpu", profile)
+    load_seconds = time.perf_counter() - started
+    service = TTSService(tts_model=model, cpu_profile=profile)
+    service._synthesize_chunk(TEXTS[0])  # conditioning latents, compilation
+
+    synth_seconds = audio_seconds = 0.0
+    rtfs = []
+    for text in TEXTS:
+        times = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            wav = service._synthesize_chunk(text)
+            times.append(time.perf_counter() - started)
+        duration = wav.shape[0] / service.output_sample_rate
+        rtfs.append(statistics.median(times) / duration)
+        synth_seconds += statistics.median(times)
+        audio_seconds += duration
+    return {
+        "profile": name,
+        "settings": profile._asdict(),
+        "torch_threads": torch.get_num_threads(),
+        "load_s": round(load_seconds, 1),
+        "rtf": round(synth_seconds / audio_seconds, 3),
+        "rtf_per_reply": [round(rtf, 3) for rtf in rtfs],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", default="", help="comma-separated subset (default: all)")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="intra-op threads to tune to")
+    parser.add_argument("--interop-threads", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default="", help="write the JSON report here")
+    args = parser.parse_args()
+
+    available = profiles(args.threads, args.interop_threads)
+    names = [name.strip() for name in args.profiles.split(",") if name.strip()] or list(available)
+
+    results = []
+    for name in names:
+        result = run_profile(name, available[name], args.repeats)
+        results.append(result)
+        print(f"{name:<15} RTF {result['rtf']:.3f}  (per reply {result['rtf_per_reply']}, "
+              f"{result['torch_threads']} threads, load {result['load_s']}s)")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as report_file:
+            json.dump({"model": CONFIG.tts_model_name, "results": results}, report_file, indent=2)
+        print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
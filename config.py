@@ -15,7 +15,19 @@ class ModelConfig:
     # OpenAI Configuration
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
     whisper_model: str = "whisper-1"  # OpenAI Whisper API
+    
+    # Speech-to-Text Engines, tried in this order ("openai", "local", "static")
+    stt_engines: list = None
+    local_whisper_model: str = os.getenv("LOCAL_WHISPER_MODEL", "openai/whisper-small")
+    local_stt_quantize: bool = True  # int8 dynamic quantization of the Linear layers
+    local_stt_threads: int = 0  # torch CPU threads; 0 keeps torch's default
+    local_stt_batch_size: int = 4  # utterances from different sessions decoded together
+    local_stt_batch_wait_ms: int = 30  # how long a request waits for batch companions
     gpt_model: str = "gpt-4o"
+    # Reply budget, matching what the prompt asks for; 0 disables a limit. GPT replies
+    # are streamed and the request is stopped once the budget is met.
+    response_max_sentences: int = 2
+    response_max_chars: int = 400
     
     # Anthropic Configuration
     anthropic_api_key: str = os.getenv("ANTHROPIC_API_KEY", "")
@@ -23,9 +35,25 @@ class ModelConfig:
     claude_model: str = "claude-opus-4-20250514"
     
     # Audio Configuration
-    sample_rate: int = 22050
+    # Every buffer carries its own rate; audio is resampled at stage boundaries
+    sample_rate: int = 22050  # microphone capture rate
+    stt_sample_rate: int = 16000  # Whisper's native rate; audio is uploaded at this rate
+    playback_sample_rate: int = 0  # 0 uses the output device's default rate
     audio_format: str = "wav"
     max_recording_duration: int = 30  # seconds
+    audio_frame_ms: int = 20
+    vad_end_silence_ms: int = 1500  # trailing silence that ends a user turn
+    vad_threshold: float = 300.0  # int16 RMS a frame needs to count as speech
+    vad_pre_roll_ms: int = 300  # audio kept from before the detected speech onset
+    capture_buffer_seconds: int = 60  # ring buffer of the always-on capture engine
+    capture_read_timeout: float = 2.0  # seconds without samples before capture counts as stalled
+    
+    # Barge-in Configuration (interrupting playback by speaking)
+    barge_in_enabled: bool = True
+    barge_in_threshold: float = 500.0  # int16 RMS a mic frame needs to count as speech
+    barge_in_echo_gain: float = 0.6  # expected mic level relative to playback level
+    barge_in_min_speech_ms: int = 120
+    barge_in_pre_roll_ms: int = 200  # speech onset kept from before detection
     
     # Performance Configuration
     max_response_time: int = 20  # seconds
@@ -34,20 +62,159 @@ class ModelConfig:
     # Emotion Model Configuration
     emotion_model_name: str = "CAMeL-Lab/bert-base-arabic-camelbert-mix-sentiment"
     emotion_threshold: float = 0.7
+    emotion_batch_size: int = 32  # texts per forward pass in EmotionService.detect_emotions
+    # Voice cues (utils/prosody.py), extracted while the audio is transcribed
+    prosody_enabled: bool = True
+    prosody_weight: float = 0.25  # share of the fused emotion distribution taken from the voice
     
     # TTS Configuration
     tts_model_name: str = "tts_models/multilingual/multi-dataset/xtts_v2"
+    tts_device: str = os.getenv("TTS_DEVICE", "auto")  # "auto", "cuda" or "cpu"
+    # CPU profile, applied when XTTS runs on the CPU; compare settings with
+    # benchmarks/xtts_cpu_benchmark.py
+    tts_cpu_threads: int = int(os.getenv("TTS_CPU_THREADS", "0"))  # intra-op; 0 keeps torch's default
+    tts_cpu_interop_threads: int = int(os.getenv("TTS_CPU_INTEROP_THREADS", "0"))
+    tts_cpu_quantize: bool = os.getenv("TTS_CPU_QUANTIZE", "0") == "1"  # int8 dynamic quantization of the GPT
+    tts_cpu_compile: str = os.getenv("TTS_CPU_COMPILE", "none")  # vocoder: "none", "compile" or "script"
+    tts_inference_mode: bool = True
+    tts_workers: int = 2  # segments synthesized at once, each on its own model instance (memory per instance)
+    tts_max_segment_chars: int = 160  # longer sentences are split at phrase breaks
+    tts_min_segment_chars: int = 20  # shorter segments are merged into a neighbour
+    tts_crossfade_ms: int = 30
+    tts_target_dbfs: float = -20.0  # speech RMS each segment is brought towards
+    tts_max_gain_db: float = 6.0
+    tts_cache_segments: int = 32  # recently synthesized segments kept for reuse (~0.5 MB each)
     voice_file_path: str = "data/voices/audio.wav"
     
+    # Backend Server Configuration
+    server_host: str = os.getenv("THERAPIST_SERVER_HOST", "0.0.0.0")
+    server_port: int = int(os.getenv("THERAPIST_SERVER_PORT", "8765"))
+    server_max_workers: int = 8  # pipeline turns running at once per process
+    server_audio_chunk_ms: int = 100
+    # WebSocket URL of a running server.py (e.g. ws://localhost:8765/ws);
+    # empty runs the pipeline inside the Streamlit process
+    backend_url: str = os.getenv("THERAPIST_BACKEND_URL", "")
+
+    # Session Storage Configuration
+    session_store_backend: str = os.getenv("SESSION_STORE_BACKEND", "sqlite")  # "sqlite" or "memory"
+    session_db_path: str = os.getenv("SESSION_DB_PATH", "data/sessions.db")
+    session_ttl_seconds: int = 7 * 24 * 3600
+    session_max_cached: int = 1000  # sessions whose recent turns stay in memory
+    session_history_window: int = 10  # turns sent to the model as context
+
+    # Chat View Configuration
+    chat_window_turns: int = 20  # turns rendered before "show earlier" is needed
+    chat_page_turns: int = 20  # older turns loaded per "show earlier" click
+    
     # Therapeutic Configuration
     crisis_keywords: list = None
-    
+
+    # Rate Limiting Configuration (client-side, per provider)
+    # tokens_per_minute of 0 disables the token budget for that provider
+    rate_limits: dict = None
+    rate_limit_max_retries: int = 2
+    rate_limit_backoff: float = 1.0  # seconds, used when no Retry-After header is sent
+    provider_request_timeout_s: float = 30.0  # client-side timeout of GPT and Claude requests
+    # Threads that run cancellable provider calls (utils/cancellation.py);
+    # 0 sizes the pool for every server worker's turn having its stages in flight
+    provider_call_workers: int = 0
+
+    # Circuit breakers per provider endpoint (see utils/circuit_breaker.py).
+    # "default" applies to every endpoint, overridden per endpoint.
+    circuit_breaker_enabled: bool = os.getenv("CIRCUIT_BREAKERS", "1") == "1"
+    circuit_breakers: dict = None
+
+    # Prompt input token budgets per request stage (estimated tokens; 0 = unlimited).
+    # An over-budget GPT prompt drops its oldest history turns; the others are logged.
+    prompt_token_budgets: dict = None
+
+    # Logging Configuration
+    log_dir: str = os.getenv("LOG_DIR", "logs")
+    log_file: str = "therapist.log"
+    log_rotation: str = os.getenv("LOG_ROTATION", "size")  # "size" or "time"
+    log_max_bytes: int = 10 * 1024 * 1024  # per file, with size rotation
+    log_rotate_when: str = "midnight"  # with time rotation, see TimedRotatingFileHandler
+    log_backup_count: int = 7
+    log_queue_size: int = 10000  # records waiting for the writer thread; overflow is dropped
+    # Fraction of INFO/DEBUG records kept per logger (and its children); warnings are always kept
+    log_sampling: dict = None
+
+    # Admission Control Configuration (see services/admission.py)
+    # Tiers: 1 skips Claude validation, 2 also shortens replies, 3 voices
+    # only cached phrases, 4 answers in text only. Each signal lists the
+    # value at which tiers 1-4 start. Crisis turns are never degraded.
+    admission_control: bool = os.getenv("ADMISSION_CONTROL", "1") == "1"
+    admission_thresholds: dict = None
+    admission_latency_window_s: float = 60.0  # completed turns whose latency counts
+    admission_recovery_s: float = 15.0  # minimum time between stepping down one tier
+    admission_short_reply_sentences: int = 1
+
+    # Provider call recording (see utils/cassette.py): "off" or "record".
+    # Cassettes hold the user's audio and the full conversation; keep them
+    # on storage with the same access controls as the session database.
+    cassette_mode: str = os.getenv("CASSETTE_MODE", "off")
+    cassette_dir: str = os.getenv("CASSETTE_DIR", "data/cassettes")
+
+    # Turn analytics log (see services/session_analytics.py), Parquet files
+    # partitioned by day. Holds transcripts, like the session database.
+    analytics_enabled: bool = os.getenv("ANALYTICS_ENABLED", "1") == "1"
+    analytics_dir: str = os.getenv("ANALYTICS_DIR", "data/analytics")
+    analytics_batch_size: int = 500  # rows that trigger a flush before the interval is up
+    analytics_flush_interval_s: float = 60.0
+    analytics_max_buffered: int = 20000  # rows beyond this are dropped until the writer catches up
+
+    # Turn checkpoints (see services/turn_checkpoint.py): stage outputs kept
+    # so a failed turn can be retried, and duplicate audio recognized.
+    # Completed turns keep their reply audio (~1 MB each) until they expire.
+    turn_checkpoint_ttl_s: float = 300.0
+    turn_checkpoint_max: int = 64
+
     def __post_init__(self):
+        if self.stt_engines is None:
+            self.stt_engines = [name.strip() for name in
+                                os.getenv("STT_ENGINES", "openai,local").split(",") if name.strip()]
         if self.crisis_keywords is None:
             self.crisis_keywords = [
-                "انتحار", "موت", "قتل نفسي", "لا أريد العيش", 
+                "انتحار", "موت", "قتل نفسي", "لا أريد العيش",
                 "أريد أن أموت", "suicide", "kill myself", "want to die"
             ]
+        if self.rate_limits is None:
+            self.rate_limits = {
+                "openai": {"requests_per_second": 3.0, "tokens_per_minute": 30000},
+                "whisper": {"requests_per_second": 1.0, "tokens_per_minute": 0},
+                "anthropic": {"requests_per_second": 1.0, "tokens_per_minute": 20000},
+            }
+        if self.prompt_token_budgets is None:
+            self.prompt_token_budgets = {
+                "gpt": 3500,
+                "claude_validation": 1200,
+                "claude_fallback": 600,
+            }
+        if self.circuit_breakers is None:
+            self.circuit_breakers = {
+                "default": {
+                    "failure_rate": 0.5,  # share of recent calls failing that opens the circuit
+                    "slow_rate": 0.8,  # share of recent calls slower than slow_call_s that opens it
+                    "window_s": 60.0,  # calls older than this no longer count
+                    "min_calls": 4,  # recent calls needed before the rates are judged
+                    "open_s": 30.0,  # time open before a half-open probe
+                    "half_open_calls": 1,  # successful probes needed to close again
+                },
+                "openai.chat": {"slow_call_s": 15.0},
+                "openai.transcribe": {"slow_call_s": 10.0},
+                "anthropic.messages": {"slow_call_s": 15.0},
+            }
+        if self.admission_thresholds is None:
+            self.admission_thresholds = {
+                "in_flight": [6, 8, 12, 16],  # turns inside the pipeline
+                "tts_queue": [4, 8, 12, 16],  # segments queued or being synthesized
+                "latency_p90": [8.0, 12.0, 16.0, 24.0],  # seconds per completed turn
+            }
+        if self.log_sampling is None:
+            self.log_sampling = {
+                "services.session_manager.stages": 0.25,
+                "services.stt_service": 0.25,
+            }
 
 # Global configuration instance
 CONFIG = ModelConfig()
@@ -0,0 +1,406 @@
+"""Headless ASGI/WebSocket backend for the Omani AI Therapist pipeline.
+
+Run with:
+    uvicorn server:app --host 0.0.0.0 --port 8765
+
+Protocol (one WebSocket connection per conversation, path ``/ws``; add
+``?session_id=...`` to resume a stored session, possibly created by another worker):
+
+Client -> server
+    {"type": "start_turn", "sample_rate": 22050, "history": [...]}   history is optional; when given
+                                                                     the turn is not stored server-side
+    <binary frames>                                                  mono 16-bit PCM audio
+    {"type": "end_turn"}                                             runs the pipeline
+    {"type": "retry_turn", "turn_id": "...", "history": [...]}      re-runs a failed turn from its first
+                                                                     unfinished stage, without re-sending audio
+    {"type": "cancel"}                                               abandons the running turn
+    {"type": "reset"}                                                starts a new stored session
+
+Server -> client
+    {"type": "session", "session_id": "..."}
+    {"type": "transcript", "text": "..."}
+    {"type": "emotion", "scores": {...}}
+    {"type": "text_delta", "text": "..."}                            one per sentence; sent as the reply
+                                                                     streams in when it is not validated
+    {"type": "text_reset"}                                           the reply was replaced: drop the
+                                                                     text_deltas received so far
+    {"type": "error", "error": "..."}                                a malformed or unexpected message;
+                                                                     the session stays open. After a
+                                                                     rejected start_turn, its audio and
+                                                                     end_turn are ignored
+    {"type": "audio_start", "sample_rate": 24000, "encoding": "pcm_s16le", "channels": 1}
+    <binary frames>                                                  mono 16-bit PCM audio, sent as
+                                                                     each reply segment is synthesized
+    {"type": "turn_complete", "success": true, "cancelled": false, "processing_time": 3.2,
+     "degradation": "full", "error": null, "turn_id": "...",         degradation: the load tier the turn
+     "audio_failed": false,                                          was served at; no audio when "text_only".
+     "resumed": {"stages": [], "saved_s": 0.0,                       audio_failed: the reply has no audio
+                 "deduplicated": false, "revoiced": false,           although it should; retry_turn voices it
+                 "attempt": 1}}                                      resumed: stages reused from an earlier
+                                                                     attempt of the turn (a retry, or the
+                                                                     same audio sent again) and the time
+                                                                     they had taken. A turn that fails
+                                                                     outside the pipeline still ends with
+                                                                     turn_complete, success false
+"""
+
+import asyncio
+import io
+import json
+import logging
+import time
+import wave
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from config import CONFIG, validate_config
+from services.admission import admission_stats
+from services.session_analytics import analytics_stats
+from services.session_manager import SessionManager
+from services.session_store import get_session_store
+from services.turn_checkpoint import checkpoint_stats
+from services.turn_record import Turn
+from utils.logging_config import logging_stats, setup_logging
+from utils.rate_limiter import rate_limit_stats
+from utils.cancellation import CancellationToken, cancellation_stats
+from utils.circuit_breaker import circuit_breaker_stats
+from utils.cassette import session_cassette
+from utils.text_utils import split_sentences
+from utils.token_usage import token_usage_stats
+from utils.response_budget import response_budget_stats
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineServer:
+    """Serves one shared SessionManager to many concurrent WebSocket sessions."""
+
+    def __init__(self):
+        self.session_manager: Optional[SessionManager] = None
+        self.session_store = get_session_store()
+        self.executor = ThreadPoolExecutor(max_workers=CONFIG.server_max_workers,
+                                           thread_name_prefix="pipeline")
+        self.active_sessions = 0
+        self.active_turns = 0
+        self.completed_turns = 0
+
+    async def startup(self):
+        """Load the models once, off the event loop."""
+        setup_logging()
+        validate_config()
+        loop = asyncio.get_running_loop()
+        self.session_manager = await loop.run_in_executor(self.executor, SessionManager)
+        logger.info("Pipeline server ready")
+
+    async def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "active_sessions": self.active_sessions,
+            "active_turns": self.active_turns,
+            "completed_turns": self.completed_turns,
+            "max_workers": CONFIG.server_max_workers,
+            "rate_limits": rate_limit_stats(),
+            "cancellations": cancellation_stats(),
+            "logging": logging_stats(),
+            "tokens": token_usage_stats(),
+            "reply_budget": response_budget_stats(),
+            "admission": admission_stats(),
+            "analytics": analytics_stats(),
+            "checkpoints": checkpoint_stats(),
+            "circuit_breakers": circuit_breaker_stats(),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, send)
+        elif scope["type"] == "websocket":
+            if scope["path"] != "/ws":
+                await send({"type": "websocket.close", "code": 4404})
+                return
+            await self._websocket(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.error(f"Server startup failed: {str(e)}")
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, send):
+        if scope["path"] == "/health":
+            status, body = 200, self.metrics()
+        else:
+            status, body = 404, {"error": "not found"}
+        payload = json.dumps(body).encode("utf-8")
+        await send({"type": "http.response.start",
+                    "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": payload})
+
+    async def _websocket(self, scope, receive, send):
+        message = await receive()
+        if message["type"] != "websocket.connect":
+            return
+        await send({"type": "websocket.accept"})
+
+        query = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+        session = _Session(self, send, query.get("session_id", [None])[0])
+        self.active_sessions += 1
+        logger.info(f"Session {session.session_id} connected ({self.active_sessions} active)")
+        try:
+            await session.send_json({"type": "session", "session_id": session.session_id})
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    session.audio.write(message["bytes"])
+                elif message.get("text") is not None:
+                    try:
+                        command = json.loads(message["text"])
+                        if not isinstance(command, dict):
+                            raise ValueError("expected a JSON object")
+                        await session.handle_command(command)
+                    except ValueError as e:
+                        # A bad frame is the client's mistake; keep the conversation open
+                        await session.send_json({"type": "error", "error": f"malformed message: {str(e)}"})
+        except Exception as e:
+            logger.error(f"Session {session.session_id} failed: {str(e)}")
+        finally:
+            # Nobody is listening any more; free the worker and API quota
+            session.cancel("client disconnected")
+            self.active_sessions -= 1
+            logger.info(f"Session {session.session_id} closed")
+
+
+def _parse_history(entries: Any) -> Optional[List[Turn]]:
+    """Turns from a client-sent history; raises ValueError if it is malformed."""
+    if entries is None:
+        return None
+    if not isinstance(entries, list):
+        raise ValueError("history must be a list of turns")
+    try:
+        return [Turn.from_dict(entry) for entry in entries]
+    except (KeyError, TypeError, AttributeError, ValueError) as e:
+        raise ValueError(f"invalid history entry: {str(e)}")
+
+
+class _Session:
+    """State of one WebSocket conversation."""
+
+    def __init__(self, server: PipelineServer, send, session_id: Optional[str] = None):
+        self.server = server
+        self.send = send
+        self.store = server.session_store
+        if not session_id or not self.store.session_exists(session_id):
+            session_id = self.store.create_session()
+        self.session_id = session_id
+        self.client_history = None
+        self.sample_rate = CONFIG.sample_rate
+        self.audio = io.BytesIO()
+        self.turn_task: Optional[asyncio.Task] = None
+        self.cancel_token: Optional[CancellationToken] = None
+        self.audio_started = False  # audio_start sent for the current turn
+        self.text_sent = ""  # reply text already sent as text_delta this turn
+        self.turn_rejected = False  # the last start_turn was malformed
+
+    def cancel(self, reason: str):
+        if self.cancel_token is not None:
+            self.cancel_token.cancel(reason)
+
+    def _turn_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Turn failed in session {self.session_id}: {str(task.exception())}")
+
+    async def send_json(self, payload: Dict[str, Any]):
+        await self.send({"type": "websocket.send",
+                         "text": json.dumps(payload, ensure_ascii=False)})
+
+    async def send_bytes(self, payload: bytes):
+        await self.send({"type": "websocket.send", "bytes": payload})
+
+    async def handle_command(self, command: Dict[str, Any]):
+        """Act on one client message; raises ValueError for malformed ones."""
+        kind = command.get("type")
+        if kind == "start_turn":
+            self.audio = io.BytesIO()
+            # Until the command is known to be valid: the client was sent an error
+            # and has given up on this turn, so its audio and end_turn are dropped
+            self.turn_rejected = True
+            self.sample_rate = int(command.get("sample_rate", CONFIG.sample_rate))
+            self.client_history = _parse_history(command.get("history"))
+            self.turn_rejected = False
+        elif kind == "end_turn":
+            if self.turn_rejected:
+                self.turn_rejected = False
+                self.audio = io.BytesIO()
+                return
+            if self.turn_task is not None and not self.turn_task.done():
+                await self.send_json({"type": "error", "error": "a turn is already running"})
+                return
+            # Run as a task so cancel messages and disconnects are still received
+            self.turn_task = asyncio.create_task(self.run_turn())
+            self.turn_task.add_done_callback(self._turn_done)
+        elif kind == "retry_turn":
+            if self.turn_task is not None and not self.turn_task.done():
+                await self.send_json({"type": "error", "error": "a turn is already running"})
+                return
+            if command.get("history") is not None:
+                self.client_history = _parse_history(command["history"])
+            self.turn_task = asyncio.create_task(self.run_turn(retry=command.get("turn_id")))
+            self.turn_task.add_done_callback(self._turn_done)
+        elif kind == "cancel":
+            self.cancel("client request")
+        elif kind == "reset":
+            self.session_id = self.store.create_session()
+            await self.send_json({"type": "session", "session_id": self.session_id})
+        else:
+            await self.send_json({"type": "error", "error": f"unknown message type: {kind}"})
+
+    def _wav_bytes(self) -> bytes:
+        wav_buffer = io.BytesIO()
+        with wave.open(wav_buffer, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.sample_rate)
+            wav_file.writeframes(self.audio.getvalue())
+        return wav_buffer.getvalue()
+
+    async def run_turn(self, retry: Optional[str] = None):
+        """Run the pipeline in the worker pool and stream its events back.
+
+        With ``retry`` (a turn ID) the checkpointed turn is resumed instead
+        of running the audio received since ``start_turn``. The client
+        always gets a ``turn_complete``, with ``success`` false if the turn
+        failed outside the pipeline.
+        """
+        start_time = time.time()
+        try:
+            await self._run_turn(retry)
+        except Exception as e:
+            logger.error(f"Turn failed in session {self.session_id}: {str(e)}")
+            try:
+                await self.send_json({"type": "turn_complete",
+                                      "success": False,
+                                      "cancelled": False,
+                                      "processing_time": time.time() - start_time,
+                                      "degradation": None,
+                                      "error": str(e),
+                                      "audio_failed": False,
+                                      "turn_id": retry,
+                                      "resumed": {"stages": [], "saved_s": 0.0, "deduplicated": False,
+                                                  "revoiced": False, "attempt": 1}})
+            except Exception as send_error:
+                logger.error(f"Could not report the failed turn to the client: {str(send_error)}")
+
+    async def _run_turn(self, retry: Optional[str] = None):
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+
+        def on_event(event: str, payload: Any):
+            loop.call_soon_threadsafe(events.put_nowait, (event, payload))
+
+        audio_bytes = self._wav_bytes()
+        self.audio = io.BytesIO()
+        if self.client_history is not None:
+            history = list(self.client_history)
+        else:
+            history = await loop.run_in_executor(None, self.store.history, self.session_id)
+
+        self.cancel_token = CancellationToken()
+        self.audio_started = False
+        self.text_sent = ""
+        self.server.active_turns += 1
+        try:
+            if retry:
+                job = loop.run_in_executor(
+                    self.server.executor,
+                    self.server.session_manager.retry_turn,
+                    retry, history, on_event, self.cancel_token,
+                    session_cassette(self.session_id), self.session_id,
+                )
+            else:
+                job = loop.run_in_executor(
+                    self.server.executor,
+                    self.server.session_manager.process_voice_input,
+                    audio_bytes, history, on_event, self.cancel_token,
+                    None, session_cassette(self.session_id), self.session_id,
+                )
+            while not (job.done() and events.empty()):
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait({getter, job}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    await self._forward(*getter.result())
+                else:
+                    getter.cancel()
+            result = job.result()
+        finally:
+            self.server.active_turns -= 1
+
+        self.server.completed_turns += 1
+        resumed = result["resumed"]
+        already_stored = resumed["deduplicated"] or resumed.get("revoiced")
+        if result["success"] and not already_stored and self.client_history is None:
+            turn = Turn(result["transcription"], result["response_text"], result["emotions"])
+            await loop.run_in_executor(None, self.store.append_turn, self.session_id, turn)
+        await self.send_json({"type": "turn_complete",
+                              "success": result["success"],
+                              "cancelled": result["cancelled"],
+                              "processing_time": result["processing_time"],
+                              "degradation": result.get("degradation"),
+                              "error": result["error"],
+                              "audio_failed": result.get("audio_failed", False),
+                              "turn_id": result["turn_id"],
+                              "resumed": result["resumed"]})
+
+    async def _forward(self, event: str, payload: Any):
+        if event == "transcript":
+            await self.send_json({"type": "transcript", "text": payload})
+        elif event == "emotion":
+            await self.send_json({"type": "emotion", "scores": payload})
+        elif event in ("response_partial", "response"):
+            await self._send_text(payload)
+        elif event == "audio_segment" or (event == "audio" and not self.audio_started):
+            if not self.audio_started:
+                self.audio_started = True
+                await self.send_json({"type": "audio_start",
+                                      "sample_rate": payload.sample_rate,
+                                      "encoding": "pcm_s16le",
+                                      "channels": 1})
+            for chunk in payload.iter_pcm16_chunks(CONFIG.server_audio_chunk_ms):
+                # ASGI requires bytes, so each chunk is copied exactly once here
+                await self.send_bytes(bytes(chunk))
+
+
+    async def _send_text(self, text: str):
+        """Send the part of the reply the client has not seen yet, one text_delta per sentence."""
+        if not text.startswith(self.text_sent):
+            # The reply was replaced (e.g. a fallback after a failed stream)
+            await self.send_json({"type": "text_reset"})
+            self.text_sent = ""
+        for sentence in split_sentences(text[len(self.text_sent):]):
+            await self.send_json({"type": "text_delta", "text": sentence})
+        self.text_sent = text
+
+
+app = PipelineServer()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("server:app", host=CONFIG.server_host, port=CONFIG.server_port)
@@ -0,0 +1,171 @@
+"""Admission control: degrade turns in tiers when the pipeline is saturated.
+
+Every turn is admitted at the tier the current load calls for, so under
+pressure turns get cheaper instead of everyone's latency collapsing
+together. Tiers are cumulative:
+
+0. full: GPT, Claude validation, full reply budget, XTTS
+1. no_validation: the GPT reply is used without Claude validation
+2. short_reply: replies are also cut to ``admission_short_reply_sentences``
+3. cached_voice: the model does not run; a reply is voiced as far as its
+   segments are in the TTS cache, then ``CACHED_VOICE_NOTICE`` (precached)
+   tells the listener the rest is on screen
+4. text_only: no speech synthesis at all
+
+Load is read from three signals: turns in flight, TTS segments queued or
+being synthesized, and the p90 latency of turns completed within
+``admission_latency_window_s``. Each signal has a threshold per tier in
+``CONFIG.admission_thresholds``. The highest tier any signal reaches
+applies at once. Recovery is one tier at a time, at most every
+``admission_recovery_s``, so the tier doesn't flap as degraded turns get
+faster. Crisis turns are always served at tier 0.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+TIERS = ("full", "no_validation", "short_reply", "cached_voice", "text_only")
+
+# Spoken in place of the uncached part of a reply at the cached_voice tier
+CACHED_VOICE_NOTICE = "باقي الرد مكتوب قدامك على الشاشة."
+
+
+class Degradation(NamedTuple):
+    """What a turn admitted at ``tier`` gets."""
+
+    tier: int = 0
+
+    @property
+    def name(self) -> str:
+        return TIERS[self.tier]
+
+    @property
+    def validate(self) -> bool:
+        return self.tier < 1
+
+    @property
+    def max_sentences(self) -> Optional[int]:
+        return CONFIG.admission_short_reply_sentences if self.tier >= 2 else None
+
+    @property
+    def voice(self) -> str:
+        """One of "model", "cached" (segment cache only) or "none"."""
+        return ("model", "model", "model", "cached", "none")[self.tier]
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class AdmissionController:
+    """Tracks pipeline load and picks the degradation tier for each new turn."""
+
+    def __init__(self, thresholds: Optional[Dict[str, list]] = None,
+                 queue_depth: Optional[Callable[[], int]] = None):
+        self.thresholds = thresholds or CONFIG.admission_thresholds
+        if queue_depth is None:
+            from services.tts_service import tts_queue_depth  # loads torch and XTTS; only when needed
+            queue_depth = tts_queue_depth
+        self.queue_depth = queue_depth
+        self.tier = 0
+        self._tier_since = time.monotonic()
+        self._in_flight = 0
+        self._latencies = deque()  # (completed at, seconds)
+        self._admitted = Counter()
+        self._crisis_overrides = 0
+        self._lock = threading.Lock()
+
+    def _signals(self) -> Dict[str, float]:
+        horizon = time.monotonic() - CONFIG.admission_latency_window_s
+        while self._latencies and self._latencies[0][0] < horizon:
+            self._latencies.popleft()
+        return {
+            "in_flight": self._in_flight,
+            "tts_queue": self.queue_depth(),
+            "latency_p90": round(_percentile([latency for _, latency in self._latencies], 0.9), 3),
+        }
+
+    def _update_tier(self) -> int:
+        signals = self._signals()
+        target = max(sum(1 for threshold in self.thresholds.get(name, ()) if value >= threshold)
+                     for name, value in signals.items())
+        target = min(target, len(TIERS) - 1)
+        now = time.monotonic()
+        if target > self.tier:
+            logger.warning(f"Load shedding: tier {TIERS[target]} (was {TIERS[self.tier]}), signals {signals}")
+            self.tier, self._tier_since = target, now
+        elif target < self.tier and now - self._tier_since >= CONFIG.admission_recovery_s:
+            self.tier, self._tier_since = self.tier - 1, now
+            logger.info(f"Load easing: tier {TIERS[self.tier]}, signals {signals}")
+        return self.tier
+
+    def admit(self) -> Degradation:
+        """Count a new turn in flight and return how it should be served."""
+        with self._lock:
+            self._in_flight += 1
+            degradation = Degradation(self._update_tier())
+            self._admitted[degradation.name] += 1
+        return degradation
+
+    def release(self, latency: Optional[float] = None):
+        """End a turn; ``latency`` is the processing time of a completed turn."""
+        with self._lock:
+            self._in_flight -= 1
+            if latency is not None:
+                self._latencies.append((time.monotonic(), latency))
+
+    def crisis_override(self, degradation: Degradation) -> Degradation:
+        """Serve a crisis turn in full whatever tier it was admitted at."""
+        if degradation.tier:
+            with self._lock:
+                self._crisis_overrides += 1
+            logger.info(f"Crisis turn admitted at tier {degradation.name} served in full")
+        return Degradation(0)
+
+    def stats(self) -> Dict[str, Any]:
+        """The tier turns are being admitted at; only ``admit`` moves it."""
+        with self._lock:
+            return {
+                "tier": self.tier,
+                "tier_name": TIERS[self.tier],
+                "signals": self._signals(),
+                "admitted": dict(self._admitted),
+                "crisis_overrides": self._crisis_overrides,
+            }
+
+
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """The process-wide controller, shared by all sessions."""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+        return _controller
+
+
+def reset_admission_controller():
+    """Start the next ``get_admission_controller`` from a clean state."""
+    global _controller
+    with _controller_lock:
+        _controller = None
+
+
+def admission_stats() -> Dict[str, Any]:
+    """Active tier, the load signals behind it and turns admitted per tier."""
+    with _controller_lock:
+        controller = _controller
+    return controller.stats() if controller is not None else {"tier": 0, "tier_name": TIERS[0]}
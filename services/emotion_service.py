@@ -3,8 +3,10 @@
 import torch
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import logging
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from config import CONFIG
+from services.turn_record import EMOTION_LABELS
+from utils.cancellation import CancellationToken, raise_if_cancelled
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +24,7 @@ class EmotionService:
         try:
             self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
             self.model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
+            self.model.eval()
             logger.info(f"Emotion model loaded: {self.model_name}")
         except Exception as e:
             logger.error(f"Error loading emotion model: {str(e)}")
@@ -29,11 +32,14 @@ class EmotionService:
             self.tokenizer = None
             self.model = None
     
-    def detect_emotion(self, text: str) -> Dict[str, float]:
+    def detect_emotion(self, text: str,
+                       cancel_token: Optional[CancellationToken] = None) -> Dict[str, float]:
         """Detect emotion from Arabic text."""
         if not text:
             return {"neutral": 1.0}
         
+        raise_if_cancelled(cancel_token, "emotion")
+        
         try:
             if self.model and self.tokenizer:
                 return self._model_based_detection(text)
@@ -43,22 +49,58 @@ class EmotionService:
             logger.error(f"Error in emotion detection: {str(e)}")
             return {"neutral": 1.0}
     
+    def detect_emotions(self, texts: List[str], batch_size: Optional[int] = None) -> List[Dict[str, float]]:
+        """Detect emotions of many texts, running the model ``batch_size`` texts at a time.
+
+        Texts are grouped by length so each batch pads as little as
+        possible; results come back in the order of ``texts``.
+        """
+        batch_size = batch_size or CONFIG.emotion_batch_size
+        results: List[Dict[str, float]] = [{"neutral": 1.0} for _ in texts]
+        if not (self.model and self.tokenizer):
+            for index, text in enumerate(texts):
+                if text:
+                    results[index] = self._rule_based_detection(text)
+            return results
+        
+        order = sorted((index for index, text in enumerate(texts) if text), key=lambda index: len(texts[index]))
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            try:
+                batch = self._model_based_batch([texts[index] for index in indices])
+            except Exception as e:
+                logger.error(f"Error in batched emotion detection: {str(e)}")
+                continue
+            for index, emotions in zip(indices, batch):
+                results[index] = emotions
+        return results
+    
+    def warm(self):
+        """Run a one-word inference so the model and torch's thread pool are hot for the turn."""
+        if self.model and self.tokenizer:
+            self._model_based_detection("مرحبا")
+    
     def _model_based_detection(self, text: str) -> Dict[str, float]:
         """Use transformer model for emotion detection."""
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, padding=True)
+        return self._model_based_batch([text])[0]
+    
+    def _labels(self) -> List[str]:
+        """Emotion label of each model output, from the model's config when it names them."""
+        id2label = getattr(self.model.config, "id2label", None) or {}
+        labels = [str(id2label.get(i, "")).lower() for i in range(len(id2label))]
+        return labels if tuple(sorted(labels)) == EMOTION_LABELS else list(EMOTION_LABELS)
+    
+    def _model_based_batch(self, texts: List[str]) -> List[Dict[str, float]]:
+        """Run the transformer model on a padded batch of texts."""
+        inputs = self.tokenizer(texts, return_tensors="pt", truncation=True, padding=True)
         
         with torch.no_grad():
             outputs = self.model(**inputs)
-            predictions = torch.nn.functional.softmax(outputs.logits, dim=-1)
+            predictions = torch.nn.functional.softmax(outputs.logits, dim=-1).tolist()
         
         # Map model outputs to emotion labels
-        emotion_labels = ["negative", "neutral", "positive"]
-        emotions = {}
-        
-        for i, label in enumerate(emotion_labels):
-            emotions[label] = float(predictions[0][i])
-        
-        return emotions
+        labels = self._labels()
+        return [{label: float(scores[i]) for i, label in enumerate(labels)} for scores in predictions]
     
     def _rule_based_detection(self, text: str) -> Dict[str, float]:
         """Fallback rule-based emotion detection."""
@@ -2,51 +2,126 @@
 
 import openai
 import anthropic
+import requests
 import logging
-from typing import Optional, Dict
+from typing import Callable, Dict, Optional
 from config import CONFIG
-from utils.text_utils import detect_crisis_keywords
+from utils.text_utils import detect_crisis_keywords, estimate_tokens
+from utils.prompt_builder import build_prompt, render_prompt
+from utils.token_usage import exceeds_budget, input_budget, record_tokens
+from utils.response_budget import ResponseGovernor, trim_to_budget
+from utils.rate_limiter import get_rate_limiter, PRIORITY_CRISIS, PRIORITY_NORMAL
+from utils.cancellation import CancellationToken, raise_if_cancelled
+from utils.circuit_breaker import CircuitOpen, get_circuit_breaker
+from utils.cassette import recording_anthropic, recording_openai
 
 logger = logging.getLogger(__name__)
 
+# Canned replies for when every provider fails; the TTS service keeps them
+# synthesized so they can be voiced even when the pipeline is overloaded
+FALLBACK_RESPONSES = {
+    "crisis": "أتفهم أنك تمر بوقت صعب جداً. من المهم أن تطلب المساعدة الفورية. "
+              "يرجى الاتصال بخط المساعدة النفسية في عمان على الرقم 16262 أو التوجه إلى أقرب مستشفى.",
+    "default": "أعتذر، أواجه صعوبة تقنية الآن. لكن أريدك أن تعرف أنني هنا لمساعدتك. "
+               "كيف يمكنني أن أدعمك اليوم؟",
+}
+
 class GPTService:
     """GPT service with Claude fallback for therapeutic responses."""
     
-    def __init__(self):
-        openai.api_key = CONFIG.openai_api_key
-        self.anthropic_client = anthropic.Anthropic(api_key=CONFIG.anthropic_api_key)
+    def __init__(self, openai_module=None, anthropic_client=None):
+        # Both clients can be swapped for stand-ins with the same interface
+        self.openai = recording_openai(openai_module or openai)
+        self.openai.api_key = CONFIG.openai_api_key
+        
+        # Shared keep-alive pools, so a connection warmed before the turn is
+        # the one the request uses (openai 0.28 otherwise keeps one per thread)
+        self.http_session = None
+        if openai_module is None:
+            self.http_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=CONFIG.server_max_workers * 2)
+            self.http_session.mount("https://", adapter)
+            openai.requestssession = self.http_session
+        
+        # The anthropic client already pools connections across threads
+        self.warm_anthropic = anthropic_client is None
+        self.anthropic_client = recording_anthropic(
+            anthropic_client or anthropic.Anthropic(api_key=CONFIG.anthropic_api_key))
+        self.openai_limiter = get_rate_limiter("openai")
+        self.anthropic_limiter = get_rate_limiter("anthropic")
+        # An open breaker skips its provider at once: Claude answers instead of
+        # GPT, validation is skipped, and with both down the canned reply is used
+        self.chat_breaker = get_circuit_breaker("openai.chat")
+        self.claude_breaker = get_circuit_breaker("anthropic.messages")
     
     def generate_therapeutic_response(self, 
                                     user_text: str, 
                                     session_history: list,
-                                    emotion_data: Optional[Dict[str, float]] = None) -> Optional[str]:
-        """Generate therapeutic response using GPT-4 with Claude validation."""
+                                    emotion_data: Optional[Dict[str, float]] = None,
+                                    cancel_token: Optional[CancellationToken] = None,
+                                    history_block: Optional[str] = None,
+                                    validate: bool = True,
+                                    max_sentences: Optional[int] = None,
+                                    outcome: Optional[Dict[str, Optional[str]]] = None,
+                                    on_partial: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """Generate therapeutic response using GPT-4 with Claude validation.
+        
+        ``history_block`` is the output of ``format_history`` when it was
+        prepared ahead of time; otherwise it is built from ``session_history``.
+        Under load the admission controller turns off ``validate`` and
+        sets ``max_sentences`` below the configured reply budget.
+        ``outcome``, if given, is filled with the ``model`` that wrote the
+        reply ("gpt", "claude" or "fallback") and the ``validation`` result
+        ("approved", "revised", "failed", "skipped" or None if not reached).
+        ``on_partial``, if given, is called with the reply so far (complete
+        sentences within the budget) as the GPT stream arrives. Only
+        replies that will not be validated are streamed this way; a reply
+        Claude may still revise is not shown before it is approved. A
+        later fallback to Claude can replace the partial text.
+        """
+        outcome = {} if outcome is None else outcome
+        outcome.update(model=None, validation=None)
         
         # Check for crisis keywords
         is_crisis = detect_crisis_keywords(user_text, CONFIG.crisis_keywords)
         
         try:
             # Generate response with GPT-4
-            gpt_response = self._generate_gpt_response(user_text, is_crisis, session_history, emotion_data)
+            gpt_response = self._generate_gpt_response(user_text, is_crisis, session_history, emotion_data,
+                                                       cancel_token, history_block, max_sentences,
+                                                       None if validate else on_partial)
+            raise_if_cancelled(cancel_token, "gpt")
             
-            # return gpt_response
+            if gpt_response and not validate:
+                outcome.update(model="gpt", validation="skipped")
+                return gpt_response
             if gpt_response:
                 # Validate with Claude
-                validated_response = self._validate_with_claude(gpt_response, user_text, is_crisis)
+                outcome["model"] = "gpt"
+                validated_response = self._validate_with_claude(gpt_response, user_text, is_crisis,
+                                                                cancel_token, outcome)
                 return validated_response or gpt_response
             
             # Fallback to Claude if GPT fails
-            return self._generate_claude_response(user_text, emotion_data, is_crisis)
+            response = self._generate_claude_response(user_text, emotion_data, is_crisis, cancel_token,
+                                                      max_sentences)
+            outcome["model"] = "claude" if response else None
+            return response
             
         except Exception as e:
             logger.error(f"Error generating therapeutic response: {str(e)}")
+            outcome["model"] = "fallback"
             return self._generate_fallback_response(is_crisis)
     
     def _generate_gpt_response(self, 
                              user_text: str, 
                              is_crisis: bool,
                              session_history: list,
-                             emotion_data: Optional[Dict[str, float]] = None) -> Optional[str]:
+                             emotion_data: Optional[Dict[str, float]] = None,
+                             cancel_token: Optional[CancellationToken] = None,
+                             history_block: Optional[str] = None,
+                             max_sentences: Optional[int] = None,
+                             on_partial: Optional[Callable[[str], None]] = None) -> Optional[str]:
         """Generate response using GPT-4."""
         
         # Determine primary emotion
@@ -57,33 +132,135 @@ class GPTService:
         system_prompt = self._create_therapeutic_prompt(is_crisis, 
                                                        primary_emotion, 
                                                        emotion_confidence,
-                                                       session_history)
+                                                       session_history,
+                                                       history_block)
+        
+        # Over budget: drop the oldest turns of history until the prompt fits
+        estimated_input = estimate_tokens(system_prompt) + estimate_tokens(user_text)
+        history = list(session_history or [])
+        budget = input_budget("gpt")
+        while budget and estimated_input > budget and history:
+            history = history[1:]
+            system_prompt = self._create_therapeutic_prompt(is_crisis, primary_emotion, emotion_confidence, history)
+            estimated_input = estimate_tokens(system_prompt) + estimate_tokens(user_text)
+            if estimated_input <= budget:
+                logger.info(f"GPT prompt trimmed to the last {len(history)} turns to fit its token budget")
+        exceeds_budget("gpt", estimated_input)
+        
+        max_tokens = 300
+        estimated_tokens = estimated_input + max_tokens
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_text}
+        ]
         
         try:
-            response = openai.ChatCompletion.create(
-                model=CONFIG.gpt_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_text}
-                ],
-                max_tokens=300,
-                temperature=0.7
+            if CONFIG.response_max_sentences or CONFIG.response_max_chars:
+                return self._stream_gpt_response(messages, max_tokens, estimated_input, is_crisis, cancel_token,
+                                                 max_sentences, on_partial)
+            
+            response = self.openai_limiter.call(
+                lambda: self.openai.ChatCompletion.create(
+                    model=CONFIG.gpt_model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=0.7,
+                    request_timeout=CONFIG.provider_request_timeout_s
+                ),
+                tokens=estimated_tokens,
+                priority=PRIORITY_CRISIS if is_crisis else PRIORITY_NORMAL,
+                cancel_token=cancel_token,
+                breaker=self.chat_breaker
             )
             
-            return response.choices[0].message.content.strip()
+            usage = response.get("usage")
+            if usage:
+                self.openai_limiter.reconcile(estimated_tokens, usage.get("total_tokens"))
+                record_tokens("gpt", usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0),
+                              estimated_input)
             
+            text = response.choices[0].message.content.strip()
+            return trim_to_budget(text, max_sentences, exempt=is_crisis) if max_sentences else text
+            
+        except CircuitOpen as e:
+            logger.warning(f"{str(e)}, answering with Claude")
+            return None
         except Exception as e:
             logger.error(f"Error with GPT-4: {str(e)}")
             return None
     
+    def _stream_gpt_response(self,
+                             messages: list,
+                             max_tokens: int,
+                             estimated_input: int,
+                             is_crisis: bool,
+                             cancel_token: Optional[CancellationToken] = None,
+                             max_sentences: Optional[int] = None,
+                             on_partial: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """Stream the reply and stop reading once it meets the sentence/character budget.
+        
+        Dropping the stream closes its connection, which ends generation on
+        the provider side, so tokens past the budget are neither generated
+        nor synthesized. Crisis replies are read in full. Streamed
+        responses carry no usage, so output tokens are estimated from the
+        text received. ``on_partial`` gets the settled text each time a
+        sentence completes.
+        """
+        
+        def request():
+            # A fresh governor per attempt, in case a throttled request is retried
+            governor = ResponseGovernor(max_sentences, exempt=is_crisis)
+            partial = ""
+            stream = self.openai.ChatCompletion.create(
+                model=CONFIG.gpt_model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.7,
+                stream=True,
+                request_timeout=CONFIG.provider_request_timeout_s
+            )
+            try:
+                for chunk in stream:
+                    delta = chunk["choices"][0].get("delta", {}).get("content")
+                    stop = bool(delta) and governor.feed(delta)
+                    if on_partial is not None and delta:
+                        settled = governor.settled()
+                        if settled != partial:
+                            partial = settled
+                            on_partial(settled)
+                    if stop:
+                        break
+                    if cancel_token is not None and cancel_token.cancelled:
+                        break
+            finally:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+            return governor
+        
+        governor = self.openai_limiter.call(
+            request,
+            tokens=estimated_input + max_tokens,
+            priority=PRIORITY_CRISIS if is_crisis else PRIORITY_NORMAL,
+            cancel_token=cancel_token,
+            breaker=self.chat_breaker
+        )
+        output_tokens = estimate_tokens(governor.received)
+        self.openai_limiter.reconcile(estimated_input + max_tokens, estimated_input + output_tokens)
+        record_tokens("gpt", estimated_input, output_tokens, estimated_input)
+        return governor.finish(max_tokens, output_tokens) or None
+    
     def _validate_with_claude(self, 
                             gpt_response: str, 
                             user_text: str, 
-                            is_crisis: bool) -> Optional[str]:
+                            is_crisis: bool,
+                            cancel_token: Optional[CancellationToken] = None,
+                            outcome: Optional[Dict[str, Optional[str]]] = None) -> Optional[str]:
         """Validate GPT response using Claude."""
-        print("Validating GPT response with Claude...")
+        outcome = {} if outcome is None else outcome
+        logger.debug("Validating GPT response with Claude...")
         
-        validation_prompt = f"""
+        validation_prompt = render_prompt("""
         You are validating a therapeutic response for cultural appropriateness and safety.
         
         User input: {user_text}
@@ -99,38 +276,43 @@ class GPTService:
         Respond with either:
         - "APPROVED" if the response is appropriate
         - Provide an improved version in Omani dialect if changes are needed
-        """
+        """, user_text=user_text, gpt_response=gpt_response, is_crisis=is_crisis)
         
         try:
-            response = self.anthropic_client.messages.create(
-                model=CONFIG.claude_model,
-                max_tokens=400,
-                messages=[{"role": "user", "content": validation_prompt}]
-            )
+            response = self._call_claude(validation_prompt, 400, is_crisis, cancel_token, "claude_validation")
             
             claude_response = response.content[0].text.strip()
             
             if claude_response.startswith("APPROVED"):
-                print("Claude response approved")
+                logger.info("Claude response approved")
+                outcome["validation"] = "approved"
                 return None  # GPT response is approved
             else:
-                print("Claude response requires improvement")
-                return claude_response  # Use Claude's improved version
+                logger.info("Claude response requires improvement")
+                outcome["validation"] = "revised"
+                return trim_to_budget(claude_response, exempt=is_crisis)  # Use Claude's improved version
                 
+        except CircuitOpen as e:
+            logger.warning(f"{str(e)}, skipping validation")
+            outcome["validation"] = "skipped"
+            return None
         except Exception as e:
             logger.error(f"Error validating with Claude: {str(e)}")
+            outcome["validation"] = "failed"
             return None
     
     def _generate_claude_response(self, 
                                 user_text: str, 
                                 emotion_data: Dict[str, float], 
-                                is_crisis: bool) -> Optional[str]:
+                                is_crisis: bool,
+                                cancel_token: Optional[CancellationToken] = None,
+                                max_sentences: Optional[int] = None) -> Optional[str]:
         """Generate response using Claude as fallback."""
         
         primary_emotion = max(emotion_data, key=emotion_data.get)
         
-        prompt = f"""
-        You are an AI therapist specializing in Omani/Gulf Arabic culture. 
+        prompt = render_prompt("""
+        You are an AI therapist specializing in Omani/Gulf Arabic culture.
         
         User said: {user_text}
         Detected emotion: {primary_emotion}
@@ -141,29 +323,60 @@ class GPTService:
         - Respects Islamic values and family importance
         - Uses appropriate Omani dialect expressions
         - Provides practical, culturally-sensitive advice
-        {"- Includes crisis intervention if needed" if is_crisis else ""}
+        {crisis_instruction}
         
         Response should be 2-3 sentences maximum.
-        """
+        """, user_text=user_text, primary_emotion=primary_emotion, is_crisis=is_crisis,
+            crisis_instruction="- Includes crisis intervention if needed" if is_crisis else "")
         
         try:
-            response = self.anthropic_client.messages.create(
-                model=CONFIG.claude_model,
-                max_tokens=300,
-                messages=[{"role": "user", "content": prompt}]
-            )
+            response = self._call_claude(prompt, 300, is_crisis, cancel_token, "claude_fallback")
             
-            return response.content[0].text.strip()
+            return trim_to_budget(response.content[0].text.strip(), max_sentences, exempt=is_crisis)
             
+        except CircuitOpen:
+            raise  # nothing left to ask: the caller falls back to a canned reply
         except Exception as e:
             logger.error(f"Error with Claude: {str(e)}")
             return None
     
+    def _call_claude(self, prompt: str, max_tokens: int, is_crisis: bool,
+                     cancel_token: Optional[CancellationToken] = None,
+                     stage: str = "claude"):
+        """Send a single-message Claude request through the rate limiter."""
+        estimated_input = estimate_tokens(prompt)
+        exceeds_budget(stage, estimated_input)
+        estimated_tokens = estimated_input + max_tokens
+        
+        def request():
+            raw = self.anthropic_client.messages.with_raw_response.create(
+                model=CONFIG.claude_model,
+                max_tokens=max_tokens,
+                messages=[{"role": "user", "content": prompt}],
+                timeout=CONFIG.provider_request_timeout_s
+            )
+            self.anthropic_limiter.update_from_headers(raw.headers)
+            return raw.parse()
+        
+        response = self.anthropic_limiter.call(
+            request,
+            tokens=estimated_tokens,
+            priority=PRIORITY_CRISIS if is_crisis else PRIORITY_NORMAL,
+            cancel_token=cancel_token,
+            breaker=self.claude_breaker
+        )
+        self.anthropic_limiter.reconcile(
+            estimated_tokens, response.usage.input_tokens + response.usage.output_tokens
+        )
+        record_tokens(stage, response.usage.input_tokens, response.usage.output_tokens, estimated_input)
+        return response
+    
     def _create_therapeutic_prompt(self,
                                  is_crisis: bool, 
                                  primary_emotion: str = None, 
                                  confidence: float = None,
-                                 session_history: list = None) -> str:
+                                 session_history: list = None,
+                                 history_block: Optional[str] = None) -> str:
         """Create therapeutic system prompt."""
 
         # --- PART 1: Core Persona and Mission (التعريف الأساسي بالمهمة والشخصية) ---
@@ -284,37 +497,45 @@ class GPTService:
                         """)
 
         # --- PART 6: Session History and Final Instruction (سجل الجلسة والتعليمات النهائية) ---
-        # Convert list of dicts to a readable string for GPT
-        history_string = ""
-        if session_history:
-            for entry in session_history:
-                history_string += f"المستخدم: {entry['user']}\n"
-                history_string += f"المرشد: {entry['therapist']}\n"
-        else:
-            history_string = "لا يوجد سجل جلسات سابق. هذه هي بداية المحادثة."
+        history_string = history_block if history_block is not None else self.format_history(session_history)
 
-        prompt_sections.append(f"""
-                        **سجل الجلسة السابق:**
-                        {history_string}
-
-                        **بناءً على جميع الإرشادات أعلاه، ردك القادم كمرشد نفسي عماني (أو مرشدة نفسية عمانية) يجب أن يكون:**
-                        """)
-        prompt_sections.append(f"""
+        # Appended as-is rather than interpolated, so its lines don't defeat the dedent
+        prompt_sections.append("**سجل الجلسة السابق:**\n" + history_string)
+        prompt_sections.append("""
                         **بناءً على جميع الإرشادات أعلاه، ردك القادم كمرشد نفسي عماني (أو مرشدة نفسية عمانية) يجب أن يكون:**
                         * **ركّز على الإيجاز والوضوح الشديد:** الهدف هو تقديم رسالة فعّالة ومباشرة.
                         * **اهدف لأن تكون إجابتك في حدود جملةإلى جملتين كحد أقصى.** لا داعي للإسهاب أو إطالة الحديث.
                         * ابدأ بالتعاطف ثم انتقل مباشرة إلى التوجيه أو السؤال البناء.
                         """)
 
-        final_prompt = "\n".join(prompt_sections)
+        # Dedented, whitespace-collapsed and without repeated sections (utils/prompt_builder.py)
+        final_prompt = build_prompt(prompt_sections)
         return final_prompt
     
+    def format_history(self, session_history: list = None) -> str:
+        """Render the conversation so far for the system prompt."""
+        if not session_history:
+            return "لا يوجد سجل جلسات سابق. هذه هي بداية المحادثة."
+        
+        # Convert turns to a readable string for GPT
+        history_string = ""
+        for entry in session_history:
+            history_string += f"المستخدم: {entry.user}\n"
+            history_string += f"المرشد: {entry.therapist}\n"
+        return history_string
+    
+    def warm_connections(self):
+        """Open keep-alive connections to both providers ahead of the first request.
+        
+        Any HTTP answer (even 404 for the bare API root) leaves a TLS
+        connection in the pool. Neither request spends tokens.
+        """
+        if self.http_session is not None:
+            self.http_session.head(self.openai.api_base, timeout=5)
+        if self.warm_anthropic and hasattr(self.anthropic_client, "models"):
+            self.anthropic_client.models.list(limit=1)
+    
     def _generate_fallback_response(self, is_crisis: bool) -> str:
         """Generate fallback response when all services fail."""
         
-        if is_crisis:
-            return """أتفهم أنك تمر بوقت صعب جداً. من المهم أن تطلب المساعدة الفورية. 
-            يرجى الاتصال بخط المساعدة النفسية في عمان على الرقم 16262 أو التوجه إلى أقرب مستشفى."""
-        
-        return """أعتذر، أواجه صعوبة تقنية الآن. لكن أريدك أن تعرف أنني هنا لمساعدتك. 
-        كيف يمكنني أن أدعمك اليوم؟"""
+        return FALLBACK_RESPONSES["crisis" if is_crisis else "default"]
@@ -0,0 +1,303 @@
+"""Columnar log of completed turns for offline analysis.
+
+Each turn's transcript, emotion scores, crisis flag, reply model,
+validation outcome, token counts and per-stage latencies become one row.
+``record_turn`` only appends the row to an in-memory buffer; a background
+thread writes the buffer out as Parquet files every
+``analytics_flush_interval_s`` or ``analytics_batch_size`` rows, so the
+turn never waits on the disk. Files are partitioned by day:
+
+    data/analytics/day=2026-10-19/part-<time>-<id>.parquet
+
+If the writer falls behind, rows beyond ``analytics_max_buffered`` are
+dropped (and counted) rather than growing memory. The log holds
+transcripts, so keep it with the same access controls as the session
+database.
+
+``load_turns``, ``latency_report`` and ``crisis_report`` query the log:
+
+    python -m services.session_analytics --since 2026-10-01
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("stt", "emotion", "reply", "tts", "total")
+
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("timestamp", pa.timestamp("ms", tz="UTC")),
+        ("session_id", pa.string()),
+        ("success", pa.bool_()),
+        ("error", pa.string()),
+        ("cancelled", pa.bool_()),
+        ("transcription", pa.string()),
+        ("response_text", pa.string()),
+        ("emotions", pa.map_(pa.string(), pa.float32())),
+        ("crisis", pa.bool_()),
+        ("degradation", pa.string()),
+        ("model", pa.string()),
+        ("validation", pa.string()),
+        ("input_tokens", pa.int32()),
+        ("output_tokens", pa.int32()),
+    ] + [(f"{stage}_s", pa.float32()) for stage in STAGES])
+
+
+def turn_row(session_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """One log row from a ``SessionManager.process_voice_input`` result."""
+    timings = result.get("timings") or {}
+    tokens = result.get("tokens") or {}
+    return {
+        "timestamp": datetime.now(timezone.utc),
+        "session_id": session_id,
+        "success": bool(result.get("success")),
+        "error": result.get("error"),
+        "cancelled": bool(result.get("cancelled")),
+        "transcription": result.get("transcription"),
+        "response_text": result.get("response_text"),
+        "emotions": list((result.get("emotions") or {}).items()),
+        "crisis": bool(result.get("crisis")),
+        "degradation": result.get("degradation"),
+        "model": result.get("model"),
+        "validation": result.get("validation"),
+        "input_tokens": sum(usage["input"] for usage in tokens.values()),
+        "output_tokens": sum(usage["output"] for usage in tokens.values()),
+        **{f"{stage}_s": timings.get(stage) for stage in STAGES[:-1]},
+        "total_s": result.get("processing_time"),
+    }
+
+
+class AnalyticsWriter:
+    """Buffers turn rows and writes them to day partitions from a background thread."""
+
+    def __init__(self, directory: Optional[str] = None, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, max_buffered: Optional[int] = None):
+        self.directory = directory or CONFIG.analytics_dir
+        self.batch_size = batch_size or CONFIG.analytics_batch_size
+        self.flush_interval = flush_interval or CONFIG.analytics_flush_interval_s
+        self.max_buffered = max_buffered or CONFIG.analytics_max_buffered
+        self._rows: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.files = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+        self._thread = threading.Thread(target=self._run, name="session-analytics", daemon=True)
+        self._thread.start()
+
+    def record(self, row: Dict[str, Any]):
+        """Queue a row for the next flush; never blocks on I/O."""
+        with self._lock:
+            if len(self._rows) >= self.max_buffered:
+                self.dropped += 1
+                return
+            self._rows.append(row)
+            self.recorded += 1
+            full = len(self._rows) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write out the buffered rows, one file per day they fall on."""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return
+        started = time.perf_counter()
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            by_day: Dict[str, List[Dict[str, Any]]] = {}
+            for row in rows:
+                by_day.setdefault(row["timestamp"].strftime("%Y-%m-%d"), []).append(row)
+            schema = _schema()
+            for day, day_rows in by_day.items():
+                directory = os.path.join(self.directory, f"day={day}")
+                os.makedirs(directory, exist_ok=True)
+                name = f"part-{time.strftime('%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}.parquet"
+                table = pa.Table.from_pylist(day_rows, schema=schema)
+                pq.write_table(table, os.path.join(directory, name), compression="zstd")
+                self.files += 1
+            self.written += len(rows)
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.error(f"Error writing {len(rows)} analytics rows: {str(e)}")
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    def close(self):
+        """Stop the background thread and write out what is still buffered."""
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout=10)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buffered = len(self._rows)
+        return {
+            "buffered": buffered,
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "files": self.files,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+        }
+
+
+_writer: Optional[AnalyticsWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_analytics_writer() -> AnalyticsWriter:
+    """The process-wide writer, started on first use and flushed at exit."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AnalyticsWriter()
+            atexit.register(_writer.close)
+        return _writer
+
+
+def record_turn(session_id: str, result: Dict[str, Any]):
+    """Add a turn to the analytics log if it is enabled."""
+    if not CONFIG.analytics_enabled:
+        return
+    try:
+        get_analytics_writer().record(turn_row(session_id, result))
+    except Exception as e:
+        logger.error(f"Error recording turn analytics: {str(e)}")
+
+
+def analytics_stats() -> Dict[str, Any]:
+    """Rows buffered, written and dropped since startup."""
+    with _writer_lock:
+        writer = _writer
+    return writer.stats() if writer is not None else {"enabled": CONFIG.analytics_enabled}
+
+
+def load_turns(since: Optional[str] = None, until: Optional[str] = None,
+               columns: Optional[List[str]] = None, directory: Optional[str] = None):
+    """Logged turns from day ``since`` to day ``until`` (inclusive, YYYY-MM-DD) as a pyarrow Table.
+
+    Only the day partitions in range are read, and only ``columns``.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    directory = directory or CONFIG.analytics_dir
+    if not os.path.isdir(directory):
+        return _schema().empty_table() if columns is None else \
+            pa.schema([_schema().field(name) for name in columns]).empty_table()
+    partitioning = ds.partitioning(pa.schema([("day", pa.string())]), flavor="hive")
+    dataset = ds.dataset(directory, format="parquet", partitioning=partitioning)
+    condition = None
+    if since:
+        condition = ds.field("day") >= since
+    if until:
+        condition = ds.field("day") <= until if condition is None else condition & (ds.field("day") <= until)
+    return dataset.to_table(columns=columns, filter=condition)
+
+
+def _percentiles(column) -> Dict[str, Optional[float]]:
+    import pyarrow.compute as pc
+
+    values = column.drop_null()
+    if len(values) == 0:
+        return {"count": 0, "p50": None, "p90": None, "p99": None}
+    p50, p90, p99 = pc.quantile(values, q=[0.5, 0.9, 0.99]).to_pylist()
+    return {"count": len(values), "p50": round(p50, 3), "p90": round(p90, 3), "p99": round(p99, 3)}
+
+
+def latency_report(since: Optional[str] = None, until: Optional[str] = None,
+                   by: Optional[str] = None, directory: Optional[str] = None) -> Dict[str, Any]:
+    """p50/p90/p99 seconds per stage over successful turns, optionally per value of column ``by``."""
+    import pyarrow.compute as pc
+
+    columns = ["success"] + [f"{stage}_s" for stage in STAGES] + ([by] if by else [])
+    table = load_turns(since, until, columns, directory)
+    table = table.filter(pc.equal(table["success"], True))
+    groups = {"all": table}
+    if by:
+        for value in pc.unique(table[by]).to_pylist():
+            groups[str(value)] = table.filter(pc.is_null(table[by]) if value is None
+                                              else pc.equal(table[by], value))
+    return {name: {stage: _percentiles(group[f"{stage}_s"]) for stage in STAGES}
+            for name, group in groups.items()}
+
+
+def crisis_report(since: Optional[str] = None, until: Optional[str] = None,
+                  directory: Optional[str] = None) -> Dict[str, Any]:
+    """How often crisis language came up, per day, and how those turns were served."""
+    columns = ["day", "session_id", "crisis", "success", "degradation", "model", "validation", "total_s"]
+    rows = load_turns(since, until, columns, directory).to_pylist()
+    crisis = [row for row in rows if row["crisis"]]
+    per_day: Dict[str, Dict[str, int]] = {}
+    for row in rows:
+        day = per_day.setdefault(row["day"], {"turns": 0, "crisis_turns": 0})
+        day["turns"] += 1
+        day["crisis_turns"] += int(row["crisis"])
+
+    def count(key: str) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for row in crisis:
+            counts[str(row[key])] = counts.get(str(row[key]), 0) + 1
+        return counts
+
+    latencies = sorted(row["total_s"] for row in crisis if row["success"] and row["total_s"] is not None)
+    return {
+        "turns": len(rows),
+        "crisis_turns": len(crisis),
+        "crisis_share": round(len(crisis) / len(rows), 4) if rows else 0.0,
+        "sessions_with_crisis": len({row["session_id"] for row in crisis}),
+        "failed_crisis_turns": sum(1 for row in crisis if not row["success"]),
+        "crisis_p90_s": round(latencies[min(len(latencies) - 1, int(0.9 * len(latencies)))], 3)
+        if latencies else None,
+        "by_model": count("model"),
+        "by_validation": count("validation"),
+        "by_degradation": count("degradation"),
+        "per_day": dict(sorted(per_day.items())),
+    }
+
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Summarize the turn analytics log.")
+    parser.add_argument("--since", help="first day, YYYY-MM-DD")
+    parser.add_argument("--until", help="last day, YYYY-MM-DD")
+    parser.add_argument("--by", help="split latencies by this column, e.g. model or degradation")
+    parser.add_argument("--dir", default=None, help=f"log directory (default {CONFIG.analytics_dir})")
+    args = parser.parse_args()
+    print(json.dumps({
+        "latency": latency_report(args.since, args.until, args.by, args.dir),
+        "crisis": crisis_report(args.since, args.until, args.dir),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
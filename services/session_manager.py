@@ -2,97 +2,385 @@
 
 import time
 import logging
-from typing import Optional, Dict, Any
+import threading
+from typing import Optional, Dict, Any, Callable
 from services.stt_service import STTService
 from services.emotion_service import EmotionService
-from services.gpt_service import GPTService
+from services.gpt_service import FALLBACK_RESPONSES, GPTService
 from services.tts_service import TTSService
-from utils.text_utils import normalize_arabic_text
+from config import CONFIG
+from services.admission import CACHED_VOICE_NOTICE, AdmissionController, Degradation, get_admission_controller
+from utils.audio_buffer import AudioBuffer
+from utils.prosody import extract_prosody, fuse_emotions, prosody_emotions
+from utils.text_utils import detect_crisis_keywords, normalize_arabic_text
+from services.turn_prewarm import TurnPrewarm
+from utils.cancellation import CancellationToken, TurnCancelled, raise_if_cancelled
+from services.session_analytics import record_turn
+from services.turn_checkpoint import CheckpointStore, TurnCheckpoint, get_checkpoint_store
+from utils.cassette import Cassette, use_cassette
+from utils.logging_config import measure_logging
+from utils.token_usage import track_turn_tokens
 
 logger = logging.getLogger(__name__)
+# Per-stage progress lines; sampled down by default (CONFIG.log_sampling)
+stage_logger = logging.getLogger(f"{__name__}.stages")
+
+
+def new_result(**fields) -> Dict[str, Any]:
+    """The result of a turn that has not got anywhere yet."""
+    result = {
+        "success": False,
+        "transcription": None,
+        "emotions": None,
+        "response_text": None,
+        "audio_file": None,
+        "processing_time": 0,
+        "error": None,
+        "cancelled": False,
+        "audio_failed": False,
+        "prewarm_saved": {},
+        "degradation": None,
+        "prosody": None,
+        "crisis": False,
+        "model": None,
+        "validation": None,
+        "timings": {},
+        "turn_id": None,
+        "resumed": {"stages": [], "saved_s": 0.0, "deduplicated": False, "revoiced": False, "attempt": 1}
+    }
+    result.update(fields)
+    return result
+
 
 class SessionManager:
     """Manages the complete therapy session pipeline."""
     
-    def __init__(self):
-        self.stt_service = STTService()
-        self.emotion_service = EmotionService()
-        self.gpt_service = GPTService()
-        self.tts_service = TTSService()
+    def __init__(self,
+                 stt_service: Optional[STTService] = None,
+                 emotion_service: Optional[EmotionService] = None,
+                 gpt_service: Optional[GPTService] = None,
+                 tts_service: Optional[TTSService] = None,
+                 admission: Optional[AdmissionController] = None,
+                 checkpoints: Optional[CheckpointStore] = None):
+        # Services can be injected, e.g. simulated providers in benchmarks/load_test.py
+        self.stt_service = stt_service or STTService()
+        self.emotion_service = emotion_service or EmotionService()
+        self.gpt_service = gpt_service or GPTService()
+        self.tts_service = tts_service or TTSService()
+        # Shared by every session of the process, so it sees the whole load
+        self.admission = admission
+        if self.admission is None and CONFIG.admission_control:
+            self.admission = get_admission_controller()
+        self.checkpoints = checkpoints or get_checkpoint_store()
+        
+        # Canned replies and the cached-voice notice stay voiced when the admission
+        # controller only allows cached speech
+        precache = getattr(self.tts_service, "precache", None)
+        if precache is not None:
+            threading.Thread(target=precache, args=([*FALLBACK_RESPONSES.values(), CACHED_VOICE_NOTICE],),
+                             name="tts-precache", daemon=True).start()
+    
+    def prepare_turn(self, session_history: list) -> TurnPrewarm:
+        """End-of-speech hook: start everything that doesn't need the transcript.
+        
+        Call it as soon as the VAD decides the user stopped talking and pass
+        the result to ``process_voice_input``.
+        """
+        prewarm = TurnPrewarm()
+        warm_connections = getattr(self.gpt_service, "warm_connections", None)
+        if warm_connections is not None:
+            # Network round trips: never worth holding a pool thread or the turn for
+            prewarm.start_detached("connections", warm_connections)
+        for stage, service in (("emotion", self.emotion_service), ("tts", self.tts_service)):
+            warm = getattr(service, "warm", None)
+            if warm is not None:
+                prewarm.start(stage, warm)
+        return prewarm
+    
+    def process_voice_input(self,
+                            audio_bytes: bytes,
+                            session_history: list,
+                            on_event: Optional[Callable[[str, Any], None]] = None,
+                            cancel_token: Optional[CancellationToken] = None,
+                            prewarm: Optional[TurnPrewarm] = None,
+                            cassette: Optional[Cassette] = None,
+                            session_id: Optional[str] = None,
+                            turn_id: Optional[str] = None) -> Dict[str, Any]:
+        """Process complete voice input through the pipeline.
+        
+        ``on_event`` is called with ("transcript" | "emotion" | "response" | "audio", payload)
+        as soon as each stage finishes, so callers can stream partial results.
+        Before "audio" (the whole reply), "audio_segment" events carry the
+        reply's audio in order, piece by piece, as synthesis progresses.
+        Before "response", "response_partial" events carry the reply so far
+        while an unvalidated reply streams in; "response" may replace it.
+        Cancelling ``cancel_token`` stops the turn at the next stage checkpoint
+        and returns with ``cancelled`` set. Without a ``prewarm`` from
+        ``prepare_turn`` one is started here, overlapping with transcription.
+        ``result["logging"]`` holds the records this turn logged and the
+        time spent handing them to the log writer; ``result["tokens"]`` the
+        input and output tokens of its provider requests, per stage.
+        ``result["prosody"]`` holds the voice features fused into the
+        emotions, measured while the audio was transcribed.
+        ``result["degradation"]`` names the tier the admission controller
+        served the turn at (see services/admission.py).
+        ``result["timings"]`` has the seconds spent per stage, and
+        ``model``/``validation`` say how the reply was produced.
+        With a ``cassette`` (see ``session_cassette``) the turn's provider
+        calls, input audio and result are appended to it. With a
+        ``session_id`` the turn is added to the analytics log
+        (services/session_analytics.py).
+        
+        Stage outputs are checkpointed under ``result["turn_id"]`` (see
+        services/turn_checkpoint.py). Passing a ``turn_id`` again, or the
+        same audio again within ``session_id``, resumes that turn at its
+        first unfinished stage; ``result["resumed"]`` lists the stages
+        reused and the seconds they originally took. A turn whose reply
+        should have been voiced but got no audio succeeds with
+        ``audio_failed`` set and stays unfinished, so a retry only
+        synthesizes speech; the retry's ``resumed["revoiced"]`` says the
+        turn's text was already delivered and must not be stored again.
+        """
+        checkpoint = self.checkpoints.checkout(audio_bytes, turn_id, session_id)
+        with checkpoint.lock:
+            if checkpoint.result is not None:
+                return self._replay_completed(checkpoint, on_event)
+            audio_bytes = audio_bytes or checkpoint.audio_bytes or b""
+            return self._run_turn(audio_bytes, session_history, on_event, cancel_token, prewarm,
+                                  cassette, session_id, checkpoint)
+    
+    def retry_turn(self,
+                   turn_id: str,
+                   session_history: list,
+                   on_event: Optional[Callable[[str, Any], None]] = None,
+                   cancel_token: Optional[CancellationToken] = None,
+                   cassette: Optional[Cassette] = None,
+                   session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Run a failed or cancelled turn again from its first unfinished stage, without its audio."""
+        if self.checkpoints.get(turn_id) is None:
+            return new_result(turn_id=turn_id, error=f"Unknown or expired turn: {turn_id}")
+        return self.process_voice_input(b"", session_history, on_event, cancel_token,
+                                        cassette=cassette, session_id=session_id, turn_id=turn_id)
+    
+    def _replay_completed(self, checkpoint: TurnCheckpoint,
+                          on_event: Optional[Callable[[str, Any], None]]) -> Dict[str, Any]:
+        """Hand back a completed turn again, re-emitting its events, without running anything."""
+        result = dict(checkpoint.result)
+        stages = [stage for stage in checkpoint.outputs]
+        saved = checkpoint.saved_seconds(stages)
+        result["resumed"] = {"stages": stages, "saved_s": round(saved, 3), "deduplicated": True,
+                             "revoiced": False, "attempt": checkpoint.attempts}
+        result["processing_time"] = 0.0
+        self.checkpoints.count_reuse(stages, saved, deduplicated=True)
+        logger.info(f"Turn {checkpoint.turn_id} already completed; returning its result again")
+        if on_event:
+            for event, key in (("transcript", "transcription"), ("emotion", "emotions"),
+                               ("response", "response_text"), ("audio", "audio_file")):
+                if result.get(key) is not None:
+                    on_event(event, result[key])
+        return result
     
-    def process_voice_input(self, audio_bytes: bytes, session_history: list) -> Dict[str, Any]:
-        """Process complete voice input through the pipeline."""
+    def _run_turn(self, audio_bytes, session_history, on_event, cancel_token, prewarm,
+                  cassette, session_id, checkpoint: TurnCheckpoint) -> Dict[str, Any]:
+        degradation = self.admission.admit() if self.admission is not None else Degradation()
+        result = None
+        try:
+            with measure_logging() as log_overhead, track_turn_tokens() as tokens, use_cassette(cassette):
+                result = self._process_turn(audio_bytes, session_history, on_event, cancel_token, prewarm,
+                                            degradation, checkpoint)
+        finally:
+            if self.admission is not None:
+                completed = result is not None and result["success"]
+                self.admission.release(result["processing_time"] if completed else None)
+        reused = result["resumed"]["stages"]
+        self.checkpoints.count_reuse(reused, result["resumed"]["saved_s"], deduplicated=False)
+        if reused:
+            logger.info(f"Turn {checkpoint.turn_id} attempt {checkpoint.attempts} reused {reused}, "
+                        f"saving {result['resumed']['saved_s']:.2f} seconds")
+        result["logging"] = log_overhead
+        result["tokens"] = tokens
+        if result["success"]:
+            if result["audio_failed"]:
+                # The text went out; the checkpoint stays open so a retry only re-runs speech
+                checkpoint.delivered = True
+            else:
+                checkpoint.complete(result)
+        if session_id:
+            record_turn(session_id, result)
+        if cassette is not None:
+            try:
+                cassette.add_turn(audio_bytes, result)
+                cassette.flush()
+            except Exception as e:
+                logger.error(f"Error writing cassette: {str(e)}")
+        return result
+    
+    def _process_turn(self,
+                      audio_bytes: bytes,
+                      session_history: list,
+                      on_event: Optional[Callable[[str, Any], None]],
+                      cancel_token: Optional[CancellationToken],
+                      prewarm: Optional[TurnPrewarm],
+                      degradation: Degradation,
+                      checkpoint: TurnCheckpoint) -> Dict[str, Any]:
+        
+        def emit(event: str, payload: Any):
+            if on_event:
+                on_event(event, payload)
         
         start_time = time.time()
-        result = {
-            "success": False,
-            "transcription": None,
-            "emotions": None,
-            "response_text": None,
-            "audio_file": None,
-            "processing_time": 0,
-            "error": None
-        }
+        reused = []
+        result = new_result(degradation=degradation.name, turn_id=checkpoint.turn_id,
+                            resumed={"stages": reused, "saved_s": 0.0, "deduplicated": False,
+                                     "revoiced": checkpoint.delivered, "attempt": checkpoint.attempts})
+        
+        def reuse(stage: str) -> Optional[Dict[str, Any]]:
+            saved = checkpoint.get(stage)
+            if saved is not None:
+                reused.append(stage)
+                result["resumed"]["saved_s"] = round(checkpoint.saved_seconds(reused), 3)
+            return saved
+        
+        if prewarm is None:
+            prewarm = self.prepare_turn(session_history)
+        if CONFIG.prosody_enabled and checkpoint.get("emotion") is None:
+            # Voice cues need only the audio, so they are measured while it is transcribed
+            prewarm.start("prosody", lambda: extract_prosody(AudioBuffer.from_wav_bytes(audio_bytes)))
         
         try:
             # Step 1: Speech to Text
-            logger.info("Starting transcription...")
-            transcribe_start_time = time.time() # Add this
-            transcription = self.stt_service.transcribe_audio(audio_bytes)
-            
-            if not transcription:
-                result["error"] = "Failed to transcribe audio"
-                return result
+            saved = reuse("stt")
+            if saved is not None:
+                transcription = saved["transcription"]
+            else:
+                stage_logger.info("Starting transcription...")
+                transcribe_start_time = time.time() # Add this
+                transcription = self.stt_service.transcribe_audio(audio_bytes, cancel_token)
+                
+                if not transcription:
+                    result["error"] = "Failed to transcribe audio"
+                    return result
+                
+                stage_logger.info(f"Transcription completed: {transcription[:50]}...")
+                transcribe_end_time = time.time()
+                logger.info(f"Transcription took: {transcribe_end_time - transcribe_start_time:.2f} seconds.")
+                result["timings"]["stt"] = transcribe_end_time - transcribe_start_time
+                checkpoint.save("stt", result["timings"]["stt"], transcription=transcription)
             
             result["transcription"] = transcription
-            logger.info(f"Transcription completed: {transcription[:50]}...")
-            transcribe_end_time = time.time()
-            logger.info(f"Transcription took: {transcribe_end_time - transcribe_start_time:.2f} seconds.")
+            emit("transcript", transcription)
+            
+            result["crisis"] = detect_crisis_keywords(transcription, CONFIG.crisis_keywords)
+            if degradation.tier and result["crisis"]:
+                degradation = self.admission.crisis_override(degradation)
+                result["degradation"] = degradation.name
             
             # Step 2: Emotion Detection
-            logger.info("Detecting emotions...")
-            normalized_text = normalize_arabic_text(transcription)
-            emotions = self.emotion_service.detect_emotion(normalized_text)
+            saved = reuse("emotion")
+            if saved is not None:
+                emotions = saved["emotions"]
+                result["prosody"] = saved["prosody"]
+            else:
+                stage_logger.info("Detecting emotions...")
+                emotion_start_time = time.time()
+                normalized_text = normalize_arabic_text(transcription)
+                prewarm.consume("emotion", wait=False)
+                emotions = self.emotion_service.detect_emotion(normalized_text, cancel_token)
+                prosody = None
+                if CONFIG.prosody_enabled:
+                    prosody = prewarm.consume(
+                        "prosody", wait=False,
+                        fallback=lambda: extract_prosody(AudioBuffer.from_wav_bytes(audio_bytes)))
+                if prosody is not None:
+                    emotions = fuse_emotions(emotions, prosody_emotions(prosody))
+                    result["prosody"] = prosody._asdict()
+                result["timings"]["emotion"] = time.time() - emotion_start_time
+                checkpoint.save("emotion", result["timings"]["emotion"], emotions=emotions,
+                                prosody=result["prosody"])
             result["emotions"] = emotions
+            emit("emotion", emotions)
             
             primary_emotion = max(emotions, key=emotions.get)
-            logger.info(f"Primary emotion detected: {primary_emotion}")
+            stage_logger.info(f"Primary emotion detected: {primary_emotion}")
             
             # Step 3: Generate Therapeutic Response
-            logger.info("Generating therapeutic response...")
-            gpt_start_time = time.time()
-            response_text = self.gpt_service.generate_therapeutic_response(
-                transcription, session_history, emotions
-            )
-            
-            if not response_text:
-                result["error"] = "Failed to generate response"
-                return result
+            saved = reuse("reply")
+            if saved is not None:
+                response_text = saved["response_text"]
+                result["model"] = saved["model"]
+                result["validation"] = saved["validation"]
+            else:
+                stage_logger.info("Generating therapeutic response...")
+                gpt_start_time = time.time()
+                outcome = {}
+                response_text = self.gpt_service.generate_therapeutic_response(
+                    transcription, session_history, emotions, cancel_token,
+                    validate=degradation.validate, max_sentences=degradation.max_sentences, outcome=outcome,
+                    on_partial=lambda text: emit("response_partial", text)
+                )
+                result["model"] = outcome.get("model")
+                result["validation"] = outcome.get("validation")
+                result["timings"]["reply"] = time.time() - gpt_start_time
+                
+                if not response_text:
+                    result["error"] = "Failed to generate response"
+                    return result
+                
+                stage_logger.info(f"Response generated: {response_text[:50]}...")
+                gpt_end_time = time.time()
+                logger.info(f"GPT response generation took: {gpt_end_time - gpt_start_time:.2f} seconds.")
+                checkpoint.save("reply", result["timings"]["reply"], response_text=response_text,
+                                model=result["model"], validation=result["validation"])
             
             result["response_text"] = response_text
-            logger.info(f"Response generated: {response_text[:50]}...")
-            gpt_end_time = time.time()
-            logger.info(f"GPT response generation took: {gpt_end_time - gpt_start_time:.2f} seconds.")
+            emit("response", response_text)
             
             # Step 4: Text to Speech
-            logger.info("Synthesizing speech...")
-            synth_start_time = time.time()
-            wav_output = self.tts_service.synthesize_speech(response_text)
+            saved = reuse("tts")
+            if saved is not None:
+                audio = saved["audio"]
+            else:
+                stage_logger.info("Synthesizing speech...")
+                synth_start_time = time.time()
+                raise_if_cancelled(cancel_token, "tts")
+                audio = None
+                if degradation.voice != "none":
+                    prewarm.consume("tts", wait=False)
+                    audio = self.tts_service.synthesize_speech(
+                        response_text, cancel_token, on_segment=lambda segment: emit("audio_segment", segment),
+                        cached_only=degradation.voice == "cached", cached_filler=CACHED_VOICE_NOTICE
+                    )
+                synth_end_time = time.time()
+                logger.info(f"Synthesizing took: {synth_end_time - synth_start_time:.2f} seconds.")
+                result["timings"]["tts"] = synth_end_time - synth_start_time
+                if audio is not None:
+                    checkpoint.save("tts", result["timings"]["tts"], audio=audio)
             
-            # result["audio_file"] = audio_file
-            result["audio_file"] = wav_output
+            # AudioBuffer (float32 samples + sample rate), or None if synthesis failed
+            result["audio_file"] = audio
+            # Short of the cache at the cached_voice tier is load shedding, not a failure
+            result["audio_failed"] = audio is None and degradation.voice == "model"
+            if audio is not None:
+                emit("audio", audio)
             result["success"] = True
-            synth_end_time = time.time()
-            logger.info(f"Synthesizing took: {synth_end_time - synth_start_time:.2f} seconds.")
             
             # Calculate processing time
             processing_time = time.time() - start_time
             result["processing_time"] = processing_time
+            result["prewarm_saved"] = prewarm.savings()
             
-            logger.info(f"Pipeline completed successfully in {processing_time:.2f} seconds")
+            logger.info(f"Pipeline completed successfully in {processing_time:.2f} seconds "
+                        f"(prewarm saved {result['prewarm_saved']})")
             
             return result
             
+        except TurnCancelled as e:
+            logger.info(f"Pipeline cancelled during {e}")
+            result["cancelled"] = True
+            result["error"] = "cancelled"
+            result["processing_time"] = time.time() - start_time
+            return result
+            
         except Exception as e:
             logger.error(f"Error in pipeline: {str(e)}")
             result["error"] = str(e)
@@ -0,0 +1,338 @@
+"""Durable, bounded storage for therapy session turns."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import CONFIG
+from services.turn_record import Turn, memory_report
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(ABC):
+    """Append-only turn log per session with TTL expiry.
+
+    Turns are numbered from 1 within a session; that number doubles as the
+    cursor for paging backwards through older turns.
+    """
+
+    @abstractmethod
+    def create_session(self) -> str:
+        ...
+
+    @abstractmethod
+    def session_exists(self, session_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def append_turn(self, session_id: str, turn: Turn) -> int:
+        """Append a turn and return its sequence number."""
+
+    @abstractmethod
+    def recent_turns(self, session_id: str,
+                     limit: Optional[int] = None,
+                     before: Optional[int] = None) -> Tuple[List[Turn], Optional[int]]:
+        """Return up to ``limit`` turns older than ``before``, oldest first.
+
+        The second value is the cursor for the next older page, or None when
+        the start of the session has been reached. Turns are shared with the
+        store and must be treated as read-only.
+        """
+
+    @abstractmethod
+    def delete_session(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def expire_sessions(self) -> int:
+        """Drop sessions idle for longer than the TTL; returns how many were removed."""
+
+    def history(self, session_id: str) -> List[Turn]:
+        """The recent turns used as conversation context."""
+        turns, _ = self.recent_turns(session_id, CONFIG.session_history_window)
+        return turns
+
+    @abstractmethod
+    def memory_report(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Memory held in this process, for one session or the whole store."""
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store, mainly for tests and single-user runs."""
+
+    def __init__(self, ttl: Optional[float] = None, max_sessions: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else CONFIG.session_ttl_seconds
+        self.max_sessions = max_sessions or CONFIG.session_max_cached
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create_session(self) -> str:
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = {"turns": [], "last_active": time.time()}
+            while len(self._sessions) > self.max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                logger.info(f"Evicted least recently used session {evicted}")
+        return session_id
+
+    def _get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if time.time() - session["last_active"] > self.ttl:
+            del self._sessions[session_id]
+            return None
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def session_exists(self, session_id: str) -> bool:
+        with self._lock:
+            return self._get(session_id) is not None
+
+    def append_turn(self, session_id: str, turn: Turn) -> int:
+        with self._lock:
+            session = self._get(session_id)
+            if session is None:
+                raise KeyError(f"Unknown or expired session: {session_id}")
+            session["turns"].append(turn)
+            session["last_active"] = time.time()
+            return len(session["turns"])
+
+    def recent_turns(self, session_id, limit=None, before=None):
+        with self._lock:
+            session = self._get(session_id)
+            if session is None:
+                return [], None
+            end = len(session["turns"]) if before is None else max(0, before - 1)
+            start = 0 if limit is None else max(0, end - limit)
+            page = session["turns"][start:end]
+        return page, (start + 1 if start > 0 else None)
+
+    def delete_session(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def expire_sessions(self) -> int:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [sid for sid, s in self._sessions.items() if s["last_active"] < cutoff]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+
+    def memory_report(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            if session_id is not None:
+                session = self._sessions.get(session_id)
+                report = memory_report(session["turns"] if session else [])
+            else:
+                report = memory_report(turn for session in self._sessions.values()
+                                       for turn in session["turns"])
+            report["sessions"] = 1 if session_id is not None else len(self._sessions)
+        return report
+
+
+class SQLiteSessionStore(SessionStore):
+    """Embedded SQLite store in WAL mode, shareable between worker processes.
+
+    Only the last ``session_history_window`` turns of the most recently used
+    ``session_max_cached`` sessions are kept in memory; everything else lives
+    on disk, so an idle session costs no memory.
+    """
+
+    def __init__(self, path: Optional[str] = None,
+                 ttl: Optional[float] = None,
+                 max_cached: Optional[int] = None):
+        self.path = path or CONFIG.session_db_path
+        self.ttl = ttl if ttl is not None else CONFIG.session_ttl_seconds
+        self.max_cached = max_cached or CONFIG.session_max_cached
+        self._local = threading.local()
+        self._cache: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                last_active REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS turns (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                user_text TEXT NOT NULL,
+                therapist_text TEXT NOT NULL,
+                emotions TEXT,
+                timestamp REAL NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions (last_active);
+        """)
+        connection.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _cache_put(self, session_id: str, turns: deque):
+        self._cache[session_id] = turns
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def create_session(self) -> str:
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT INTO sessions (session_id, created_at, last_active) VALUES (?, ?, ?)",
+                (session_id, now, now))
+        return session_id
+
+    def session_exists(self, session_id: str) -> bool:
+        row = self._connection().execute(
+            "SELECT last_active FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl
+
+    def append_turn(self, session_id: str, turn: Turn) -> int:
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            updated = connection.execute(
+                "UPDATE sessions SET last_active = ? WHERE session_id = ? AND last_active >= ?",
+                (now, session_id, now - self.ttl)).rowcount
+            if not updated:
+                raise KeyError(f"Unknown or expired session: {session_id}")
+            seq = connection.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM turns WHERE session_id = ?",
+                (session_id,)).fetchone()[0]
+            connection.execute(
+                "INSERT INTO turns (session_id, seq, user_text, therapist_text, emotions, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, seq, turn.user, turn.therapist,
+                 json.dumps(turn.emotions) if turn.scores is not None else None, turn.timestamp))
+
+        with self._lock:
+            cached = self._cache.get(session_id)
+            if cached is not None:
+                if (cached[-1][0] if cached else 0) == seq - 1:
+                    cached.append((seq, turn))
+                    self._cache.move_to_end(session_id)
+                else:
+                    # Another worker appended in between; reload on the next read
+                    del self._cache[session_id]
+        return seq
+
+    def _load(self, session_id: str, limit: Optional[int], before: Optional[int]) -> list:
+        query = ("SELECT seq, user_text, therapist_text, emotions, timestamp "
+                 "FROM turns WHERE session_id = ?")
+        params: list = [session_id]
+        if before is not None:
+            query += " AND seq < ?"
+            params.append(before)
+        query += " ORDER BY seq DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = self._connection().execute(query, params).fetchall()
+        return [(seq, Turn(user, therapist, json.loads(emotions) if emotions else None, timestamp))
+                for seq, user, therapist, emotions, timestamp in reversed(rows)]
+
+    def recent_turns(self, session_id, limit=None, before=None):
+        window = CONFIG.session_history_window
+        cacheable = before is None and limit is not None and limit <= window
+
+        rows = None
+        if cacheable:
+            # Another worker may have appended since we cached; the primary key
+            # lookup is far cheaper than reloading and decoding the window
+            latest = self._connection().execute(
+                "SELECT MAX(seq) FROM turns WHERE session_id = ?", (session_id,)).fetchone()[0]
+            with self._lock:
+                cached = self._cache.get(session_id)
+                if cached is not None and (cached[-1][0] if cached else None) == latest:
+                    self._cache.move_to_end(session_id)
+                    rows = list(cached)[-limit:]
+        if rows is None:
+            if cacheable:
+                window_rows = self._load(session_id, window, None)
+                with self._lock:
+                    self._cache_put(session_id, deque(window_rows, maxlen=window))
+                rows = window_rows[-limit:]
+            else:
+                rows = self._load(session_id, limit, before)
+
+        turns = [turn for _, turn in rows]
+        next_cursor = rows[0][0] if rows and rows[0][0] > 1 else None
+        return turns, next_cursor
+
+    def delete_session(self, session_id: str):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def expire_sessions(self) -> int:
+        cutoff = time.time() - self.ttl
+        connection = self._connection()
+        with connection:
+            expired = [row[0] for row in connection.execute(
+                "SELECT session_id FROM sessions WHERE last_active < ?", (cutoff,))]
+            connection.executemany("DELETE FROM turns WHERE session_id = ?",
+                                   [(sid,) for sid in expired])
+            connection.executemany("DELETE FROM sessions WHERE session_id = ?",
+                                   [(sid,) for sid in expired])
+        with self._lock:
+            for session_id in expired:
+                self._cache.pop(session_id, None)
+        if expired:
+            logger.info(f"Expired {len(expired)} idle sessions")
+        return len(expired)
+
+    def memory_report(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            if session_id is not None:
+                cached = self._cache.get(session_id, ())
+                report = memory_report(turn for _, turn in cached)
+                report["cached"] = session_id in self._cache
+            else:
+                report = memory_report(turn for cached in self._cache.values() for _, turn in cached)
+                report["cached_sessions"] = len(self._cache)
+        return report
+
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Return the process-wide store for the configured backend."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if CONFIG.session_store_backend == "memory":
+                _store = InMemorySessionStore()
+            else:
+                _store = SQLiteSessionStore()
+            _store.expire_sessions()
+        return _store
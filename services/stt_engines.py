@@ -0,0 +1,241 @@
+"""Speech-to-text engines behind a common interface.
+
+``STTService`` tries the engines listed in ``CONFIG.stt_engines`` in order,
+so a provider outage falls back to the local model (or the other way round).
+"""
+
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from config import CONFIG
+from utils.audio_buffer import AudioBuffer
+from utils.cancellation import CancellationToken, raise_if_cancelled, run_cancellable
+from utils.cassette import recording_openai
+from utils.circuit_breaker import get_circuit_breaker
+from utils.rate_limiter import get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+class STTEngine(ABC):
+    """Transcribes one utterance; raises on failure so the caller can fall back."""
+
+    name = "base"
+
+    @abstractmethod
+    def transcribe(self, audio: AudioBuffer,
+                   cancel_token: Optional[CancellationToken] = None) -> str:
+        """``audio`` is already at ``CONFIG.stt_sample_rate``."""
+
+
+class OpenAIWhisperEngine(STTEngine):
+    """OpenAI's hosted Whisper API."""
+
+    name = "openai"
+
+    def __init__(self, openai_module=None):
+        if openai_module is None:
+            import openai as openai_module
+
+        self.openai = recording_openai(openai_module)
+        self.openai.api_key = CONFIG.openai_api_key
+        self.limiter = get_rate_limiter("whisper")
+        # While open, STTService moves straight on to the next engine
+        self.breaker = get_circuit_breaker("openai.transcribe")
+
+    def transcribe(self, audio: AudioBuffer,
+                   cancel_token: Optional[CancellationToken] = None) -> str:
+        # Create temporary file for audio
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
+            temp_file.write(audio.to_wav_bytes())
+            temp_file_path = temp_file.name
+
+        try:
+            with open(temp_file_path, 'rb') as audio_file:
+                def request():
+                    # Rewind so a throttled upload can be retried
+                    audio_file.seek(0)
+                    return self.openai.Audio.transcribe(
+                        model=CONFIG.whisper_model,
+                        file=audio_file,
+                        language="ar"  # Arabic
+                    )
+                response = self.limiter.call(request, cancel_token=cancel_token, breaker=self.breaker)
+            return response.get('text', '').strip()
+        finally:
+            # Clean up temporary file
+            os.unlink(temp_file_path)
+
+
+class _LocalWhisperModel:
+    """One quantized Whisper model per process, fed by a micro-batching thread.
+
+    Requests from all sessions queue up here; the worker waits up to
+    ``local_stt_batch_wait_ms`` for more requests and transcribes up to
+    ``local_stt_batch_size`` utterances in a single ``generate`` call.
+    """
+
+    def __init__(self, model_name: str):
+        import torch
+        from transformers import WhisperForConditionalGeneration, WhisperProcessor
+
+        self.torch = torch
+        if CONFIG.local_stt_threads:
+            torch.set_num_threads(CONFIG.local_stt_threads)
+
+        started = time.time()
+        self.processor = WhisperProcessor.from_pretrained(model_name)
+        model = WhisperForConditionalGeneration.from_pretrained(model_name)
+        model.eval()
+        if CONFIG.local_stt_quantize:
+            # int8 weights for the Linear layers, which dominate CPU inference time
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.prompt_ids = self.processor.get_decoder_prompt_ids(language="arabic", task="transcribe")
+        logger.info(f"Local Whisper model loaded: {model_name} in {time.time() - started:.1f}s "
+                    f"(int8: {CONFIG.local_stt_quantize})")
+
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.batched_requests = 0
+        self.worker = threading.Thread(target=self._run, name="local-whisper", daemon=True)
+        self.worker.start()
+
+    def submit(self, samples: np.ndarray) -> Future:
+        future = Future()
+        self.requests.put((samples, future))
+        return future
+
+    def _next_batch(self) -> list:
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + CONFIG.local_stt_batch_wait_ms / 1000
+        while len(batch) < CONFIG.local_stt_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Requests whose turn was cancelled while queued are skipped
+        return [(samples, future) for samples, future in batch if future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                texts = self._transcribe_batch([samples for samples, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.batched_requests += len(batch)
+            for (_, future), text in zip(batch, texts):
+                future.set_result(text)
+
+    def _transcribe_batch(self, utterances: List[np.ndarray]) -> List[str]:
+        features = self.processor(utterances, sampling_rate=CONFIG.stt_sample_rate,
+                                  return_tensors="pt").input_features
+        with self.torch.inference_mode():
+            tokens = self.model.generate(features, forced_decoder_ids=self.prompt_ids)
+        return [text.strip() for text in self.processor.batch_decode(tokens, skip_special_tokens=True)]
+
+
+_local_models: Dict[str, _LocalWhisperModel] = {}
+_local_models_lock = threading.Lock()
+
+
+def get_local_whisper(model_name: Optional[str] = None) -> _LocalWhisperModel:
+    """Return the process-wide local Whisper model, loading it on first use."""
+    model_name = model_name or CONFIG.local_whisper_model
+    with _local_models_lock:
+        if model_name not in _local_models:
+            _local_models[model_name] = _LocalWhisperModel(model_name)
+        return _local_models[model_name]
+
+
+class LocalWhisperEngine(STTEngine):
+    """Whisper running on the CPU in this process (transformers, int8 dynamic quantization)."""
+
+    name = "local"
+
+    def __init__(self, model_name: Optional[str] = None):
+        # Loaded on first use, so listing the engine only as a fallback costs nothing
+        self.model_name = model_name
+
+    def transcribe(self, audio: AudioBuffer,
+                   cancel_token: Optional[CancellationToken] = None) -> str:
+        future = get_local_whisper(self.model_name).submit(audio.samples)
+        try:
+            return run_cancellable(future.result, cancel_token, "stt")
+        finally:
+            future.cancel()
+
+
+class StaticSTTEngine(STTEngine):
+    """Test double that returns canned transcripts without any model or network.
+
+    ``transcripts`` is a single string, a sequence used in rotation, or a
+    callable receiving the audio. ``fail`` makes every call raise, to
+    exercise the fallback order.
+    """
+
+    name = "static"
+
+    def __init__(self, transcripts: Union[str, Sequence[str], Callable[[AudioBuffer], str]] = "",
+                 delay: float = 0.0, fail: bool = False):
+        self.transcripts = transcripts
+        self.delay = delay
+        self.fail = fail
+        self.calls: List[AudioBuffer] = []
+        self._lock = threading.Lock()
+
+    def transcribe(self, audio: AudioBuffer,
+                   cancel_token: Optional[CancellationToken] = None) -> str:
+        with self._lock:
+            self.calls.append(audio)
+            index = len(self.calls) - 1
+        if self.delay and cancel_token is not None and cancel_token.wait(self.delay):
+            raise_if_cancelled(cancel_token, "stt")
+        elif self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("static STT engine configured to fail")
+        if callable(self.transcripts):
+            return self.transcripts(audio)
+        if isinstance(self.transcripts, str):
+            return self.transcripts
+        return self.transcripts[index % len(self.transcripts)]
+
+
+ENGINES = {
+    OpenAIWhisperEngine.name: OpenAIWhisperEngine,
+    LocalWhisperEngine.name: LocalWhisperEngine,
+    StaticSTTEngine.name: StaticSTTEngine,
+}
+
+
+def create_stt_engines(names: Optional[Sequence[str]] = None) -> List[STTEngine]:
+    """Instantiate engines in fallback order, skipping ones that fail to load."""
+    engines = []
+    for name in names or CONFIG.stt_engines:
+        if name not in ENGINES:
+            logger.error(f"Unknown STT engine: {name}")
+            continue
+        try:
+            engines.append(ENGINES[name]())
+        except Exception as e:
+            logger.error(f"Error loading STT engine {name}: {str(e)}")
+    return engines
@@ -1,46 +1,51 @@
-"""Speech-to-Text service using OpenAI Whisper."""
+"""Speech-to-Text service over pluggable engines (OpenAI Whisper API, local Whisper)."""
 
-import openai
 import logging
-from typing import Optional
-import tempfile
-import os
+from typing import List, Optional
 from config import CONFIG
+from services.stt_engines import STTEngine, create_stt_engines
+from utils.audio_buffer import AudioBuffer
+from utils.cancellation import CancellationToken, raise_if_cancelled
 
 logger = logging.getLogger(__name__)
 
 class STTService:
-    """Speech-to-Text service using OpenAI Whisper."""
+    """Speech-to-Text service that falls back through the configured engines."""
     
-    def __init__(self):
-        openai.api_key = CONFIG.openai_api_key
+    def __init__(self, engines: Optional[List[STTEngine]] = None):
+        self.engines = engines if engines is not None else create_stt_engines()
+        if not self.engines:
+            logger.error("No STT engine could be loaded")
+        self.last_engine = None
     
-    def transcribe_audio(self, audio_bytes: bytes) -> Optional[str]:
-        """Transcribe audio bytes to text using Whisper."""
+    def transcribe_audio(self, audio_bytes: bytes,
+                         cancel_token: Optional[CancellationToken] = None) -> Optional[str]:
+        """Transcribe WAV bytes to text with the first engine that succeeds.
+
+        An empty transcript counts as a miss: a model that heard nothing
+        (or a hosted API returning a blank result) should not keep the next
+        engine from trying.
+        """
         try:
-            # Create temporary file for audio
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-                temp_file.write(audio_bytes)
-                temp_file_path = temp_file.name
-            
-            try:
-                # Transcribe using OpenAI Whisper
-                with open(temp_file_path, 'rb') as audio_file:
-                    response = openai.Audio.transcribe(
-                        model=CONFIG.whisper_model,
-                        file=audio_file,
-                        language="ar"  # Arabic
-                    )
-                
-                transcription = response.get('text', '').strip()
-                logger.info(f"Transcription successful: {transcription[:100]}...")
-                
-                return transcription
-                
-            finally:
-                # Clean up temporary file
-                os.unlink(temp_file_path)
-                
+            # Every engine works at Whisper's native rate
+            audio = AudioBuffer.from_wav_bytes(audio_bytes).resample(CONFIG.stt_sample_rate)
         except Exception as e:
-            logger.error(f"Error in transcription: {str(e)}")
-            return None
\ No newline at end of file
+            logger.error(f"Error decoding audio for transcription: {str(e)}")
+            return None
+        
+        for engine in self.engines:
+            raise_if_cancelled(cancel_token, "stt")
+            try:
+                transcription = engine.transcribe(audio, cancel_token)
+            except Exception as e:
+                logger.error(f"Error in transcription with the {engine.name} engine: {str(e)}")
+                continue
+            if not transcription or not transcription.strip():
+                logger.warning(f"Empty transcription from the {engine.name} engine")
+                continue
+            
+            self.last_engine = engine.name
+            logger.info(f"Transcription successful ({engine.name}): {transcription[:100]}...")
+            return transcription
+        
+        return None
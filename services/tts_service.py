@@ -1,14 +1,25 @@
 """Text-to-Speech service using Coqui XTTS v2."""
 
 import torch
+import numpy as np
 from TTS.api import TTS
+import copy
 import logging
 import tempfile
 import os
-from typing import Optional
+import queue
+import threading
+import weakref
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, NamedTuple, Optional
 from config import CONFIG
 import time
 import streamlit as st
+from utils.audio_buffer import AudioBuffer
+from utils.cancellation import CancellationToken, raise_if_cancelled, run_cancellable
+from utils.speech_segments import SegmentJoiner, normalize_loudness, plan_segments
 
 
 from TTS.tts.configs.xtts_config import XttsConfig
@@ -31,24 +42,221 @@ else:
 
 logger = logging.getLogger(__name__)
 
+# Segments of all turns in the process share these workers
+_synthesis_pool = ThreadPoolExecutor(max_workers=CONFIG.tts_workers, thread_name_prefix="tts")
+_queued_segments = 0  # submitted to the pool and not finished yet
+_queue_lock = threading.Lock()
+
+# Copies of each loaded model, keyed by the model load_tts_model shares between services
+_model_pools: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_model_pools_lock = threading.Lock()
+
+
+class _ModelPool:
+    """Up to ``CONFIG.tts_workers`` instances of one TTS model, each running one segment at a time.
+
+    XTTS keeps per-call state on the model (the GPT prefix embedding), so
+    two inferences must not share an instance. The first instance is the
+    loaded model; when a segment finds none free, another one is loaded in
+    the background with ``factory`` (or, without one, deep-copied from an
+    idle instance) and the segment takes whichever instance is free first.
+    """
+
+    def __init__(self, model, factory: Optional[Callable[[], object]] = None):
+        self.factory = factory
+        self.free = queue.Queue()
+        self.free.put(model)
+        self.size = 1  # instances loaded or loading
+        self.grow_failed = False
+        self.lock = threading.Lock()
+
+    def _grow(self):
+        with self.lock:
+            if self.grow_failed or self.size >= max(1, CONFIG.tts_workers):
+                return
+            self.size += 1
+
+        def load():
+            try:
+                if self.factory is not None:
+                    model = self.factory()
+                else:
+                    source = self.free.get()
+                    try:
+                        model = copy.deepcopy(source)
+                    finally:
+                        self.free.put(source)
+            except Exception as e:
+                with self.lock:
+                    self.size -= 1
+                    self.grow_failed = True
+                logger.warning(f"Could not load another TTS model; segments share {self.size}: {str(e)}")
+                return
+            logger.info(f"TTS model instance {self.size} of {CONFIG.tts_workers} ready")
+            self.free.put(model)
+
+        threading.Thread(target=load, name="tts-model-load", daemon=True).start()
+
+    def fill(self):
+        """Start loading instances up to ``CONFIG.tts_workers`` ahead of use."""
+        for _ in range(max(1, CONFIG.tts_workers) - self.size):
+            self._grow()
+
+    @contextmanager
+    def checkout(self):
+        try:
+            model = self.free.get_nowait()
+        except queue.Empty:
+            self._grow()
+            model = self.free.get()
+        try:
+            yield model
+        finally:
+            self.free.put(model)
+
+
+def _model_pool(model, factory: Optional[Callable[[], object]] = None) -> _ModelPool:
+    with _model_pools_lock:
+        pool = _model_pools.get(model)
+        if pool is None:
+            pool = _model_pools[model] = _ModelPool(model, factory)
+        return pool
+
+# Loudness-normalized audio per (voice file, segment text). Precached
+# phrases are pinned; other segments are kept least-recently-used.
+_segment_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+_pinned_segments = {}
+_cache_lock = threading.Lock()
+
+
+def tts_queue_depth() -> int:
+    """Segments of all turns waiting for or being synthesized."""
+    with _queue_lock:
+        return _queued_segments
+
+
+def _submit_segment(fn: Callable[[str], np.ndarray], segment: str):
+    global _queued_segments
+    with _queue_lock:
+        _queued_segments += 1
+
+    def finished(_):
+        global _queued_segments
+        with _queue_lock:
+            _queued_segments -= 1
+
+    future = _synthesis_pool.submit(fn, segment)
+    future.add_done_callback(finished)
+    return future
+
+
+def _cached_segment(key: tuple) -> Optional[np.ndarray]:
+    with _cache_lock:
+        if key in _pinned_segments:
+            return _pinned_segments[key]
+        wav = _segment_cache.get(key)
+        if wav is not None:
+            _segment_cache.move_to_end(key)
+        return wav
+
+
+def _cache_segment(key: tuple, wav: np.ndarray, pin: bool = False):
+    with _cache_lock:
+        if pin:
+            _pinned_segments[key] = wav
+            return
+        if CONFIG.tts_cache_segments <= 0:
+            return
+        _segment_cache[key] = wav
+        _segment_cache.move_to_end(key)
+        while len(_segment_cache) > CONFIG.tts_cache_segments:
+            _segment_cache.popitem(last=False)
+
+
+class CPUProfile(NamedTuple):
+    """How XTTS is prepared when it runs on the CPU (the ``tts_cpu_*`` settings)."""
+
+    threads: int = 0  # intra-op threads; 0 keeps torch's default
+    interop_threads: int = 0  # inter-op threads; 0 keeps torch's default
+    quantize: bool = False  # dynamic int8 weights for the autoregressive GPT
+    compile: str = "none"  # vocoder: "none", "compile" (torch.compile) or "script" (TorchScript)
+    inference_mode: bool = True  # torch.inference_mode instead of no_grad around synthesis
+
+    @classmethod
+    def from_config(cls) -> "CPUProfile":
+        return cls(CONFIG.tts_cpu_threads, CONFIG.tts_cpu_interop_threads, CONFIG.tts_cpu_quantize,
+                   CONFIG.tts_cpu_compile, CONFIG.tts_inference_mode)
+
+
+def _configure_threads(profile: CPUProfile):
+    # Process-wide: the local Whisper engine shares these threads
+    if profile.threads:
+        torch.set_num_threads(profile.threads)
+    if profile.interop_threads and torch.get_num_interop_threads() != profile.interop_threads:
+        try:
+            torch.set_num_interop_threads(profile.interop_threads)
+        except RuntimeError as e:
+            # Only possible before the first parallel work in the process
+            logger.warning(f"Inter-op threads stay at {torch.get_num_interop_threads()}: {str(e)}")
+
+
+def _conv1d_to_linear(module: torch.nn.Module):
+    """Replace transformers' GPT-2 ``Conv1D`` layers, which dynamic quantization skips, with ``Linear``."""
+    for name, child in module.named_children():
+        if type(child).__name__ == "Conv1D" and hasattr(child, "nf"):
+            # Conv1D stores its weight as (in, out), the transpose of Linear's
+            linear = torch.nn.Linear(child.weight.shape[0], child.nf)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
+
+
+def _apply_cpu_profile(xtts, profile: CPUProfile):
+    """Quantize the GPT and compile the vocoder of a loaded XTTS model, as the profile asks."""
+    if profile.quantize and hasattr(xtts, "gpt"):
+        _conv1d_to_linear(xtts.gpt)
+        # In place, so the inference wrapper that shares these layers gets them too
+        torch.quantization.quantize_dynamic(xtts.gpt, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    if profile.compile != "none" and hasattr(xtts, "hifigan_decoder"):
+        try:
+            if profile.compile == "compile":
+                xtts.hifigan_decoder = torch.compile(xtts.hifigan_decoder, dynamic=True)
+            else:
+                xtts.hifigan_decoder = torch.jit.script(xtts.hifigan_decoder)
+        except Exception as e:
+            logger.warning(f"Vocoder {profile.compile} failed, running it eagerly: {str(e)}")
+
+
+def build_tts_model(model_name: str, device: str = "auto", cpu_profile: Optional[CPUProfile] = None):
+    """Load XTTS on ``device`` ("auto", "cuda" or "cpu"), applying ``cpu_profile`` on the CPU."""
+    if device == "auto":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    elif device == "cuda" and not torch.cuda.is_available():
+        st.warning("Config set to use GPU for TTS, but CUDA is not available. Falling back to CPU.")
+        device = "cpu"
+
+    profile = cpu_profile or CPUProfile.from_config()
+    if device == "cpu":
+        _configure_threads(profile)
+    logger.info(f"Loading TTS model: {model_name} (device: {device})...")
+    model = TTS(model_name=model_name).to(device)
+    if device == "cpu":
+        _apply_cpu_profile(model.synthesizer.tts_model, profile)
+        logger.info(f"TTS CPU profile: {profile._asdict()}, {torch.get_num_threads()} threads")
+    logger.info("TTS model loaded successfully.")
+    return model
+
+
 @st.cache_resource
-def load_tts_model(model_name: str, use_gpu: bool):
+def load_tts_model(model_name: str, device: str = "auto", cpu_profile: Optional[CPUProfile] = None):
     """
     Loads the TTS model only once, and caches it.
     This prevents the model from reloading on every Streamlit rerun.
     """
     try:
-        # Check if CUDA is available *before* trying to load on GPU
-        if use_gpu and not torch.cuda.is_available():
-            st.warning("Config set to use GPU for TTS, but CUDA is not available. Falling back to CPU.")
-            use_gpu = False # Force CPU if CUDA isn't detected
-
-
-        device = 'cuda' if use_gpu else 'cpu'
-        logger.info(f"Loading TTS model: {model_name} (GPU: {use_gpu})...")
-        model = TTS(model_name=model_name).to(device)
-        logger.info("TTS model loaded successfully.")
-        return model
+        return build_tts_model(model_name, device, cpu_profile)
     except Exception as e:
         logger.error(f"Failed to load TTS model: {e}", exc_info=True)
         st.error(f"Error loading TTS model: {e}. Please check your CUDA setup if you intended to use GPU.")
@@ -57,27 +265,116 @@ def load_tts_model(model_name: str, use_gpu: bool):
 class TTSService:
     """Text-to-Speech service using Coqui XTTS v2."""
     
-    def __init__(self):
+    def __init__(self, tts_model=None, cpu_profile: Optional[CPUProfile] = None):
+        # A preloaded model can be passed in, e.g. by benchmarks/xtts_cpu_benchmark.py
         self.model_name = CONFIG.tts_model_name
         self.voice_file = CONFIG.voice_file_path
-        self.tts = None
-        self._load_model()
+        self.cpu_profile = cpu_profile or CPUProfile.from_config()
+        self.tts = tts_model
+        self._loaded = tts_model is None  # more instances are loaded the same way; passed-in models are copied
+        self._conditioning = None  # cached XTTS speaker latents for voice_file
+        self._conditioning_lock = threading.Lock()
+        if self.tts is None:
+            self._load_model()
     
     
     def _load_model(self):
         """Load TTS model."""
         try:
-            # self.tts = TTS(model_name=self.model_name, gpu=True)
-            
-            self.tts = load_tts_model(self.model_name, use_gpu=True)
+            self.tts = load_tts_model(self.model_name, CONFIG.tts_device, self.cpu_profile)
 
             logger.info(f"TTS model loaded: {self.model_name}")
         except Exception as e:
             logger.error(f"Error loading TTS model: {str(e)}")
             self.tts = None
     
-    def synthesize_speech(self, text: str) -> Optional[str]:
-        """Synthesize speech from text."""
+    @property
+    def output_sample_rate(self) -> int:
+        return self.tts.synthesizer.output_sample_rate
+    
+    def _load_instance(self):
+        """Another instance of the model for the pool."""
+        return build_tts_model(self.model_name, CONFIG.tts_device, self.cpu_profile)
+    
+    def _models(self) -> _ModelPool:
+        return _model_pool(self.tts, self._load_instance if self._loaded else None)
+    
+    def _speaker_conditioning(self, model):
+        """Compute the XTTS speaker latents once instead of on every call; all instances share them."""
+        with self._conditioning_lock:
+            if self._conditioning is None:
+                with self._inference_context():
+                    self._conditioning = model.get_conditioning_latents(audio_path=[self.voice_file])
+            return self._conditioning
+    
+    def warm(self):
+        """Compute the speaker latents and start loading the model instances ahead of the first synthesis."""
+        if self.tts and os.path.exists(self.voice_file):
+            models = self._models()
+            models.fill()
+            with models.checkout() as tts:
+                model = tts.synthesizer.tts_model
+                if hasattr(model, "get_conditioning_latents"):
+                    self._speaker_conditioning(model)
+
+    def precache(self, texts: Iterable[str]):
+        """Synthesize the segments of ``texts`` and keep them cached for good (e.g. canned replies)."""
+        if not self.tts or not os.path.exists(self.voice_file):
+            return
+        for text in texts:
+            for segment in plan_segments(text):
+                key = (self.voice_file, segment)
+                if _cached_segment(key) is not None:
+                    continue
+                try:
+                    _cache_segment(key, normalize_loudness(self._synthesize_chunk(segment)), pin=True)
+                except Exception as e:
+                    logger.warning(f"Could not precache speech: {str(e)}")
+                    return
+
+    def _inference_context(self):
+        return torch.inference_mode() if self.cpu_profile.inference_mode else torch.no_grad()
+    
+    def _synthesize_chunk(self, text: str) -> np.ndarray:
+        """Synthesize one sentence to float32 samples on a model instance of its own."""
+        with self._models().checkout() as tts:
+            model = tts.synthesizer.tts_model
+            if hasattr(model, "get_conditioning_latents"):
+                # Call XTTS directly: TTS.api converts the waveform to a Python list
+                gpt_cond_latent, speaker_embedding = self._speaker_conditioning(model)
+                with self._inference_context():
+                    output = model.inference(text, "ar", gpt_cond_latent, speaker_embedding)
+                wav = output["wav"]
+                if torch.is_tensor(wav):
+                    wav = wav.detach().cpu().numpy()
+            else:
+                wav = tts.tts(
+                    text=text,
+                    speaker_wav=self.voice_file,
+                    language="ar",
+                )
+        return np.asarray(wav, dtype=np.float32).reshape(-1)
+    
+    def synthesize_speech(self, text: str,
+                          cancel_token: Optional[CancellationToken] = None,
+                          on_segment: Optional[Callable[[AudioBuffer], None]] = None,
+                          cached_only: bool = False,
+                          cached_filler: Optional[str] = None) -> Optional[AudioBuffer]:
+        """Synthesize speech from text into a float32 buffer tagged with its sample rate.
+        
+        The text is split into sentence-sized segments (``plan_segments``)
+        that are synthesized in parallel on ``CONFIG.tts_workers`` threads,
+        each on its own instance of the model (see ``_ModelPool``), and
+        joined in order with matched loudness and a short crossfade.
+        ``on_segment`` receives the joined audio piece by piece, in order,
+        as soon as each segment is ready, so playback can start after the
+        first one. A cancelled turn drops the segments not yet started.
+        Segments in the cache are reused. With ``cached_only`` (used under
+        load) the model does not run: the reply's leading cached segments
+        are voiced, followed by ``cached_filler`` (a precached phrase
+        pointing to the text) in place of the rest. Without a cached
+        filler, a reply with any uncached segment returns None.
+        """
         
         if not self.tts:
             logger.error("TTS model not available")
@@ -98,15 +395,47 @@ class TTSService:
                 logger.error(f"Voice file not found: {self.voice_file}")
                 return None
 
-            wav_output = self.tts.tts(
-                text=text,
-                speaker_wav=self.voice_file,
-                language="ar",
-            )
+            segments = plan_segments(text)
+            if not segments:
+                return None
+            
+            keys = [(self.voice_file, segment) for segment in segments]
+            cached = [_cached_segment(key) for key in keys]
+            if cached_only and any(wav is None for wav in cached):
+                filler = plan_segments(cached_filler) if cached_filler else []
+                filler_wavs = [_cached_segment((self.voice_file, segment)) for segment in filler]
+                if not filler or any(wav is None for wav in filler_wavs):
+                    logger.info("Reply not in the segment cache; no speech this turn")
+                    return None
+                voiced = next(index for index, wav in enumerate(cached) if wav is None)
+                logger.info(f"Voicing {voiced} of {len(segments)} segments from the cache, then the filler")
+                segments = segments[:voiced] + filler
+                keys = keys[:voiced] + [(self.voice_file, segment) for segment in filler]
+                cached = cached[:voiced] + filler_wavs
+            
+            raise_if_cancelled(cancel_token, "tts")
+            sample_rate = self.output_sample_rate
+            joiner = SegmentJoiner(sample_rate)
+            futures = [None if wav is not None else _submit_segment(self._synthesize_chunk, segment)
+                       for segment, wav in zip(segments, cached)]
+            pieces = []
+            try:
+                for key, wav, future in zip(keys, cached, futures):
+                    if wav is None:
+                        wav = normalize_loudness(run_cancellable(future.result, cancel_token, "tts"))
+                        _cache_segment(key, wav)
+                    pieces.append(joiner.push(wav))
+                    if on_segment and pieces[-1].size:
+                        on_segment(AudioBuffer.from_float(pieces[-1], sample_rate))
+            finally:
+                for future in futures:
+                    if future is not None:
+                        future.cancel()
+            pieces.append(joiner.flush())
+            if on_segment and pieces[-1].size:
+                on_segment(AudioBuffer.from_float(pieces[-1], sample_rate))
             
-            # logger.info(f"Speech synthesized successfully: {output_path}")
-            # return output_path
-            return wav_output
+            return AudioBuffer.from_float(np.concatenate(pieces), sample_rate)
             
         except Exception as e:
             logger.error(f"Error synthesizing speech: {str(e)}")
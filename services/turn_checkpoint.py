@@ -0,0 +1,177 @@
+"""Stage checkpoints of voice turns, so a failed turn can be retried without redoing its work.
+
+Each turn gets a ``turn_id``. As its stages finish, their outputs are
+saved on the turn's ``TurnCheckpoint``: the transcription after STT, the
+emotions after emotion detection, the reply text and the reply audio.
+Retrying the turn (``SessionManager.retry_turn``, or passing the
+``turn_id`` again) resumes at the first stage without a saved output.
+
+Within a session, audio is also looked up by content hash, so the same
+recording submitted twice (a double click, a client retrying after a
+dropped connection) resumes the earlier turn rather than starting over.
+A duplicate of a turn that already completed gets the same result back
+with nothing re-run, and ``resumed["deduplicated"]`` set so the caller
+does not store the turn twice. A turn that succeeded without the audio
+it should have had is not complete: its checkpoint is marked
+``delivered`` and a retry re-runs speech only.
+
+Checkpoints live in this process, for ``CONFIG.turn_checkpoint_ttl_s``
+and at most ``CONFIG.turn_checkpoint_max`` turns; a retry sent to
+another worker starts from scratch.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+def audio_hash(audio_bytes: bytes) -> str:
+    return hashlib.blake2b(audio_bytes, digest_size=16).hexdigest()
+
+
+class TurnCheckpoint:
+    """Saved stage outputs of one turn.
+
+    Only one run of a turn proceeds at a time: a concurrent retry waits on
+    ``lock`` and then reuses whatever the first run saved.
+    """
+
+    def __init__(self, turn_id: str, audio_bytes: bytes, digest: str, session_id: Optional[str] = None):
+        self.turn_id = turn_id
+        self.session_id = session_id
+        self.digest = digest
+        self.audio_bytes: Optional[bytes] = audio_bytes  # dropped once the audio-based stages are saved
+        self.outputs: Dict[str, Dict[str, Any]] = {}
+        self.seconds: Dict[str, float] = {}
+        self.result: Optional[Dict[str, Any]] = None  # set when the turn completes
+        self.delivered = False  # the text reply went out, but its audio is missing
+        self.attempts = 0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def get(self, stage: str) -> Optional[Dict[str, Any]]:
+        return self.outputs.get(stage)
+
+    def save(self, stage: str, seconds: float, **outputs):
+        """Keep a finished stage's outputs and how long it took."""
+        self.outputs[stage] = outputs
+        self.seconds[stage] = seconds
+        self.updated = time.monotonic()
+        if stage == "emotion":
+            self.audio_bytes = None
+
+    def complete(self, result: Dict[str, Any]):
+        self.result = dict(result)  # callers may pop the audio off their copy
+        self.updated = time.monotonic()
+
+    def saved_seconds(self, stages: List[str]) -> float:
+        return sum(self.seconds.get(stage, 0.0) for stage in stages)
+
+
+class CheckpointStore:
+    """Bounded, expiring map of turn ID -> checkpoint, indexed by session and audio hash."""
+
+    def __init__(self, ttl: Optional[float] = None, max_turns: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else CONFIG.turn_checkpoint_ttl_s
+        self.max_turns = max_turns or CONFIG.turn_checkpoint_max
+        self._turns: "OrderedDict[str, TurnCheckpoint]" = OrderedDict()
+        self._by_audio: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+        self.resumed = 0
+        self.deduplicated = 0
+        self.stages_reused = 0
+        self.seconds_saved = 0.0
+
+    def _drop(self, turn_id: str):
+        checkpoint = self._turns.pop(turn_id, None)
+        if checkpoint is not None and checkpoint.session_id:
+            self._by_audio.pop((checkpoint.session_id, checkpoint.digest), None)
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._turns:
+            turn_id, checkpoint = next(iter(self._turns.items()))
+            if checkpoint.updated >= cutoff and len(self._turns) <= self.max_turns:
+                break
+            self._drop(turn_id)
+
+    def get(self, turn_id: str) -> Optional[TurnCheckpoint]:
+        with self._lock:
+            self._expire()
+            return self._turns.get(turn_id)
+
+    def checkout(self, audio_bytes: bytes, turn_id: Optional[str] = None,
+                 session_id: Optional[str] = None) -> TurnCheckpoint:
+        """The checkpoint of ``turn_id``, or of the same audio earlier in the session, or a new one."""
+        digest = audio_hash(audio_bytes) if audio_bytes else ""
+        with self._lock:
+            self._expire()
+            checkpoint = self._turns.get(turn_id) if turn_id else None
+            if checkpoint is None and session_id and digest:
+                known = self._by_audio.get((session_id, digest))
+                checkpoint = self._turns.get(known) if known else None
+                if checkpoint is not None:
+                    logger.info(f"Audio already submitted as turn {checkpoint.turn_id}, resuming it")
+            if checkpoint is None:
+                checkpoint = TurnCheckpoint(turn_id or uuid.uuid4().hex, audio_bytes, digest, session_id)
+                self._turns[checkpoint.turn_id] = checkpoint
+                if session_id and digest:
+                    self._by_audio[(session_id, digest)] = checkpoint.turn_id
+            self._turns.move_to_end(checkpoint.turn_id)
+            checkpoint.attempts += 1
+            return checkpoint
+
+    def count_reuse(self, reused: List[str], seconds: float, deduplicated: bool):
+        if not reused:
+            return
+        with self._lock:
+            self.resumed += 1
+            self.deduplicated += int(deduplicated)
+            self.stages_reused += len(reused)
+            self.seconds_saved += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire()
+            return {
+                "turns": len(self._turns),
+                "incomplete": sum(1 for checkpoint in self._turns.values() if checkpoint.result is None),
+                "resumed": self.resumed,
+                "deduplicated": self.deduplicated,
+                "stages_reused": self.stages_reused,
+                "seconds_saved": round(self.seconds_saved, 3),
+            }
+
+
+_store: Optional[CheckpointStore] = None
+_store_lock = threading.Lock()
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    """The process-wide checkpoint store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CheckpointStore()
+        return _store
+
+
+def reset_checkpoint_store():
+    """Forget all checkpoints, e.g. between load test runs."""
+    global _store
+    with _store_lock:
+        _store = None
+
+
+def checkpoint_stats() -> Dict[str, Any]:
+    """Turns held, and how many retries reused work and how much time that saved."""
+    with _store_lock:
+        store = _store
+    return store.stats() if store is not None else {"turns": 0}
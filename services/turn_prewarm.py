@@ -0,0 +1,101 @@
+"""Work started the moment the user stops speaking, before the transcript exists.
+
+The pool is shared by every session in the process, so the stages never
+block on it: a task that has not finished by the time its stage needs it
+is skipped (or cancelled if it has not started) and the stage does the
+work inline. Network warmups run detached and are never waited for.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Room for a couple of tasks per turn the server runs at once
+_prewarm_pool = ThreadPoolExecutor(max_workers=2 * CONFIG.server_max_workers, thread_name_prefix="prewarm")
+
+
+class TurnPrewarm:
+    """Background tasks for one turn, each consumed by the stage that needs it.
+
+    A task's runtime counts as saved for its stage, minus however long the
+    stage still had to wait for it. Tasks that fail are logged and treated
+    as not started; the stage then does the work itself.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._tasks: Dict[str, Future] = {}
+        self._durations: Dict[str, float] = {}
+        self._saved: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def start(self, stage: str, work: Callable[[], Any]):
+        def timed():
+            started = time.perf_counter()
+            try:
+                return work()
+            finally:
+                with self._lock:
+                    self._durations[stage] = time.perf_counter() - started
+
+        self._tasks[stage] = _prewarm_pool.submit(timed)
+
+    def start_detached(self, stage: str, work: Callable[[], Any]):
+        """Run ``work`` on its own thread, outside the pool, and never wait for it."""
+        def run():
+            try:
+                work()
+            except Exception as e:
+                logger.warning(f"Prewarm of {stage} failed: {str(e)}")
+
+        threading.Thread(target=run, name=f"prewarm-{stage}", daemon=True).start()
+
+    def consume(self, stage: str, wait: bool = True,
+                fallback: Optional[Callable[[], Any]] = None) -> Optional[Any]:
+        """Return the result of a stage's prewarm task (None if absent or failed).
+
+        With ``wait=False`` an unfinished task is cancelled if it has not
+        started yet (left running otherwise), nothing is counted as saved,
+        and ``fallback()`` is returned instead, run inline.
+        """
+        future = self._tasks.get(stage)
+        if future is None:
+            return self._inline(stage, fallback)
+        if not wait and not future.done():
+            future.cancel()
+            with self._lock:
+                self._saved[stage] = 0.0
+            return self._inline(stage, fallback)
+
+        waited_from = time.perf_counter()
+        try:
+            value = future.result()
+        except Exception as e:
+            logger.warning(f"Prewarm of {stage} failed: {str(e)}")
+            return None
+        waited = time.perf_counter() - waited_from
+
+        with self._lock:
+            self._saved[stage] = max(0.0, self._durations.get(stage, 0.0) - waited)
+        return value
+
+    @staticmethod
+    def _inline(stage: str, fallback: Optional[Callable[[], Any]]) -> Optional[Any]:
+        if fallback is None:
+            return None
+        try:
+            return fallback()
+        except Exception as e:
+            logger.warning(f"{stage} failed: {str(e)}")
+            return None
+
+    def savings(self) -> Dict[str, float]:
+        """Seconds taken off the critical path, per stage consumed so far."""
+        with self._lock:
+            return {stage: round(seconds, 4) for stage, seconds in self._saved.items()}
@@ -0,0 +1,80 @@
+"""Compact in-memory representation of conversation turns."""
+
+import sys
+import time
+from array import array
+from typing import Any, Dict, Iterable, Optional
+
+# Fixed slot order for emotion scores; matches the emotion model's outputs
+EMOTION_LABELS = ("negative", "neutral", "positive")
+
+
+def pack_emotions(emotions: Optional[Dict[str, float]]) -> Optional[array]:
+    """Pack an emotion score dict into a float32 array in EMOTION_LABELS order."""
+    if not emotions:
+        return None
+    return array('f', (float(emotions.get(label, 0.0)) for label in EMOTION_LABELS))
+
+
+def unpack_emotions(scores: Optional[array]) -> Optional[Dict[str, float]]:
+    if scores is None:
+        return None
+    return {label: float(score) for label, score in zip(EMOTION_LABELS, scores)}
+
+
+class Turn:
+    """One user/therapist exchange; audio is never part of a turn."""
+
+    __slots__ = ("user", "therapist", "scores", "timestamp")
+
+    def __init__(self, user: str, therapist: str,
+                 emotions: Optional[Dict[str, float]] = None,
+                 timestamp: Optional[float] = None):
+        self.user = user
+        self.therapist = therapist
+        self.scores = pack_emotions(emotions)
+        self.timestamp = time.time() if timestamp is None else float(timestamp)
+
+    @property
+    def emotions(self) -> Optional[Dict[str, float]]:
+        return unpack_emotions(self.scores)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Turn":
+        return cls(data["user"], data["therapist"], data.get("emotions"), data.get("timestamp"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "user": self.user,
+            "therapist": self.therapist,
+            "emotions": self.emotions,
+            "timestamp": self.timestamp,
+        }
+
+    def nbytes(self) -> int:
+        """Approximate memory held by this turn, including its fields."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.user) + sys.getsizeof(self.therapist)
+        size += sys.getsizeof(self.timestamp)
+        if self.scores is not None:
+            size += sys.getsizeof(self.scores)
+        return size
+
+    def __repr__(self):
+        return f"Turn(user={self.user[:20]!r}, therapist={self.therapist[:20]!r})"
+
+
+def memory_report(turns: Iterable[Turn]) -> Dict[str, Any]:
+    """Summarize how much memory a set of turns holds."""
+    count = 0
+    text_bytes = 0
+    total_bytes = 0
+    for turn in turns:
+        count += 1
+        text_bytes += sys.getsizeof(turn.user) + sys.getsizeof(turn.therapist)
+        total_bytes += turn.nbytes()
+    return {
+        "turns": count,
+        "text_bytes": text_bytes,
+        "total_bytes": total_bytes,
+        "bytes_per_turn": total_bytes // count if count else 0,
+    }
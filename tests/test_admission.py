@@ -0,0 +1,30 @@
+"""AdmissionController tier transitions, driven by the in-flight signal only."""
+
+from services.admission import AdmissionController
+
+THRESHOLDS = {"in_flight": [2, 3, 4, 5], "tts_queue": [], "latency_p90": []}
+
+
+def controller() -> AdmissionController:
+    return AdmissionController(THRESHOLDS, queue_depth=lambda: 0)
+
+
+def test_load_raises_the_tier_of_new_turns():
+    admission = controller()
+
+    assert [admission.admit().tier for _ in range(4)] == [0, 1, 2, 3]
+
+
+def test_stats_report_the_tier_without_moving_it(monkeypatch):
+    monkeypatch.setattr("config.CONFIG.admission_recovery_s", 0.0)
+    admission = controller()
+    for _ in range(3):
+        admission.admit()
+    for _ in range(3):
+        admission.release()
+
+    # Load is gone, but only the next admitted turn steps the tier down
+    assert admission.stats()["tier"] == 2
+    assert admission.stats()["tier_name"] == "short_reply"
+    assert admission.admit().tier == 1
+    assert admission.stats()["tier"] == 1
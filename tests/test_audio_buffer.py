@@ -0,0 +1,64 @@
+"""AudioBuffer keeps audio in one float32 array from synthesis to transport."""
+
+import numpy as np
+
+from benchmarks.audio_allocations import CHUNK_MS, XTTS_SAMPLE_RATE, buffer_path, list_path, measure
+from utils.audio_buffer import AudioBuffer
+
+
+def sine(seconds: float, sample_rate: int = XTTS_SAMPLE_RATE, frequency: float = 220.0) -> np.ndarray:
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (0.3 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def test_buffer_path_allocates_a_fixed_number_of_objects():
+    wav = sine(2.0)
+    list_allocations, list_peak = measure(list_path, wav)
+    buffer_allocations, buffer_peak = measure(buffer_path, wav)
+
+    # The list path boxes every sample; the buffer path allocates the arrays and one bytes per chunk
+    assert list_allocations >= wav.shape[0]
+    chunks = -(-wav.shape[0] // (XTTS_SAMPLE_RATE * CHUNK_MS // 1000))
+    assert buffer_allocations <= 2 * chunks + 20
+    assert buffer_peak * 4 < list_peak
+
+
+def test_buffer_allocations_do_not_grow_with_length():
+    short_allocations, _ = measure(buffer_path, sine(1.0))
+    long_allocations, _ = measure(buffer_path, sine(4.0))
+
+    chunks_added = 3 * 1000 // CHUNK_MS
+    assert long_allocations - short_allocations <= 2 * chunks_added
+
+
+def test_from_float_does_not_copy_float32():
+    wav = sine(0.5)
+    audio = AudioBuffer.from_float(wav, XTTS_SAMPLE_RATE)
+
+    assert audio.samples is wav or np.shares_memory(audio.samples, wav)
+    assert audio.resample(XTTS_SAMPLE_RATE) is audio
+
+
+def test_pcm16_round_trip():
+    audio = AudioBuffer.from_float(sine(0.5), XTTS_SAMPLE_RATE)
+    chunks = list(audio.iter_pcm16_chunks(CHUNK_MS))
+    decoded = AudioBuffer.from_pcm16(b"".join(bytes(chunk) for chunk in chunks), XTTS_SAMPLE_RATE)
+
+    assert len(chunks) == 5
+    assert decoded.sample_rate == XTTS_SAMPLE_RATE
+    assert np.max(np.abs(decoded.samples - audio.samples)) <= 1 / 32767
+
+
+def test_wav_round_trip_keeps_the_rate():
+    audio = AudioBuffer.from_float(sine(0.25, 16000), 16000)
+    decoded = AudioBuffer.from_wav_bytes(audio.to_wav_bytes())
+
+    assert decoded.sample_rate == 16000
+    assert len(decoded) == len(audio)
+    assert decoded.samples.dtype == np.float32
+
+
+def test_clips_out_of_range_samples():
+    audio = AudioBuffer.from_float([2.0, -2.0, 0.0], 16000)
+
+    assert audio.to_pcm16().tolist() == [32767, -32767, 0]
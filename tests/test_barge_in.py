@@ -0,0 +1,123 @@
+"""Barge-in with file-backed microphone and speaker devices."""
+
+import wave
+
+import numpy as np
+import pytest
+
+from utils.audio_buffer import AudioBuffer
+from utils.audio_devices import WavFileCallbackInput, WavFileInput, WavFileOutput
+from utils.barge_in import BargeInDetector, DuplexPlayer
+from utils.capture_engine import CaptureEngine
+
+MIC_RATE = 16000
+REPLY_RATE = 24000
+
+
+def tone(seconds: float, sample_rate: int, level: float = 0.3, frequency: float = 220.0) -> np.ndarray:
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return (level * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def write_mic(path, samples: np.ndarray) -> str:
+    with wave.open(str(path), 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(MIC_RATE)
+        wav_file.writeframes(AudioBuffer.from_float(samples, MIC_RATE).to_pcm16().tobytes())
+    return str(path)
+
+
+@pytest.fixture
+def reply() -> AudioBuffer:
+    return AudioBuffer.from_float(tone(3.0, REPLY_RATE), REPLY_RATE)
+
+
+@pytest.fixture(autouse=True)
+def short_silence(monkeypatch):
+    # End the captured utterance quickly once the user stops talking
+    monkeypatch.setattr("config.CONFIG.vad_end_silence_ms", 200)
+
+
+def test_user_speech_stops_playback_and_is_captured(tmp_path, reply):
+    speech = tone(0.6, MIC_RATE, frequency=300.0)
+    mic = write_mic(tmp_path / "mic.wav", np.concatenate([np.zeros(MIC_RATE // 2, dtype=np.float32), speech]))
+    speaker = WavFileOutput(str(tmp_path / "played.wav"))
+    player = DuplexPlayer(WavFileInput(mic), speaker, BargeInDetector(min_speech_frames=6))
+
+    captured = player.play(reply)
+
+    assert captured is not None
+    assert speaker.aborted
+    # Detected 6 frames (120 ms) into the speech, and playback stopped right there
+    assert player.interrupted_at == pytest.approx(0.62, abs=0.03)
+    assert speaker.played.shape[0] <= (player.interrupted_at + 0.02) * REPLY_RATE + 1
+    utterance = AudioBuffer.from_wav_bytes(captured)
+    assert utterance.sample_rate == MIC_RATE
+    # The pre-roll keeps 200 ms from before the detecting frames, so the speech onset is there
+    onset = np.flatnonzero(np.abs(utterance.samples) > 0.05)
+    assert onset[0] / MIC_RATE == pytest.approx(0.2, abs=0.02)
+    assert (onset[-1] - onset[0]) / MIC_RATE == pytest.approx(0.6, abs=0.02)
+    assert AudioBuffer.from_wav_bytes((tmp_path / "played.wav").read_bytes()).sample_rate == REPLY_RATE
+
+
+def test_silence_lets_the_reply_finish(tmp_path, reply):
+    mic = write_mic(tmp_path / "mic.wav", np.zeros(MIC_RATE, dtype=np.float32))
+    speaker = WavFileOutput()
+    player = DuplexPlayer(WavFileInput(mic), speaker)
+
+    assert player.play(reply) is None
+    assert not speaker.aborted
+    assert player.interrupted_at is None
+    np.testing.assert_array_equal(speaker.played, reply.samples)
+
+
+def test_echo_of_the_reply_is_not_speech(tmp_path, reply):
+    # The speaker leaking into the microphone: louder than the threshold, but only an echo
+    echo = 0.3 * reply.resample(MIC_RATE).samples
+    mic = write_mic(tmp_path / "mic.wav", echo)
+    speaker = WavFileOutput()
+    player = DuplexPlayer(WavFileInput(mic), speaker)
+
+    assert player.play(reply) is None
+    assert not speaker.aborted
+
+
+def test_stop_aborts_playback(tmp_path, reply):
+    mic = write_mic(tmp_path / "mic.wav", np.zeros(MIC_RATE, dtype=np.float32))
+    speaker = WavFileOutput()
+    player = DuplexPlayer(WavFileInput(mic), speaker)
+    speaker.write = lambda samples: player.stop()
+
+    assert player.play(reply) is None
+    assert speaker.aborted
+
+
+def test_capture_engine_records_a_callback_device(tmp_path):
+    samples = tone(0.5, MIC_RATE)
+    mic = WavFileCallbackInput(write_mic(tmp_path / "mic.wav", samples), realtime=False)
+    engine = CaptureEngine(mic, buffer_seconds=2)
+    engine.start()
+    try:
+        assert engine.wait_for(samples.shape[0], timeout=2.0)
+        recorded = engine.read(0, samples.shape[0])
+    finally:
+        engine.stop()
+
+    np.testing.assert_array_equal(recorded, AudioBuffer.from_float(samples, MIC_RATE).to_pcm16())
+
+
+def test_barge_in_through_the_capture_engine(tmp_path, reply):
+    speech = tone(0.6, MIC_RATE, frequency=300.0)
+    mic = write_mic(tmp_path / "mic.wav", np.concatenate([np.zeros(MIC_RATE // 2, dtype=np.float32), speech]))
+    engine = CaptureEngine(WavFileCallbackInput(mic, block_ms=20), buffer_seconds=5)
+    speaker = WavFileOutput()
+    player = DuplexPlayer(engine.reader(), speaker)
+    try:
+        captured = player.play(reply)
+    finally:
+        engine.stop()
+
+    assert captured is not None
+    assert speaker.aborted
+    assert player.interrupted_at < 1.0
@@ -0,0 +1,209 @@
+"""Circuit breakers against a flaky simulated provider."""
+
+import time
+
+import pytest
+
+from benchmarks.provider_simulator import (ProviderProfile, SimulatedAnthropic, SimulatedAPIError, SimulatedOpenAI,
+                                           SimulatedProvider, TranscriptRegistry)
+from services.gpt_service import GPTService
+from utils.circuit_breaker import (CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, add_breaker_listener,
+                                   reset_circuit_breakers)
+from utils.rate_limiter import ProviderRateLimiter, reset_rate_limiters
+
+
+def flaky(error_rate: float = 1.0, latency: float = 0.0) -> SimulatedProvider:
+    return SimulatedProvider("gpt", ProviderProfile(latency=latency, jitter=0.0, error_rate=error_rate), seed=1)
+
+
+def call(limiter: ProviderRateLimiter, provider: SimulatedProvider, breaker: CircuitBreaker):
+    try:
+        limiter.call(provider.handle, breaker=breaker)
+    except SimulatedAPIError:
+        pass
+
+
+@pytest.fixture
+def limiter() -> ProviderRateLimiter:
+    return ProviderRateLimiter("gpt", requests_per_second=1000)
+
+
+@pytest.fixture
+def events():
+    received = []
+    remove = add_breaker_listener(received.append)
+    yield received
+    remove()
+
+
+def test_failures_open_the_breaker_and_stop_calls(limiter, events):
+    provider = flaky()
+    breaker = CircuitBreaker("openai.chat", failure_rate=0.5, min_calls=4, open_s=30.0)
+
+    for _ in range(4):
+        call(limiter, provider, breaker)
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpen):
+        limiter.call(provider.handle, breaker=breaker)
+    assert provider.requests == 4
+    assert breaker.stats()["rejected"] == 1
+    assert [(event["from"], event["to"]) for event in events] == [(CLOSED, OPEN)]
+    assert events[0]["breaker"] == "openai.chat"
+
+
+def test_occasional_failures_keep_it_closed(limiter):
+    provider = flaky(error_rate=0.0)
+    breaker = CircuitBreaker("openai.chat", failure_rate=0.5, min_calls=4)
+
+    for index in range(12):
+        provider.profile.error_rate = 1.0 if index % 4 == 0 else 0.0
+        call(limiter, provider, breaker)
+
+    assert breaker.state == CLOSED
+    assert breaker.failures == 3
+
+
+def test_recovers_through_half_open(limiter, events):
+    provider = flaky()
+    breaker = CircuitBreaker("openai.chat", min_calls=2, open_s=0.1)
+    for _ in range(2):
+        call(limiter, provider, breaker)
+    assert breaker.state == OPEN
+
+    time.sleep(0.15)
+    provider.profile.error_rate = 0.0
+    limiter.call(provider.handle, breaker=breaker)
+
+    assert breaker.state == CLOSED
+    assert [event["to"] for event in events] == [OPEN, HALF_OPEN, CLOSED]
+
+
+def test_failed_probe_opens_it_again(limiter, events):
+    provider = flaky()
+    breaker = CircuitBreaker("openai.chat", min_calls=2, open_s=0.1)
+    for _ in range(2):
+        call(limiter, provider, breaker)
+
+    time.sleep(0.15)
+    call(limiter, provider, breaker)
+
+    assert breaker.state == OPEN
+    assert [event["to"] for event in events] == [OPEN, HALF_OPEN, OPEN]
+    with pytest.raises(CircuitOpen):
+        limiter.call(provider.handle, breaker=breaker)
+
+
+def test_half_open_lets_one_probe_through(limiter):
+    provider = flaky()
+    breaker = CircuitBreaker("openai.chat", min_calls=2, open_s=0.1, half_open_calls=1)
+    for _ in range(2):
+        call(limiter, provider, breaker)
+    time.sleep(0.15)
+
+    breaker.before_call()  # the probe, still running
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.release()  # the probe ended without an outcome (e.g. cancelled)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_slow_calls_open_the_breaker(limiter):
+    provider = flaky(error_rate=0.0, latency=0.03)
+    breaker = CircuitBreaker("openai.chat", slow_call_s=0.02, slow_rate=0.8, min_calls=3)
+
+    for _ in range(3):
+        limiter.call(provider.handle, breaker=breaker)
+
+    assert breaker.state == OPEN
+    assert breaker.slow_calls == 3
+    assert breaker.failures == 0
+
+
+def test_outage_opens_then_recovery_closes(limiter):
+    profile = ProviderProfile(latency=0.0, jitter=0.0, outage_start=0.0, outage_seconds=0.2)
+    provider = SimulatedProvider("gpt", profile, seed=1)
+    breaker = CircuitBreaker("openai.chat", min_calls=3, open_s=0.25)
+
+    for _ in range(5):
+        try:
+            call(limiter, provider, breaker)
+        except CircuitOpen:
+            pass
+    assert breaker.state == OPEN
+    assert provider.requests == 3
+
+    time.sleep(0.3)  # past both the outage and open_s
+    limiter.call(provider.handle, breaker=breaker)
+    assert breaker.state == CLOSED
+
+
+@pytest.fixture
+def service_factory(monkeypatch):
+    monkeypatch.setattr("config.CONFIG.circuit_breaker_enabled", True)
+    monkeypatch.setattr("config.CONFIG.circuit_breakers", {"default": {"min_calls": 2, "open_s": 30.0}})
+    monkeypatch.setattr("config.CONFIG.rate_limits", {"openai": {"requests_per_second": 1000},
+                                                      "anthropic": {"requests_per_second": 1000}})
+    # Without a budget GPT is not streamed, which the simulator paces like real generation
+    monkeypatch.setattr("config.CONFIG.response_max_sentences", 0)
+    monkeypatch.setattr("config.CONFIG.response_max_chars", 0)
+    reset_rate_limiters()
+    reset_circuit_breakers()
+
+    def build(gpt_error_rate: float, claude_error_rate: float = 0.0):
+        gpt = SimulatedProvider("gpt", ProviderProfile(latency=0.0, jitter=0.0, error_rate=gpt_error_rate), seed=1)
+        claude = SimulatedProvider("claude", ProviderProfile(latency=0.0, jitter=0.0, error_rate=claude_error_rate),
+                                   seed=2)
+        whisper = SimulatedProvider("whisper", ProviderProfile(latency=0.0))
+        openai_sim = SimulatedOpenAI(gpt, whisper, TranscriptRegistry(16000))
+        return GPTService(openai_module=openai_sim, anthropic_client=SimulatedAnthropic(claude)), gpt, claude
+
+    yield build
+    reset_rate_limiters()
+    reset_circuit_breakers()
+
+
+def reply(service: GPTService, validate: bool = True):
+    outcome = {}
+    text = service.generate_therapeutic_response("أحس بضيق من الشغل", [], {"neutral": 1.0},
+                                                 validate=validate, outcome=outcome)
+    return text, outcome
+
+
+def test_gpt_outage_fails_over_to_claude_without_calling_gpt(service_factory):
+    service, gpt, claude = service_factory(gpt_error_rate=1.0)
+
+    for _ in range(2):
+        text, outcome = reply(service, validate=False)
+        assert text and outcome["model"] == "claude"
+    assert service.chat_breaker.state == OPEN
+    gpt_requests = gpt.requests
+
+    text, outcome = reply(service, validate=False)
+    assert text and outcome["model"] == "claude"
+    assert gpt.requests == gpt_requests
+
+
+def test_claude_outage_skips_validation(service_factory):
+    service, gpt, claude = service_factory(gpt_error_rate=0.0, claude_error_rate=1.0)
+
+    for _ in range(2):
+        reply(service)
+    claude_requests = claude.requests
+
+    text, outcome = reply(service)
+    assert text and outcome == {"model": "gpt", "validation": "skipped"}
+    assert claude.requests == claude_requests
+
+
+def test_both_down_gives_the_canned_reply(service_factory):
+    service, gpt, claude = service_factory(gpt_error_rate=1.0, claude_error_rate=1.0)
+
+    for _ in range(2):
+        reply(service)  # both fail; the session manager supplies the fallback
+    assert service.chat_breaker.state == OPEN
+
+    text, outcome = reply(service)
+    assert text and outcome["model"] == "fallback"
+    assert (gpt.requests, claude.requests) == (2, 2)
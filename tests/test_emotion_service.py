@@ -0,0 +1,59 @@
+"""Output label order and batching of EmotionService, without loading a model."""
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from services.emotion_service import EmotionService  # noqa: E402
+from services.turn_record import EMOTION_LABELS  # noqa: E402
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(EmotionService, "_load_model", lambda self: None)
+    return EmotionService()
+
+
+def with_id2label(service: EmotionService, id2label):
+    service.model = SimpleNamespace(config=SimpleNamespace(id2label=id2label))
+    return service
+
+
+def test_label_order_is_pinned():
+    # Packed turn scores and the fallback output mapping both depend on this order
+    assert list(EMOTION_LABELS) == ["negative", "neutral", "positive"]
+
+
+def test_labels_follow_the_model_config(service):
+    with_id2label(service, {0: "POSITIVE", 1: "Negative", 2: "neutral"})
+
+    assert service._labels() == ["positive", "negative", "neutral"]
+
+
+@pytest.mark.parametrize("id2label", [None, {}, {0: "LABEL_0", 1: "LABEL_1", 2: "LABEL_2"},
+                                      {0: "negative", 1: "positive"}])
+def test_unnamed_outputs_fall_back_to_the_fixed_order(service, id2label):
+    with_id2label(service, id2label)
+
+    assert service._labels() == list(EMOTION_LABELS)
+
+
+def test_batches_are_length_sorted_and_results_keep_input_order(service, monkeypatch):
+    service.model = service.tokenizer = object()
+    batches = []
+
+    def run_batch(texts):
+        batches.append(texts)
+        return [{"length": float(len(text))} for text in texts]
+
+    monkeypatch.setattr(service, "_model_based_batch", run_batch)
+    texts = ["ثلاثة", "", "واحد اثنان ثلاثة", "اثنان", "كلمة"]
+
+    results = service.detect_emotions(texts, batch_size=2)
+
+    assert batches == [["كلمة", "ثلاثة"], ["اثنان", "واحد اثنان ثلاثة"]]
+    assert results[1] == {"neutral": 1.0}
+    assert [result.get("length") for result in results] == [5.0, None, 16.0, 5.0, 4.0]
@@ -0,0 +1,101 @@
+"""RemoteSessionManager turns the server's wire messages into SessionManager's events."""
+
+import json
+
+import numpy as np
+
+from utils.audio_buffer import AudioBuffer
+from utils.pipeline_client import RemoteSessionManager
+
+REPLY = AudioBuffer.from_float(np.linspace(-0.5, 0.5, 4800, dtype=np.float32), 24000)
+
+
+class ScriptedConnection:
+    """Replays server messages and records what the client sent."""
+
+    def __init__(self, messages: list):
+        self.messages = [message if isinstance(message, bytes) else json.dumps(message, ensure_ascii=False)
+                         for message in messages]
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+    def recv(self):
+        return self.messages.pop(0)
+
+    def close(self):
+        pass
+
+
+def client_for(messages: list) -> RemoteSessionManager:
+    client = RemoteSessionManager("ws://unused")
+    client.connection = ScriptedConnection(messages)
+    return client
+
+
+def turn_complete(**fields) -> dict:
+    message = {"type": "turn_complete", "success": True, "cancelled": False, "processing_time": 1.0,
+               "degradation": "full", "error": None, "audio_failed": False, "turn_id": "t1",
+               "resumed": {"stages": [], "saved_s": 0.0, "deduplicated": False, "revoiced": False, "attempt": 1}}
+    message.update(fields)
+    return message
+
+
+def run(client: RemoteSessionManager):
+    events = []
+    result = client.process_voice_input(REPLY.resample(16000).to_wav_bytes(),
+                                        on_event=lambda event, payload: events.append((event, payload)))
+    return result, events
+
+
+def test_events_have_session_manager_payloads():
+    pcm = REPLY.to_pcm16().tobytes()
+    client = client_for([
+        {"type": "transcript", "text": "مرحبا"},
+        {"type": "emotion", "scores": {"neutral": 1.0}},
+        {"type": "text_delta", "text": "أهلا."},
+        {"type": "text_delta", "text": "كيف حالك؟"},
+        {"type": "audio_start", "sample_rate": 24000, "encoding": "pcm_s16le", "channels": 1},
+        pcm[:4800], pcm[4800:],
+        turn_complete(),
+    ])
+
+    result, events = run(client)
+
+    assert [event for event, _ in events] == ["transcript", "emotion", "response_partial", "response_partial",
+                                             "response", "audio_segment", "audio_segment", "audio"]
+    assert events[0][1] == "مرحبا"
+    assert events[1][1] == {"neutral": 1.0}
+    assert events[3][1] == events[4][1] == "أهلا. كيف حالك؟"
+    assert all(isinstance(payload, AudioBuffer) and payload.sample_rate == 24000 for _, payload in events[5:])
+    assert len(events[5][1]) + len(events[6][1]) == len(REPLY)
+    assert result["success"] and result["response_text"] == "أهلا. كيف حالك؟"
+    assert events[7][1] is result["audio_file"]
+
+
+def test_text_reset_replaces_the_partial_reply():
+    client = client_for([
+        {"type": "text_delta", "text": "مسودة."},
+        {"type": "text_reset"},
+        {"type": "text_delta", "text": "رد بديل."},
+        turn_complete(audio_failed=True),
+    ])
+
+    result, events = run(client)
+
+    assert events[-1] == ("response", "رد بديل.")
+    assert result["response_text"] == "رد بديل."
+    assert result["audio_file"] is None and result["audio_failed"]
+
+
+def test_error_ends_the_turn():
+    client = client_for([{"type": "error", "error": "malformed message: invalid history entry: 'user'"}])
+
+    result, events = run(client)
+
+    assert not result["success"]
+    assert "invalid history" in result["error"]
+    assert events == []
+    start = json.loads(client.connection.sent[0])
+    assert start["type"] == "start_turn" and start["sample_rate"] == 16000
@@ -0,0 +1,70 @@
+"""Prompt minification and the de-duplication of repeated paragraphs and headings."""
+
+from benchmarks.provider_simulator import (ProviderProfile, SimulatedAnthropic, SimulatedOpenAI, SimulatedProvider,
+                                           TranscriptRegistry)
+from services.gpt_service import GPTService
+from utils.prompt_builder import build_prompt, minify_prompt, render_prompt
+
+FINAL_HEADING = "**بناءً على جميع الإرشادات أعلاه، ردك القادم كمرشد نفسي عماني (أو مرشدة نفسية عمانية) يجب أن يكون:**"
+
+
+def test_minify_dedents_and_collapses_blank_lines():
+    text = """
+        **عنوان:**
+        سطر    أول
+
+          * بند متداخل
+
+
+
+        سطر أخير
+        """
+
+    assert minify_prompt(text) == "**عنوان:**\nسطر أول\n\n  * بند متداخل\n\nسطر أخير"
+
+
+def test_repeated_paragraph_is_kept_once():
+    sections = ["""
+        فقرة أولى.
+
+        فقرة مكررة.
+        """, """
+        فقرة مكررة.
+
+        فقرة أخيرة.
+        """]
+
+    assert build_prompt(sections) == "فقرة أولى.\n\nفقرة مكررة.\n\nفقرة أخيرة."
+
+
+def test_repeated_heading_is_dropped_but_its_lines_are_kept():
+    sections = ["**إرشادات:**\n* بند أول", "**إرشادات:**\n* بند ثان"]
+
+    assert build_prompt(sections) == "**إرشادات:**\n* بند أول\n\n* بند ثان"
+
+
+def test_bold_text_inside_a_line_is_not_a_heading():
+    sections = ["**مهم:** تذكر هذا.", "**مهم:** وتذكر ذلك أيضاً."]
+
+    assert build_prompt(sections) == "**مهم:** تذكر هذا.\n\n**مهم:** وتذكر ذلك أيضاً."
+
+
+def test_render_prompt_leaves_multiline_values_untouched():
+    template = """
+        النص:
+        {text}
+        """
+
+    assert render_prompt(template, text="سطر أول\n    سطر مزاح") == "النص:\nسطر أول\n    سطر مزاح"
+
+
+def test_therapeutic_prompt_has_the_final_instruction_heading_once():
+    chat = SimulatedProvider("gpt", ProviderProfile(latency=0.0, jitter=0.0))
+    claude = SimulatedProvider("claude", ProviderProfile(latency=0.0, jitter=0.0))
+    service = GPTService(SimulatedOpenAI(chat, chat, TranscriptRegistry(16000)), SimulatedAnthropic(claude))
+
+    prompt = service._create_therapeutic_prompt(False, "sad", 0.8, [])
+
+    assert prompt.count(FINAL_HEADING) == 1
+    assert "\n\n\n" not in prompt
+    assert all(line == line.rstrip() for line in prompt.splitlines())
@@ -0,0 +1,148 @@
+"""ProviderRateLimiter against the simulated provider, which answers with 429 and Retry-After."""
+
+import threading
+import time
+
+import pytest
+
+from benchmarks.provider_simulator import ProviderProfile, SimulatedAPIError, SimulatedProvider
+from utils.circuit_breaker import CircuitBreaker
+from utils.rate_limiter import (PRIORITY_CRISIS, PRIORITY_NORMAL, ProviderRateLimiter, RateLimitTimeout,
+                                _parse_reset)
+
+
+def provider(requests_per_second: float = 0.0, error_rate: float = 0.0) -> SimulatedProvider:
+    profile = ProviderProfile(latency=0.0, jitter=0.0, error_rate=error_rate,
+                              requests_per_second=requests_per_second)
+    return SimulatedProvider("gpt", profile, seed=1)
+
+
+def test_retries_a_429_after_retry_after():
+    server = provider(requests_per_second=2)
+    limiter = ProviderRateLimiter("gpt", requests_per_second=100)
+
+    started = time.monotonic()
+    for _ in range(4):
+        limiter.call(server.handle)
+    elapsed = time.monotonic() - started
+
+    # A burst of two fits the server's bucket; the next two are throttled at least once each
+    assert server.throttled >= 2
+    assert limiter.throttled_responses == server.throttled
+    # The server refills one request every 0.5s; each retry waited for it
+    assert elapsed >= 0.9
+    assert server.requests - server.throttled == 4
+
+
+def test_client_limit_avoids_429s():
+    server = provider(requests_per_second=5)
+    limiter = ProviderRateLimiter("gpt", requests_per_second=4)
+
+    for _ in range(8):
+        limiter.call(server.handle)
+
+    assert server.throttled == 0
+    assert limiter.stats()["total_requests"] == 8
+    assert limiter.stats()["max_wait"] > 0
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr("config.CONFIG.rate_limit_max_retries", 1)
+    server = provider(requests_per_second=1)
+    limiter = ProviderRateLimiter("gpt", requests_per_second=100)
+    limiter.call(server.handle)
+    # Never waiting for the slot the server asked for, the retry is throttled too
+    monkeypatch.setattr(limiter, "on_rate_limited", lambda headers: None)
+
+    with pytest.raises(SimulatedAPIError) as raised:
+        limiter.call(server.handle)
+    assert raised.value.http_status == 429
+    assert server.throttled == 2
+
+
+def test_exhausted_retries_are_not_breaker_failures(monkeypatch):
+    monkeypatch.setattr("config.CONFIG.rate_limit_max_retries", 0)
+    server = provider(requests_per_second=1)
+    limiter = ProviderRateLimiter("gpt", requests_per_second=100)
+    breaker = CircuitBreaker("gpt", min_calls=1)
+    limiter.call(server.handle, breaker=breaker)
+
+    with pytest.raises(SimulatedAPIError):
+        limiter.call(server.handle, breaker=breaker)
+    assert breaker.failures == 0
+    assert breaker.state == "closed"
+    # The final 429 still pauses the next request
+    assert limiter.throttled_responses == 1
+
+
+def test_server_errors_are_not_retried():
+    server = provider(error_rate=1.0)
+    limiter = ProviderRateLimiter("gpt", requests_per_second=100)
+
+    with pytest.raises(SimulatedAPIError) as raised:
+        limiter.call(server.handle)
+    assert raised.value.http_status == 500
+    assert server.requests == 1
+    assert limiter.throttled_responses == 0
+
+
+def test_crisis_requests_jump_the_queue():
+    limiter = ProviderRateLimiter("gpt", requests_per_second=10)
+    for _ in range(10):
+        limiter.acquire()  # empty the bucket so the next callers queue
+    served = []
+
+    def request(label: str, priority: int):
+        limiter.acquire(priority=priority)
+        served.append(label)
+
+    threads = []
+    for label, priority in (("first", PRIORITY_NORMAL), ("second", PRIORITY_NORMAL), ("crisis", PRIORITY_CRISIS)):
+        thread = threading.Thread(target=request, args=(label, priority))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+    assert limiter.queue_depth == 3
+    for thread in threads:
+        thread.join()
+
+    assert served == ["crisis", "first", "second"]
+
+
+def test_acquire_times_out():
+    limiter = ProviderRateLimiter("gpt", requests_per_second=1)
+    limiter.acquire()
+
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(timeout=0.05)
+    assert limiter.queue_depth == 0
+
+
+def test_headers_pause_requests():
+    limiter = ProviderRateLimiter("gpt", requests_per_second=100, tokens_per_minute=6000)
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "0",
+                                 "x-ratelimit-reset-requests": "200ms",
+                                 "x-ratelimit-remaining-tokens": "0"})
+
+    assert limiter.acquire() >= 0.15
+    assert limiter.token_bucket.tokens < 10
+
+
+def test_malformed_headers_are_ignored():
+    limiter = ProviderRateLimiter("gpt", requests_per_second=100, tokens_per_minute=6000)
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "n/a",
+                                 "x-ratelimit-limit-tokens": "",
+                                 "x-ratelimit-remaining-tokens": "lots",
+                                 "retry-after": "1.2.3s"})
+
+    assert limiter.token_bucket.capacity == 6000
+    assert limiter.token_bucket.tokens == 6000
+    assert limiter.acquire() < 0.05
+
+
+def test_parse_reset():
+    assert _parse_reset("6m0s") == 360
+    assert _parse_reset("20ms") == pytest.approx(0.02)
+    assert _parse_reset("1.5") == 1.5
+    assert _parse_reset("soon") is None
+    assert _parse_reset("1.2.3s") is None
@@ -0,0 +1,61 @@
+"""Polyphase resampler correctness on synthetic tones."""
+
+import numpy as np
+import pytest
+
+from benchmarks.resample_benchmark import CONVERSIONS, check, dominant_frequency, tone
+from utils.audio_buffer import AudioBuffer
+from utils.resample import resample
+
+
+@pytest.mark.parametrize("from_rate,to_rate", CONVERSIONS)
+def test_tone_matches_the_tone_generated_at_the_target_rate(from_rate, to_rate):
+    assert check(from_rate, to_rate) == []
+
+
+@pytest.mark.parametrize("from_rate,to_rate", [(22050, 16000), (24000, 48000)])
+def test_level_is_preserved(from_rate, to_rate):
+    resampled = resample(tone(440, from_rate, 1.0), from_rate, to_rate)
+    middle = resampled[to_rate // 10:-to_rate // 10]
+
+    assert np.sqrt(np.mean(middle ** 2)) == pytest.approx(0.5 / np.sqrt(2), rel=1e-3)
+    assert dominant_frequency(resampled, to_rate) == pytest.approx(440, abs=2)
+
+
+def test_tone_above_the_new_nyquist_is_removed():
+    # 10 kHz fits at 48 kHz but would alias to 6 kHz at 16 kHz
+    resampled = resample(tone(10000, 48000, 1.0), 48000, 16000)
+    middle = resampled[1600:-1600]
+
+    assert np.sqrt(np.mean(middle ** 2)) < 1e-3
+
+
+def test_round_trip_returns_the_original():
+    original = tone(300, 16000, 0.5)
+    round_trip = resample(resample(original, 16000, 48000), 48000, 16000)
+
+    assert round_trip.shape == original.shape
+    assert np.max(np.abs(round_trip[1600:-1600] - original[1600:-1600])) < 1e-3
+
+
+def test_output_length_and_dtype():
+    resampled = resample(np.zeros(1001, dtype=np.float64), 22050, 16000)
+
+    assert resampled.dtype == np.float32
+    assert resampled.shape[0] == -(-1001 * 16000 // 22050)
+
+
+def test_same_rate_is_not_copied_and_empty_input_is_fine():
+    samples = tone(440, 16000, 0.1)
+
+    assert np.shares_memory(resample(samples, 16000, 16000), samples)
+    assert resample(np.zeros(0, dtype=np.float32), 24000, 16000).shape == (0,)
+
+
+def test_audio_buffer_resample_tags_the_new_rate():
+    audio = AudioBuffer.from_float(tone(440, 24000, 0.5), 24000)
+    resampled = audio.resample(16000)
+
+    assert resampled.sample_rate == 16000
+    assert len(resampled) == 8000
+    assert resampled.duration == pytest.approx(audio.duration)
@@ -0,0 +1,125 @@
+"""Cutting replies to the sentence/character budget, finished and while streaming."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.provider_simulator import ProviderProfile, SimulatedAnthropic, SimulatedProvider
+from services.gpt_service import GPTService
+from utils.circuit_breaker import reset_circuit_breakers
+from utils.rate_limiter import reset_rate_limiters
+from utils.response_budget import (ResponseGovernor, reset_response_budget_stats, response_budget_stats,
+                                   trim_to_budget)
+
+REPLY = "أفهم شعورك. هذا طبيعي جداً. هل تريد أن تحدثني أكثر؟ أنا هنا لأسمعك."
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr("config.CONFIG.response_max_sentences", 2)
+    monkeypatch.setattr("config.CONFIG.response_max_chars", 0)
+    reset_response_budget_stats()
+    reset_rate_limiters()
+    reset_circuit_breakers()
+    yield
+    reset_rate_limiters()
+    reset_circuit_breakers()
+
+
+def test_cuts_at_the_end_of_the_last_allowed_sentence():
+    assert trim_to_budget(REPLY) == "أفهم شعورك. هذا طبيعي جداً."
+    assert trim_to_budget(REPLY, max_sentences=3) == "أفهم شعورك. هذا طبيعي جداً. هل تريد أن تحدثني أكثر؟"
+
+
+def test_reply_within_budget_is_untouched():
+    assert trim_to_budget("أفهم شعورك. هذا طبيعي جداً.") == "أفهم شعورك. هذا طبيعي جداً."
+    assert response_budget_stats()["within_budget"] == 1
+
+
+def test_decimal_point_does_not_end_a_sentence():
+    text = "حاول أن تنام 7.5 ساعات كل ليلة. ومارس المشي يومياً. وتحدث مع من تثق به."
+
+    assert trim_to_budget(text, max_sentences=1) == "حاول أن تنام 7.5 ساعات كل ليلة."
+
+
+def test_character_budget_cuts_at_a_sentence_end(monkeypatch):
+    monkeypatch.setattr("config.CONFIG.response_max_chars", 30)
+
+    assert trim_to_budget(REPLY, max_sentences=4) == "أفهم شعورك. هذا طبيعي جداً."
+    # A first sentence longer than the budget is kept whole rather than cut mid-sentence
+    assert trim_to_budget("هذه جملة أولى طويلة جداً تتجاوز الحد المسموح به. وجملة ثانية.",
+                          max_sentences=4) == "هذه جملة أولى طويلة جداً تتجاوز الحد المسموح به."
+
+
+def test_crisis_reply_is_never_cut():
+    crisis = "أنا قلق عليك. أرجوك لا تبقَ وحدك. اتصل الآن بخط المساعدة على الرقم 16262."
+
+    assert trim_to_budget(crisis, max_sentences=1, exempt=True) == crisis
+    assert response_budget_stats()["exempt"] == 1
+
+
+def test_governor_stops_once_text_past_the_budget_arrives():
+    governor = ResponseGovernor(max_sentences=2)
+    words = REPLY.split(" ")
+    fed = 0
+    for word in words:
+        fed += 1
+        if governor.feed(word + " "):
+            break
+
+    assert fed < len(words)
+    assert governor.settled() == "أفهم شعورك. هذا طبيعي جداً."
+    assert governor.finish() == "أفهم شعورك. هذا طبيعي جداً."
+    assert response_budget_stats()["stopped_early"] == 1
+
+
+class CountingOpenAI:
+    """openai stand-in whose streamed reply counts the chunks read and whether it was closed."""
+
+    def __init__(self, reply: str):
+        self.words = reply.split(" ")
+        self.read = 0
+        self.closed = False
+        self.api_key = None
+        self.ChatCompletion = SimpleNamespace(create=self._create)
+
+    def _create(self, stream: bool = False, **kwargs):
+        assert stream
+        return self._stream()
+
+    def _stream(self):
+        try:
+            for word in self.words:
+                self.read += 1
+                yield {"choices": [{"delta": {"content": word + " "}}]}
+        finally:
+            self.closed = True
+
+
+def gpt_service(openai_module) -> GPTService:
+    claude = SimulatedProvider("claude", ProviderProfile(latency=0.0, jitter=0.0))
+    return GPTService(openai_module, SimulatedAnthropic(claude))
+
+
+def stream(service: GPTService, is_crisis: bool = False, on_partial=None):
+    messages = [{"role": "system", "content": "x"}, {"role": "user", "content": "y"}]
+    return service._stream_gpt_response(messages, 300, 10, is_crisis, on_partial=on_partial)
+
+
+def test_stream_is_closed_once_the_budget_is_met():
+    openai_module = CountingOpenAI(REPLY)
+    partials = []
+
+    text = stream(gpt_service(openai_module), on_partial=partials.append)
+
+    assert text == "أفهم شعورك. هذا طبيعي جداً."
+    assert openai_module.read < len(openai_module.words)
+    assert openai_module.closed
+    assert partials == ["أفهم شعورك.", "أفهم شعورك. هذا طبيعي جداً."]
+
+
+def test_crisis_stream_is_read_in_full():
+    openai_module = CountingOpenAI(REPLY)
+
+    assert stream(gpt_service(openai_module), is_crisis=True) == REPLY
+    assert openai_module.read == len(openai_module.words)
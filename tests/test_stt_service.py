@@ -0,0 +1,124 @@
+"""STTService over the offline StaticSTTEngine test double and the simulated Whisper API."""
+
+import threading
+
+import numpy as np
+import pytest
+
+from benchmarks.provider_simulator import ProviderProfile, SimulatedOpenAI, SimulatedProvider, TranscriptRegistry
+from services.stt_engines import OpenAIWhisperEngine, StaticSTTEngine, create_stt_engines
+from services.stt_service import STTService
+from utils.audio_buffer import AudioBuffer
+from utils.cancellation import CancellationToken, TurnCancelled
+from utils.circuit_breaker import reset_circuit_breakers
+from utils.rate_limiter import reset_rate_limiters
+
+CAPTURE_RATE = 22050
+
+
+def utterance(seconds: float = 1.0, sample_rate: int = CAPTURE_RATE) -> bytes:
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return AudioBuffer.from_float(0.2 * np.sin(2 * np.pi * 180 * t), sample_rate).to_wav_bytes()
+
+
+@pytest.fixture(autouse=True)
+def fresh_providers():
+    reset_rate_limiters()
+    reset_circuit_breakers()
+    yield
+    reset_rate_limiters()
+    reset_circuit_breakers()
+
+
+def test_engines_get_audio_at_the_stt_rate(monkeypatch):
+    monkeypatch.setattr("config.CONFIG.stt_sample_rate", 16000)
+    engine = StaticSTTEngine("مرحبا")
+    service = STTService([engine])
+
+    assert service.transcribe_audio(utterance(1.0)) == "مرحبا"
+    assert service.last_engine == "static"
+    assert engine.calls[0].sample_rate == 16000
+    assert len(engine.calls[0]) == 16000
+
+
+def test_falls_back_to_the_next_engine():
+    failing = StaticSTTEngine(fail=True)
+    backup = StaticSTTEngine(["أولى", "ثانية"])
+    service = STTService([failing, backup])
+
+    assert service.transcribe_audio(utterance()) == "أولى"
+    assert service.transcribe_audio(utterance()) == "ثانية"
+    assert len(failing.calls) == 2
+    assert service.last_engine == "static"
+
+
+def test_returns_none_when_every_engine_fails():
+    service = STTService([StaticSTTEngine(fail=True), StaticSTTEngine(fail=True)])
+
+    assert service.transcribe_audio(utterance()) is None
+
+
+def test_empty_transcript_falls_back_to_the_next_engine():
+    silent = StaticSTTEngine(["", "   "])
+    backup = StaticSTTEngine("مرحبا")
+    service = STTService([silent, backup])
+
+    assert service.transcribe_audio(utterance()) == "مرحبا"
+    assert service.transcribe_audio(utterance()) == "مرحبا"
+    assert len(backup.calls) == 2
+
+
+def test_returns_none_when_every_transcript_is_empty():
+    assert STTService([StaticSTTEngine()]).transcribe_audio(utterance()) is None
+
+
+def test_undecodable_audio_reaches_no_engine():
+    engine = StaticSTTEngine("مرحبا")
+
+    assert STTService([engine]).transcribe_audio(b"not a wav file") is None
+    assert engine.calls == []
+
+
+def test_transcript_can_depend_on_the_audio():
+    engine = StaticSTTEngine(lambda audio: f"{audio.duration:.1f}s")
+
+    assert STTService([engine]).transcribe_audio(utterance(0.5)) == "0.5s"
+
+
+def test_cancelling_stops_a_slow_engine():
+    token = CancellationToken()
+    engine = StaticSTTEngine("مرحبا", delay=5.0)
+    threading.Timer(0.05, token.cancel).start()
+
+    with pytest.raises(TurnCancelled):
+        STTService([engine]).transcribe_audio(utterance(), token)
+
+
+def test_create_stt_engines_skips_unknown_names():
+    engines = create_stt_engines(["missing", "static"])
+
+    assert [engine.name for engine in engines] == ["static"]
+
+
+def test_openai_engine_against_the_simulated_api(monkeypatch):
+    monkeypatch.setattr("config.CONFIG.stt_sample_rate", 16000)
+    registry = TranscriptRegistry(16000)
+    audio = registry.synthesize("أحس بضيق", CAPTURE_RATE)
+    whisper = SimulatedProvider("whisper", ProviderProfile(latency=0.0, jitter=0.0))
+    chat = SimulatedProvider("gpt", ProviderProfile(latency=0.0, jitter=0.0))
+    engine = OpenAIWhisperEngine(SimulatedOpenAI(chat, whisper, registry))
+
+    assert STTService([engine]).transcribe_audio(audio.to_wav_bytes()) == "أحس بضيق"
+    assert whisper.requests == 1
+
+
+def test_openai_outage_falls_back_to_the_local_engine():
+    registry = TranscriptRegistry(16000)
+    whisper = SimulatedProvider("whisper", ProviderProfile(latency=0.0, jitter=0.0, error_rate=1.0))
+    chat = SimulatedProvider("gpt", ProviderProfile(latency=0.0))
+    local = StaticSTTEngine("محلي")
+    service = STTService([OpenAIWhisperEngine(SimulatedOpenAI(chat, whisper, registry)), local])
+
+    assert service.transcribe_audio(utterance()) == "محلي"
+    assert whisper.errors == 1
+    assert len(local.calls) == 1
@@ -0,0 +1,79 @@
+"""Per-stage token totals and the per-turn accounting of track_turn_tokens."""
+
+import threading
+
+import pytest
+
+from utils.token_usage import exceeds_budget, record_tokens, reset_token_usage, token_usage_stats, track_turn_tokens
+
+
+@pytest.fixture(autouse=True)
+def fresh_usage():
+    reset_token_usage()
+    yield
+    reset_token_usage()
+
+
+def test_stage_totals_and_averages():
+    record_tokens("gpt", 1000, 40, estimated_input=900)
+    record_tokens("gpt", 2000, 60, estimated_input=2100)
+    record_tokens("claude_validation", 300, 5)
+
+    stats = token_usage_stats()
+    assert stats["gpt"]["requests"] == 2
+    assert stats["gpt"]["input_tokens"] == 3000
+    assert stats["gpt"]["output_tokens"] == 100
+    assert stats["gpt"]["max_input_tokens"] == 2000
+    assert stats["gpt"]["avg_input_tokens"] == 1500.0
+    assert stats["gpt"]["estimate_ratio"] == 1.0
+    assert stats["claude_validation"]["requests"] == 1
+
+
+def test_turn_collects_only_its_own_requests_per_stage():
+    record_tokens("gpt", 999, 9)
+    with track_turn_tokens() as turn:
+        record_tokens("gpt", 100, 10)
+        record_tokens("gpt", 50, 5)
+        record_tokens("claude_validation", 30, 3)
+    record_tokens("gpt", 999, 9)
+
+    assert turn == {"gpt": {"input": 150, "output": 15}, "claude_validation": {"input": 30, "output": 3}}
+    assert token_usage_stats()["gpt"]["requests"] == 4
+
+
+def test_nested_turn_restores_the_outer_one():
+    with track_turn_tokens() as outer:
+        with track_turn_tokens() as inner:
+            record_tokens("gpt", 10, 1)
+        record_tokens("gpt", 20, 2)
+
+    assert inner == {"gpt": {"input": 10, "output": 1}}
+    assert outer == {"gpt": {"input": 20, "output": 2}}
+
+
+def test_turns_on_other_threads_are_kept_apart():
+    turns = {}
+
+    def run(name: str, tokens: int):
+        with track_turn_tokens() as turn:
+            record_tokens("gpt", tokens, 1)
+        turns[name] = turn
+
+    threads = [threading.Thread(target=run, args=(name, tokens)) for name, tokens in (("a", 100), ("b", 200))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert turns["a"] == {"gpt": {"input": 100, "output": 1}}
+    assert turns["b"] == {"gpt": {"input": 200, "output": 1}}
+    assert token_usage_stats()["gpt"]["input_tokens"] == 300
+
+
+def test_over_budget_prompts_are_counted(monkeypatch):
+    monkeypatch.setattr("config.CONFIG.prompt_token_budgets", {"gpt": 1000})
+
+    assert not exceeds_budget("gpt", 900)
+    assert exceeds_budget("gpt", 1200)
+    assert not exceeds_budget("claude_fallback", 50000)
+    assert token_usage_stats()["gpt"]["over_budget"] == 1
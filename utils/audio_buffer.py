@@ -0,0 +1,92 @@
+"""Contiguous audio buffers that carry their sample rate through the pipeline."""
+
+import io
+import wave
+from dataclasses import dataclass
+from typing import Iterator, Union
+
+import numpy as np
+
+from utils.resample import resample
+
+PCM16_SCALE = 32767.0
+
+
+@dataclass(frozen=True)
+class AudioBuffer:
+    """Mono float32 samples in [-1, 1] tagged with their sample rate.
+
+    Float32 is the internal format; int16 PCM is only produced at the
+    storage and network edges.
+    """
+
+    samples: np.ndarray
+    sample_rate: int
+
+    def __post_init__(self):
+        if self.samples.dtype != np.float32 or self.samples.ndim != 1 \
+                or not self.samples.flags.c_contiguous:
+            raise ValueError("AudioBuffer samples must be a contiguous 1-D float32 array")
+
+    @classmethod
+    def from_float(cls, data, sample_rate: int) -> "AudioBuffer":
+        """Wrap float samples; arrays that are already float32 are not copied."""
+        samples = np.ascontiguousarray(np.asarray(data, dtype=np.float32).reshape(-1))
+        return cls(samples, int(sample_rate))
+
+    @classmethod
+    def from_pcm16(cls, data: Union[bytes, bytearray, memoryview, np.ndarray],
+                   sample_rate: int) -> "AudioBuffer":
+        """Decode little-endian int16 PCM with a single float32 allocation."""
+        pcm = data if isinstance(data, np.ndarray) else np.frombuffer(data, dtype='<i2')
+        samples = np.empty(pcm.shape[0], dtype=np.float32)
+        np.multiply(pcm, 1.0 / PCM16_SCALE, out=samples, casting='unsafe')
+        return cls(samples, int(sample_rate))
+
+    @classmethod
+    def from_wav_bytes(cls, wav_bytes: bytes) -> "AudioBuffer":
+        """Decode a 16-bit PCM WAV file, down-mixing to mono."""
+        with wave.open(io.BytesIO(wav_bytes), 'rb') as wav_file:
+            if wav_file.getsampwidth() != 2:
+                raise ValueError("Only 16-bit PCM WAV is supported")
+            channels = wav_file.getnchannels()
+            sample_rate = wav_file.getframerate()
+            pcm = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype='<i2')
+        if channels > 1:
+            pcm = pcm.reshape(-1, channels).mean(axis=1)
+        return cls.from_pcm16(pcm, sample_rate)
+
+    @property
+    def duration(self) -> float:
+        return self.samples.shape[0] / self.sample_rate
+
+    def __len__(self) -> int:
+        return self.samples.shape[0]
+
+    def resample(self, sample_rate: int) -> "AudioBuffer":
+        """Convert to another sample rate; returns ``self`` when it already matches."""
+        if sample_rate == self.sample_rate:
+            return self
+        return AudioBuffer(resample(self.samples, self.sample_rate, sample_rate), int(sample_rate))
+
+    def to_pcm16(self) -> np.ndarray:
+        """Encode to little-endian int16 PCM, clipping out-of-range samples."""
+        pcm = np.empty(self.samples.shape[0], dtype='<i2')
+        np.multiply(np.clip(self.samples, -1.0, 1.0), PCM16_SCALE, out=pcm, casting='unsafe')
+        return pcm
+
+    def iter_pcm16_chunks(self, chunk_ms: int) -> Iterator[memoryview]:
+        """Yield views over one int16 encoding of the buffer, ``chunk_ms`` long each."""
+        pcm = memoryview(self.to_pcm16()).cast('B')
+        step = max(1, self.sample_rate * chunk_ms // 1000) * 2
+        for offset in range(0, len(pcm), step):
+            yield pcm[offset:offset + step]
+
+    def to_wav_bytes(self) -> bytes:
+        wav_buffer = io.BytesIO()
+        with wave.open(wav_buffer, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.sample_rate)
+            wav_file.writeframes(self.to_pcm16())
+        return wav_buffer.getvalue()
@@ -0,0 +1,281 @@
+"""Audio device abstraction so capture and playback can run against files in tests."""
+
+import logging
+import threading
+import time
+import wave
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class InputDevice(ABC):
+    """Blocking mono int16 capture source."""
+
+    sample_rate: int
+
+    def start(self):
+        pass
+
+    @abstractmethod
+    def read(self, frames: int) -> np.ndarray:
+        """Return exactly ``frames`` int16 samples, blocking until they are captured."""
+
+    def close(self):
+        pass
+
+
+class CallbackInputDevice(ABC):
+    """Push-mode mono int16 capture source.
+
+    ``callback`` is called from the device thread with each captured block;
+    the array may be reused by the device, so it must be copied if kept.
+    """
+
+    sample_rate: int
+
+    @abstractmethod
+    def start(self, callback: Callable[[np.ndarray], None]):
+        ...
+
+    @abstractmethod
+    def stop(self):
+        ...
+
+
+class OutputDevice(ABC):
+    """Blocking mono float32 playback sink."""
+
+    def device_rate(self, sample_rate: int) -> int:
+        """Rate audio must be resampled to before ``start``; by default any rate is played as is."""
+        return sample_rate
+
+    @abstractmethod
+    def start(self, sample_rate: int):
+        ...
+
+    @abstractmethod
+    def write(self, samples: np.ndarray):
+        """Queue float32 samples, blocking while the device buffer is full."""
+
+    @abstractmethod
+    def abort(self):
+        """Stop immediately, discarding anything still buffered."""
+
+    @abstractmethod
+    def finish(self):
+        """Wait for buffered audio to play out, then stop."""
+
+
+class SoundDeviceInput(InputDevice):
+    """Microphone capture through sounddevice."""
+
+    def __init__(self, sample_rate: int, blocksize: int = 0, device=None):
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.device = device
+        self.stream = None
+
+    def start(self):
+        import sounddevice as sd
+
+        if self.stream is None:
+            self.stream = sd.InputStream(samplerate=self.sample_rate, channels=1, dtype='int16',
+                                         blocksize=self.blocksize, device=self.device)
+            self.stream.start()
+
+    def read(self, frames: int) -> np.ndarray:
+        self.start()
+        data, overflowed = self.stream.read(frames)
+        if overflowed:
+            logger.warning("Microphone input overflowed; samples were dropped")
+        return data.reshape(-1)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+class SoundDeviceCallbackInput(CallbackInputDevice):
+    """Microphone capture through a sounddevice stream in callback mode."""
+
+    def __init__(self, sample_rate: int, blocksize: int = 0, device=None):
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.device = device
+        self.stream = None
+        self.overflows = 0
+
+    def start(self, callback: Callable[[np.ndarray], None]):
+        import sounddevice as sd
+
+        def on_block(indata, frames, time_info, status):
+            if status.input_overflow:
+                self.overflows += 1
+            callback(indata[:, 0])
+
+        self.stream = sd.InputStream(samplerate=self.sample_rate, channels=1, dtype='int16',
+                                     blocksize=self.blocksize, device=self.device,
+                                     callback=on_block)
+        self.stream.start()
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+            if self.overflows:
+                logger.warning(f"Microphone input overflowed {self.overflows} times; samples were dropped")
+
+
+class SoundDeviceOutput(OutputDevice):
+    """Speaker playback through sounddevice."""
+
+    def __init__(self, device=None, latency: str = 'low', sample_rate: Optional[int] = None):
+        self.device = device
+        self.latency = latency
+        self.stream = None
+        self.sample_rate = None
+        self.fixed_rate = sample_rate  # None uses the device's default rate
+
+    def device_rate(self, sample_rate: int) -> int:
+        import sounddevice as sd
+
+        if not self.fixed_rate:
+            self.fixed_rate = int(sd.query_devices(self.device, 'output')['default_samplerate'])
+        return self.fixed_rate
+
+    def start(self, sample_rate: int):
+        import sounddevice as sd
+
+        if self.stream is not None and self.sample_rate != sample_rate:
+            self.stream.close()
+            self.stream = None
+        if self.stream is None:
+            self.stream = sd.OutputStream(samplerate=sample_rate, channels=1, dtype='float32',
+                                          device=self.device, latency=self.latency)
+            self.sample_rate = sample_rate
+        if not self.stream.active:
+            self.stream.start()
+
+    def write(self, samples: np.ndarray):
+        self.stream.write(samples)
+
+    def abort(self):
+        if self.stream is not None and self.stream.active:
+            self.stream.abort()
+
+    def finish(self):
+        if self.stream is not None and self.stream.active:
+            self.stream.stop()
+
+
+class WavFileInput(InputDevice):
+    """Replays a 16-bit mono WAV file as if it were a microphone.
+
+    After the file ends it returns silence, like a quiet room.
+    """
+
+    def __init__(self, path: str):
+        with wave.open(path, 'rb') as wav_file:
+            if wav_file.getsampwidth() != 2 or wav_file.getnchannels() != 1:
+                raise ValueError("WavFileInput needs a 16-bit mono WAV file")
+            self.sample_rate = wav_file.getframerate()
+            self.samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype='<i2')
+        self.position = 0
+
+    def read(self, frames: int) -> np.ndarray:
+        chunk = self.samples[self.position:self.position + frames]
+        self.position += frames
+        if chunk.shape[0] < frames:
+            chunk = np.concatenate([chunk, np.zeros(frames - chunk.shape[0], dtype=np.int16)])
+        return chunk
+
+    @property
+    def exhausted(self) -> bool:
+        return self.position >= self.samples.shape[0]
+
+
+class WavFileCallbackInput(CallbackInputDevice):
+    """Pushes a 16-bit mono WAV file in fixed blocks, then silence, like a microphone.
+
+    With ``realtime=False`` the file itself is pushed as fast as possible
+    (the trailing silence still runs in real time), which keeps tests fast.
+    """
+
+    def __init__(self, path: str, block_ms: int = 20, realtime: bool = True):
+        self.source = WavFileInput(path)
+        self.sample_rate = self.source.sample_rate
+        self.block = max(1, self.sample_rate * block_ms // 1000)
+        self.realtime = realtime
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, callback: Callable[[np.ndarray], None]):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(callback,),
+                                        name="wav-capture", daemon=True)
+        self._thread.start()
+
+    def _run(self, callback: Callable[[np.ndarray], None]):
+        interval = self.block / self.sample_rate
+        next_block = time.monotonic()
+        while not self._stop.is_set():
+            callback(self.source.read(self.block))
+            next_block += interval
+            if not self.realtime and not self.source.exhausted:
+                next_block = time.monotonic()
+                continue
+            self._stop.wait(max(0.0, next_block - time.monotonic()))
+
+    @property
+    def exhausted(self) -> bool:
+        return self.source.exhausted
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class WavFileOutput(OutputDevice):
+    """Collects played audio in memory and optionally writes it to a WAV file."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.sample_rate = None
+        self.chunks: List[np.ndarray] = []
+        self.aborted = False
+
+    def start(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.chunks = []
+        self.aborted = False
+
+    def write(self, samples: np.ndarray):
+        self.chunks.append(np.array(samples, dtype=np.float32))
+
+    @property
+    def played(self) -> np.ndarray:
+        return np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=np.float32)
+
+    def abort(self):
+        self.aborted = True
+        self._save()
+
+    def finish(self):
+        self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        pcm = (np.clip(self.played, -1.0, 1.0) * 32767).astype('<i2')
+        with wave.open(self.path, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.sample_rate)
+            wav_file.writeframes(pcm.tobytes())
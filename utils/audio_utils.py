@@ -2,103 +2,92 @@
 
 import pyaudio
 import wave
-import numpy as np
 import io
+import threading
 import streamlit as st
-from typing import Optional, Tuple
-import time
+from typing import Callable, Optional
+from config import CONFIG
+from utils.barge_in import frame_rms
+from utils.capture_engine import CaptureEngine, get_capture_engine
 
 class AudioRecorder:
-    """Handle audio recording functionality."""
+    """Handle audio recording functionality on top of the shared capture engine.
     
-    def __init__(self, sample_rate: int = 22050, channels: int = 1):
-        self.sample_rate = sample_rate
-        self.channels = channels
-        self.chunk_size = 1024
+    Recordings are mono 16-bit WAV at the capture engine's sample rate
+    (``CONFIG.sample_rate`` for the process-wide engine).
+    """
+    
+    def __init__(self, engine: Optional[CaptureEngine] = None):
         self.audio_format = pyaudio.paInt16
-        
-        # VAD Parameters
-        self.SILENCE_THRESHOLD = 35  # Adjust this value based on your microphone and environment noise. 
-                                      # Higher means less sensitive to quiet sounds. Lower means more sensitive.
-        self.SILENCE_CHUNKS = int(self.sample_rate / self.chunk_size * 1.5) # 1.5 seconds of silence to stop
-        self.MAX_RECORDING_DURATION_CHUNKS = int(self.sample_rate / self.chunk_size * 30) # Max 30 seconds to prevent infinite recording
-                                                                                         # (adjust as per config.py)
+        # The microphone stays open between turns; None means the process-wide engine
+        self.engine = engine
+        self._stop = threading.Event()
 
-    def record_audio(self) -> bytes: # 'duration' parameter will now be ignored for VAD
-        """Record audio from microphone with Voice Activity Detection (VAD)."""
-        audio = pyaudio.PyAudio()
-        
-        try:
-            stream = audio.open(
-                format=self.audio_format,
-                channels=self.channels,
-                rate=self.sample_rate,
-                input=True,
-                frames_per_buffer=self.chunk_size
-            )
-            
-            frames = []
-            silent_chunks = 0
-            speaking = False # State to track if user is currently speaking
-            
-            st.write("Listening for your voice...") # Provide initial feedback
-            
-            chunk_count = 0
-            while True:
-                data = stream.read(self.chunk_size)
-                np_data = np.frombuffer(data, dtype=np.int16)
-                
-                # Calculate RMS (Root Mean Square) energy of the chunk
-                mean_squared = np.mean(np_data**2) if np_data.size > 0 else 0
-                rms = np.sqrt(max(0.0, mean_squared))
+    def stop(self):
+        """Abort a recording in progress from another thread (e.g. the Stop button)."""
+        self._stop.set()
 
-                # print(f"Chunk {chunk_count}: RMS = {rms:.2f}")  # Debugging output
+    def record_audio(self, on_speech_end: Optional[Callable[[], None]] = None) -> bytes:
+        """Record one utterance with energy-based Voice Activity Detection (VAD).
 
-                
-                # Simple VAD logic
-                if rms < self.SILENCE_THRESHOLD:
-                    silent_chunks = 0
-                    if not speaking:
-                        speaking = True
-                        st.write("🚀 Recording...") # Indicate active recording
-                    frames.append(data)
-                elif speaking: # If we were speaking, but now it's quiet
-                    silent_chunks += 1
-                    frames.append(data) # Keep recording for a bit after silence starts
-                    if silent_chunks > self.SILENCE_CHUNKS:
-                        st.write("✅ Detected silence, stopping recording.")
-                        break # Stop recording
-                else: # Not speaking yet, just silence before speech starts
-                    pass # Don't append silent chunks before speech starts
-                
-                chunk_count += 1
-                if chunk_count > self.MAX_RECORDING_DURATION_CHUNKS:
-                    st.warning(f"🚫 Maximum recording duration ({self.MAX_RECORDING_DURATION_CHUNKS * self.chunk_size / self.sample_rate:.1f}s) reached.")
-                    break # Stop if max duration reached
-                    
-            stream.stop_stream()
-            stream.close()
-            
-            audio_data = b''.join(frames)
-            
-            # If no audio was recorded (e.g., user just clicked and didn't speak)
-            if not audio_data:
-                st.warning("No speech detected. Please try again.")
-                return b'' # Return empty bytes
-            
-            return self._frames_to_wav_bytes(audio_data)
+        Recording starts at the first speech frame, including a short pre-roll
+        that may predate the call, and ends after ``vad_end_silence_ms`` of
+        silence or ``max_recording_duration``. ``on_speech_end`` is called the
+        moment the end of speech is detected, before the WAV is encoded.
+        """
+        self._stop.clear()
+        engine = self.engine or get_capture_engine()
+        frame = max(1, engine.sample_rate * CONFIG.audio_frame_ms // 1000)
+        pre_roll = engine.sample_rate * CONFIG.vad_pre_roll_ms // 1000
+        silence_limit = max(1, CONFIG.vad_end_silence_ms // CONFIG.audio_frame_ms)
+        max_samples = CONFIG.max_recording_duration * engine.sample_rate
+        
+        reader = engine.reader()
+        began = reader.cursor
+        speech_start = None  # absolute sample index in the capture engine
+        silent_frames = 0
+        
+        st.write("Listening for your voice...") # Provide initial feedback
+        
+        while reader.cursor - began < max_samples:
+            if self._stop.is_set():
+                return b''
             
-        finally:
-            audio.terminate()
+            samples = reader.read(frame)
+            if frame_rms(samples) > CONFIG.vad_threshold:
+                silent_frames = 0
+                if speech_start is None:
+                    speech_start = reader.cursor - frame - pre_roll
+                    st.write("🚀 Recording...") # Indicate active recording
+            elif speech_start is not None:
+                silent_frames += 1 # Keep recording for a bit after silence starts
+                if silent_frames >= silence_limit:
+                    st.write("✅ Detected silence, stopping recording.")
+                    break
+        else:
+            st.warning(f"🚫 Maximum recording duration ({CONFIG.max_recording_duration}s) reached.")
+        
+        # If no audio was recorded (e.g., user just clicked and didn't speak)
+        if speech_start is None:
+            st.warning("No speech detected. Please try again.")
+            return b'' # Return empty bytes
+        
+        if on_speech_end is not None:
+            on_speech_end()
+        
+        # One contiguous copy out of the ring buffer
+        audio_data = engine.read(speech_start, reader.cursor)
+        return self._frames_to_wav_bytes(audio_data.astype('<i2', copy=False).tobytes(),
+                                         engine.sample_rate)
     
-    def _frames_to_wav_bytes(self, frames: bytes) -> bytes:
+    def _frames_to_wav_bytes(self, frames: bytes, sample_rate: int) -> bytes:
         """Convert audio frames to WAV bytes."""
         wav_buffer = io.BytesIO()
         
         with wave.open(wav_buffer, 'wb') as wav_file:
-            wav_file.setnchannels(self.channels)
+            wav_file.setnchannels(1)
             wav_file.setsampwidth(pyaudio.get_sample_size(self.audio_format))
-            wav_file.setframerate(self.sample_rate)
+            wav_file.setframerate(sample_rate)
             wav_file.writeframes(frames)
         
         return wav_buffer.getvalue()
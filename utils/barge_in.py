@@ -0,0 +1,144 @@
+"""Full-duplex playback that lets the user interrupt the therapist (barge-in)."""
+
+import io
+import logging
+import threading
+import wave
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+from config import CONFIG
+from utils.audio_buffer import AudioBuffer
+from utils.audio_devices import InputDevice, OutputDevice
+
+logger = logging.getLogger(__name__)
+
+
+def frame_rms(frame: np.ndarray) -> float:
+    """RMS of a frame, computed in float to avoid int16 overflow."""
+    if frame.size == 0:
+        return 0.0
+    samples = frame.astype(np.float32)
+    return float(np.sqrt(np.dot(samples, samples) / samples.size))
+
+
+class BargeInDetector:
+    """Energy VAD with echo gating.
+
+    A microphone frame only counts as user speech when it is louder than the
+    absolute threshold and clearly louder than the echo expected from what
+    the speaker is currently playing.
+    """
+
+    def __init__(self,
+                 threshold: Optional[float] = None,
+                 echo_gain: Optional[float] = None,
+                 min_speech_frames: Optional[int] = None):
+        self.threshold = threshold if threshold is not None else CONFIG.barge_in_threshold
+        self.echo_gain = echo_gain if echo_gain is not None else CONFIG.barge_in_echo_gain
+        self.min_speech_frames = min_speech_frames or max(
+            1, CONFIG.barge_in_min_speech_ms // CONFIG.audio_frame_ms)
+        self.speech_frames = 0
+
+    def reset(self):
+        self.speech_frames = 0
+
+    def is_speech(self, mic_frame: np.ndarray, playback_frame: Optional[np.ndarray] = None) -> bool:
+        level = frame_rms(mic_frame)
+        echo = 0.0
+        if playback_frame is not None:
+            # Playback is float32 in [-1, 1]; the mic frame is int16
+            echo = frame_rms(playback_frame) * 32767 * self.echo_gain
+        return level > max(self.threshold, echo)
+
+    def process(self, mic_frame: np.ndarray, playback_frame: Optional[np.ndarray] = None) -> bool:
+        """Feed one frame; True once enough consecutive speech frames were seen."""
+        if self.is_speech(mic_frame, playback_frame):
+            self.speech_frames += 1
+        else:
+            self.speech_frames = 0
+        return self.speech_frames >= self.min_speech_frames
+
+
+class DuplexPlayer:
+    """Plays a reply while listening to the microphone.
+
+    If the user starts talking, output is aborted and the captured speech
+    (including the frames that triggered detection) is returned as WAV bytes
+    ready for the next turn.
+    """
+
+    def __init__(self, input_device: InputDevice, output_device: OutputDevice,
+                 detector: Optional[BargeInDetector] = None):
+        self.input_device = input_device
+        self.output_device = output_device
+        self.detector = detector or BargeInDetector()
+        self._stop = threading.Event()
+        self.interrupted_at = None  # seconds into the reply of the last barge-in
+
+    def stop(self):
+        """Stop playback from another thread (e.g. the Stop button)."""
+        self._stop.set()
+
+    def play(self, audio: AudioBuffer) -> Optional[bytes]:
+        """Play ``audio``; returns the user's interrupting speech, or None."""
+        self._stop.clear()
+        self.detector.reset()
+        self.interrupted_at = None
+        audio = audio.resample(self.output_device.device_rate(audio.sample_rate))
+
+        frame_ms = CONFIG.audio_frame_ms
+        out_frame = max(1, audio.sample_rate * frame_ms // 1000)
+        in_frame = max(1, self.input_device.sample_rate * frame_ms // 1000)
+        pre_roll = deque(maxlen=self.detector.min_speech_frames + CONFIG.barge_in_pre_roll_ms // frame_ms)
+
+        self.input_device.start()
+        self.output_device.start(audio.sample_rate)
+        samples = audio.samples
+        try:
+            for offset in range(0, samples.shape[0], out_frame):
+                if self._stop.is_set():
+                    self.output_device.abort()
+                    return None
+
+                playback_frame = samples[offset:offset + out_frame]
+                self.output_device.write(playback_frame)
+                mic_frame = self.input_device.read(in_frame)
+                pre_roll.append(mic_frame)
+
+                if self.detector.process(mic_frame, playback_frame):
+                    self.output_device.abort()
+                    self.interrupted_at = offset / audio.sample_rate
+                    logger.info(f"Barge-in detected {self.interrupted_at:.2f}s into playback")
+                    return self._capture_rest(list(pre_roll), in_frame)
+
+            self.output_device.finish()
+            return None
+        except Exception:
+            self.output_device.abort()
+            raise
+        finally:
+            # Capture only needs to stay open while the therapist is talking
+            self.input_device.close()
+
+    def _capture_rest(self, frames: list, in_frame: int) -> bytes:
+        """Keep recording the interrupting utterance until the user goes quiet."""
+        frame_ms = CONFIG.audio_frame_ms
+        silence_limit = CONFIG.vad_end_silence_ms // frame_ms
+        max_frames = CONFIG.max_recording_duration * 1000 // frame_ms
+        silent = 0
+
+        while len(frames) < max_frames and silent < silence_limit and not self._stop.is_set():
+            mic_frame = self.input_device.read(in_frame)
+            frames.append(mic_frame)
+            silent = 0 if self.detector.is_speech(mic_frame) else silent + 1
+
+        wav_buffer = io.BytesIO()
+        with wave.open(wav_buffer, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(self.input_device.sample_rate)
+            wav_file.writeframes(np.concatenate(frames).astype('<i2').tobytes())
+        return wav_buffer.getvalue()
@@ -0,0 +1,151 @@
+"""Cooperative cancellation for pipeline turns."""
+
+import contextvars
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class TurnCancelled(BaseException):
+    """Raised inside a stage when its turn was cancelled.
+
+    Derives from BaseException (like asyncio.CancelledError) so the services'
+    broad ``except Exception`` fallbacks don't turn a cancel into a retry.
+    """
+
+
+_counts = Counter()
+_abandoned = {"calls": 0, "running": 0}  # provider calls a cancelled turn stopped waiting on
+_counts_lock = threading.Lock()
+
+
+def record_cancellation(stage: str):
+    with _counts_lock:
+        _counts[stage] += 1
+
+
+def cancellation_stats() -> Dict[str, int]:
+    """How many turns were cancelled, per stage that noticed it, and the provider calls they abandoned.
+
+    ``abandoned_running`` counts abandoned calls still holding a thread of
+    the provider call pool (of ``call_pool_workers``) until they return.
+    """
+    with _counts_lock:
+        stats = dict(_counts)
+        stats["abandoned_calls"] = _abandoned["calls"]
+        stats["abandoned_running"] = _abandoned["running"]
+    stats["call_pool_workers"] = _CALL_WORKERS
+    return stats
+
+
+class CancellationToken:
+    """Shared flag a caller sets to abandon a turn, with wake-up callbacks."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self.reason = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks)
+        logger.info(f"Turn cancelled: {reason}")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancellation callback failed: {str(e)}")
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run ``callback`` on cancel (immediately if already cancelled); returns an unregister function."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+
+                def unregister():
+                    with self._lock:
+                        if callback in self._callbacks:
+                            self._callbacks.remove(callback)
+                return unregister
+        callback()
+        return lambda: None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self, stage: str):
+        if self._event.is_set():
+            record_cancellation(stage)
+            raise TurnCancelled(stage)
+
+
+def raise_if_cancelled(token: Optional[CancellationToken], stage: str):
+    """Checkpoint helper that accepts a missing token."""
+    if token is not None:
+        token.raise_if_cancelled(stage)
+
+
+# Stages of one turn that can have a provider call in flight at once
+# (transcription, reply, validation, speech)
+_STAGES_IN_FLIGHT = 4
+_CALL_WORKERS = max(CONFIG.provider_call_workers, CONFIG.server_max_workers * _STAGES_IN_FLIGHT)
+
+# Blocking provider calls run here so a cancelled turn can stop waiting on them
+_call_pool = ThreadPoolExecutor(max_workers=_CALL_WORKERS, thread_name_prefix="provider-call")
+
+
+def _abandon(future):
+    """Count a call the turn stopped waiting on until it lets go of its thread."""
+    if future.cancel():
+        return  # never started
+    with _counts_lock:
+        _abandoned["calls"] += 1
+        _abandoned["running"] += 1
+
+    def released(_):
+        with _counts_lock:
+            _abandoned["running"] -= 1
+    future.add_done_callback(released)
+
+
+def run_cancellable(fn: Callable[[], Any], token: Optional[CancellationToken], stage: str) -> Any:
+    """Run a blocking call, returning early with TurnCancelled if the token fires.
+
+    Clients without an abort hook keep their socket (and a pool thread)
+    until the provider answers or their request timeout fires, but the
+    turn stops waiting immediately and no later stage runs; the late
+    result is discarded.
+    """
+    if token is None:
+        return fn()
+    token.raise_if_cancelled(stage)
+
+    finished = threading.Event()
+    # Context variables (such as the active cassette) follow the call into the pool
+    future = _call_pool.submit(contextvars.copy_context().run, fn)
+    future.add_done_callback(lambda _: finished.set())
+    unregister = token.on_cancel(finished.set)
+    try:
+        finished.wait()
+        if not future.done():
+            _abandon(future)
+            record_cancellation(stage)
+            raise TurnCancelled(stage)
+        return future.result()
+    finally:
+        unregister()
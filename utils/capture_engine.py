@@ -0,0 +1,164 @@
+"""Always-on microphone capture into a preallocated ring buffer."""
+
+import logging
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from config import CONFIG
+from utils.audio_devices import CallbackInputDevice, InputDevice, SoundDeviceCallbackInput
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureEngine:
+    """Keeps one capture device open and records into a fixed-size ring buffer.
+
+    Samples are addressed by their absolute index since ``start`` (the
+    ``position`` grows forever, the buffer wraps), so a turn is just an index
+    range that can be sliced out later, including audio captured before the
+    turn began.
+    """
+
+    def __init__(self, source: CallbackInputDevice, buffer_seconds: Optional[float] = None):
+        self.source = source
+        self.sample_rate = source.sample_rate
+        seconds = buffer_seconds or CONFIG.capture_buffer_seconds
+        self.capacity = int(seconds * self.sample_rate)
+        self._buffer = np.zeros(self.capacity, dtype=np.int16)
+        self._written = 0
+        self._clock = (0, time.monotonic())  # (sample index, monotonic time) of the last block
+        self._cond = threading.Condition()
+        self.running = False
+
+    def start(self):
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+        self.source.start(self._on_block)
+        logger.info(f"Audio capture started at {self.sample_rate} Hz "
+                    f"({self.capacity / self.sample_rate:.0f}s ring buffer)")
+
+    def stop(self):
+        with self._cond:
+            if not self.running:
+                return
+            self.running = False
+            self._cond.notify_all()
+        self.source.stop()
+
+    def _on_block(self, block: np.ndarray):
+        """Device callback: copy the block into the ring, no allocation."""
+        count = block.shape[0]
+        if count > self.capacity:
+            block = block[-self.capacity:]
+            count = self.capacity
+        with self._cond:
+            offset = self._written % self.capacity
+            first = min(count, self.capacity - offset)
+            self._buffer[offset:offset + first] = block[:first]
+            if first < count:
+                self._buffer[:count - first] = block[first:]
+            self._written += count
+            self._clock = (self._written, time.monotonic())
+            self._cond.notify_all()
+
+    @property
+    def position(self) -> int:
+        """Absolute index of the next sample to be captured."""
+        with self._cond:
+            return self._written
+
+    @property
+    def oldest(self) -> int:
+        """Absolute index of the oldest sample still in the buffer."""
+        with self._cond:
+            return max(0, self._written - self.capacity)
+
+    def index_at(self, timestamp: float) -> int:
+        """Absolute sample index captured at a ``time.monotonic()`` timestamp."""
+        with self._cond:
+            index, anchor = self._clock
+            estimate = index + int(round((timestamp - anchor) * self.sample_rate))
+            return min(max(estimate, max(0, self._written - self.capacity)), self._written)
+
+    def wait_for(self, index: int, timeout: Optional[float] = None) -> bool:
+        """Block until sample ``index`` has been captured; False on timeout or stop."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._written >= index or not self.running, timeout) \
+                and self._written >= index
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """Copy samples ``[start, end)`` out of the ring.
+
+        Samples that were already overwritten are skipped, so a reader that
+        fell more than a buffer behind gets the newest audio rather than garbage.
+        """
+        with self._cond:
+            oldest = max(0, self._written - self.capacity)
+            end = min(end, self._written)
+            if start < oldest:
+                logger.warning(f"Capture reader fell behind; dropped {oldest - start} samples")
+                start = oldest
+            if end <= start:
+                return np.zeros(0, dtype=np.int16)
+
+            first, last = start % self.capacity, end % self.capacity
+            if first < last or last == 0:
+                return self._buffer[first:last or self.capacity].copy()
+            return np.concatenate([self._buffer[first:], self._buffer[:last]])
+
+    def slice_time(self, start_time: float, end_time: float) -> np.ndarray:
+        """Samples captured between two ``time.monotonic()`` timestamps."""
+        return self.read(self.index_at(start_time), self.index_at(end_time))
+
+    def reader(self, start: Optional[int] = None) -> "CaptureReader":
+        """Sequential reader starting at ``start`` (default: now)."""
+        self.start()
+        return CaptureReader(self, self.position if start is None else start)
+
+
+class CaptureReader(InputDevice):
+    """Blocking ``InputDevice`` view over a capture engine.
+
+    Closing the reader does not close the device, so consumers such as the
+    barge-in player no longer reopen the microphone on every reply.
+    """
+
+    def __init__(self, engine: CaptureEngine, start: int):
+        self.engine = engine
+        self.sample_rate = engine.sample_rate
+        self.cursor = max(start, engine.oldest)
+
+    def start(self):
+        """Skip to live audio, like opening a fresh input stream."""
+        self.engine.start()
+        self.cursor = self.engine.position
+
+    def read(self, frames: int) -> np.ndarray:
+        end = self.cursor + frames
+        if not self.engine.wait_for(end, timeout=CONFIG.capture_read_timeout):
+            raise RuntimeError("Audio capture stalled; no samples from the input device")
+        samples = self.engine.read(self.cursor, end)
+        self.cursor = end
+        return samples
+
+    def close(self):
+        pass
+
+
+_engine: Optional[CaptureEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_capture_engine() -> CaptureEngine:
+    """Process-wide engine on the default microphone, opened on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = CaptureEngine(SoundDeviceCallbackInput(CONFIG.sample_rate))
+        _engine.start()
+        return _engine
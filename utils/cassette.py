@@ -0,0 +1,385 @@
+"""Record provider calls per session and replay them offline.
+
+With ``CONFIG.cassette_mode = "record"`` the Whisper, GPT and Claude
+clients are wrapped so every request made during a turn is appended, with
+its response (or error) and observed latency, to the session's cassette:
+a gzipped JSON-lines file in ``CONFIG.cassette_dir``. Each turn also adds
+one "turn" entry holding the user's audio (at the STT rate) and the
+pipeline's result, so a cassette is enough to re-run the conversation.
+
+``CassettePlayer`` serves a cassette back through ``ReplayOpenAI`` and
+``ReplayAnthropic``, which have the call shapes of the real clients (see
+benchmarks/replay_cassette.py). Requests are matched exactly by a hash of
+their content, or in recorded order per endpoint when the pipeline under
+test builds different requests. Original latencies can be reproduced.
+"""
+
+import base64
+import contextvars
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from config import CONFIG
+from utils.audio_buffer import AudioBuffer
+from utils.rate_limiter import error_headers
+
+logger = logging.getLogger(__name__)
+
+CHAT = "openai.chat"
+TRANSCRIBE = "openai.transcribe"
+CLAUDE = "anthropic.messages"
+TURN = "turn"
+
+# Headers the rate limiters read; everything else is left out of the cassette
+_KEPT_HEADERS = ("retry-after", "x-ratelimit-", "anthropic-ratelimit-")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("cassette", default=None)
+
+
+def request_key(kind: str, request: Dict[str, Any]) -> str:
+    """Stable hash of a request's content, used for exact matching on replay."""
+    payload = json.dumps([kind, request], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _kept_headers(headers) -> Dict[str, str]:
+    return {name.lower(): value for name, value in dict(headers or {}).items()
+            if name.lower().startswith(_KEPT_HEADERS)}
+
+
+class Cassette:
+    """Interactions of one session, in the order they happened."""
+
+    def __init__(self, path: Optional[str] = None, interactions: Optional[List[dict]] = None):
+        self.path = path
+        self.interactions: List[dict] = interactions or []
+        self._pending: List[dict] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        interactions = []
+        with gzip.open(path, "rt", encoding="utf-8") as cassette_file:
+            for line in cassette_file:
+                if line.strip():
+                    interactions.append(json.loads(line))
+        return cls(path, interactions)
+
+    def add(self, entry: dict):
+        with self._lock:
+            self._pending.append(entry)
+
+    def add_turn(self, audio_bytes: bytes, result: Dict[str, Any]):
+        """Record a turn's input audio and outcome, so replays can re-run and compare it."""
+        audio = AudioBuffer.from_wav_bytes(audio_bytes).resample(CONFIG.stt_sample_rate)
+        self.add({
+            "kind": TURN,
+            "at": time.time(),
+            "audio": base64.b64encode(audio.to_wav_bytes()).decode("ascii"),
+            "transcription": result.get("transcription"),
+            "emotions": result.get("emotions"),
+            "response_text": result.get("response_text"),
+            "success": result.get("success"),
+            "error": result.get("error"),
+            "processing_time": round(result.get("processing_time") or 0.0, 3),
+        })
+
+    def flush(self):
+        """Append the entries recorded since the last flush (one gzip member per flush)."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending or not self.path:
+            self.interactions.extend(pending)
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with gzip.open(self.path, "at", encoding="utf-8") as cassette_file:
+            for entry in pending:
+                cassette_file.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        self.interactions.extend(pending)
+
+
+def session_cassette(session_id: str) -> Optional[Cassette]:
+    """A cassette appending to the session's file, or None when recording is off."""
+    if CONFIG.cassette_mode != "record" or not session_id:
+        return None
+    return Cassette(os.path.join(CONFIG.cassette_dir, f"{session_id}.jsonl.gz"))
+
+
+@contextmanager
+def use_cassette(cassette: Optional[Cassette]):
+    """Record the provider calls made in this context (and threads started with its copy)."""
+    token = _current.set(cassette)
+    try:
+        yield cassette
+    finally:
+        _current.reset(token)
+
+
+def _record(kind: str, request: dict, started: float, response: Any = None,
+            error: Optional[Exception] = None, key_request: Optional[dict] = None):
+    cassette = _current.get()
+    if cassette is None:
+        return
+    entry = {
+        "kind": kind,
+        "key": request_key(kind, key_request or request),
+        "at": time.time(),
+        "latency": round(time.perf_counter() - started, 4),
+        "request": request,
+    }
+    if error is not None:
+        entry["error"] = {
+            "type": type(error).__name__,
+            "message": str(error),
+            "http_status": getattr(error, "http_status", None) or getattr(error, "status_code", None),
+            "headers": _kept_headers(error_headers(error)),
+        }
+    else:
+        entry["response"] = response
+    cassette.add(entry)
+
+
+# --- Recording ---------------------------------------------------------------
+
+class RecordingOpenAI:
+    """Proxy for the ``openai`` module (0.28 API) that records chat and transcription calls.
+
+    Every other attribute, including settings such as ``api_key``, is
+    read from and written to the wrapped module.
+    """
+
+    def __init__(self, openai_module):
+        object.__setattr__(self, "_module", openai_module)
+        object.__setattr__(self, "ChatCompletion", SimpleNamespace(create=self._chat_completion))
+        object.__setattr__(self, "Audio", SimpleNamespace(transcribe=self._transcribe))
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._module, name, value)
+
+    def _chat_completion(self, **kwargs):
+        request = {name: kwargs.get(name) for name in ("model", "messages", "max_tokens", "temperature", "stream")}
+        started = time.perf_counter()
+        try:
+            response = self._module.ChatCompletion.create(**kwargs)
+        except Exception as e:
+            _record(CHAT, request, started, error=e)
+            raise
+        if kwargs.get("stream"):
+            return self._record_stream(response, request, started)
+        _record(CHAT, request, started, response=json.loads(json.dumps(response, default=str)))
+        return response
+
+    @staticmethod
+    def _record_stream(stream, request: dict, started: float):
+        chunks = []
+        complete = False
+        try:
+            for chunk in stream:
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    chunks.append([round(time.perf_counter() - started, 4), delta])
+                yield chunk
+            complete = True
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            # ``complete`` is False when the reader stopped early
+            _record(CHAT, request, started, response={"chunks": chunks, "complete": complete})
+
+    def _transcribe(self, model: str, file, language: Optional[str] = None, **kwargs):
+        audio = file.read()
+        file.seek(0)
+        # The audio itself is kept once per turn, in the turn entry
+        request = {"model": model, "language": language, "audio_sha1": hashlib.sha1(audio).hexdigest()}
+        started = time.perf_counter()
+        try:
+            response = self._module.Audio.transcribe(model=model, file=file, language=language, **kwargs)
+        except Exception as e:
+            _record(TRANSCRIBE, request, started, error=e)
+            raise
+        _record(TRANSCRIBE, request, started, response={"text": response.get("text", "")})
+        return response
+
+
+class RecordingAnthropic:
+    """Proxy for ``anthropic.Anthropic()`` that records ``messages.with_raw_response.create``."""
+
+    def __init__(self, client):
+        self._client = client
+        self.messages = SimpleNamespace(with_raw_response=SimpleNamespace(create=self._create))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _create(self, **kwargs):
+        request = {name: kwargs.get(name) for name in ("model", "max_tokens", "messages")}
+        started = time.perf_counter()
+        try:
+            raw = self._client.messages.with_raw_response.create(**kwargs)
+            response = raw.parse()
+        except Exception as e:
+            _record(CLAUDE, request, started, error=e)
+            raise
+        _record(CLAUDE, request, started, response={
+            "headers": _kept_headers(raw.headers),
+            "content": [block.text for block in response.content if hasattr(block, "text")],
+            "usage": {"input_tokens": response.usage.input_tokens,
+                      "output_tokens": response.usage.output_tokens},
+        })
+        return SimpleNamespace(headers=raw.headers, parse=lambda: response)
+
+
+def recording_openai(openai_module):
+    """Wrap the openai module for recording when ``CONFIG.cassette_mode`` is "record"."""
+    return RecordingOpenAI(openai_module) if CONFIG.cassette_mode == "record" else openai_module
+
+
+def recording_anthropic(client):
+    """Wrap an Anthropic client for recording when ``CONFIG.cassette_mode`` is "record"."""
+    return RecordingAnthropic(client) if CONFIG.cassette_mode == "record" else client
+
+
+# --- Replay ------------------------------------------------------------------
+
+class CassetteMiss(Exception):
+    """No recorded interaction answers the request."""
+
+
+class ReplayedAPIError(Exception):
+    """A provider error played back from a cassette."""
+
+    def __init__(self, message: str, http_status: Optional[int] = None,
+                 headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.http_status = http_status
+        self.headers = headers or {}
+
+
+class _AttrDict(dict):
+    """Dict with attribute access, like the objects openai 0.28 returns."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def _attr(value):
+    if isinstance(value, dict):
+        return _AttrDict({key: _attr(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_attr(item) for item in value]
+    return value
+
+
+class CassettePlayer:
+    """Hands out a cassette's recorded interactions to the replay clients.
+
+    ``match="exact"`` answers a request only with an interaction recorded
+    for identical content (a miss raises ``CassetteMiss``).
+    ``match="order"`` answers with the next unused interaction of the same
+    endpoint and counts requests that differ from the recorded one in
+    ``mismatched``. With ``timing`` each reply takes as long as it did when
+    it was recorded.
+    """
+
+    def __init__(self, cassette: Cassette, match: str = "exact", timing: bool = False):
+        self.match = match
+        self.timing = timing
+        self._queues: Dict[str, deque] = {}
+        for entry in cassette.interactions:
+            if entry["kind"] == TURN:
+                continue
+            queue_name = entry["key"] if match == "exact" else entry["kind"]
+            self._queues.setdefault(queue_name, deque()).append(entry)
+        self._lock = threading.Lock()
+        self.served = 0
+        self.mismatched = 0
+
+    @property
+    def remaining(self) -> int:
+        """Recorded interactions not requested (yet)."""
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def next(self, kind: str, request: dict) -> dict:
+        key = request_key(kind, request)
+        with self._lock:
+            queue = self._queues.get(key if self.match == "exact" else kind)
+            if not queue:
+                raise CassetteMiss(f"no recorded {kind} interaction for request {key}")
+            entry = queue.popleft()
+            self.served += 1
+            if entry["key"] != key:
+                self.mismatched += 1
+        return entry
+
+    def play(self, entry: dict) -> Any:
+        """Wait out the recorded latency if asked, then return the response or raise the error."""
+        if self.timing and "chunks" not in (entry.get("response") or {}):
+            time.sleep(entry["latency"])
+        error = entry.get("error")
+        if error:
+            raise ReplayedAPIError(error["message"], error.get("http_status"), error.get("headers"))
+        return entry["response"]
+
+    def stream(self, chunks: List[list]):
+        started = time.perf_counter()
+        for offset, delta in chunks:
+            if self.timing:
+                time.sleep(max(0.0, offset - (time.perf_counter() - started)))
+            yield _AttrDict(choices=[_AttrDict(delta=_AttrDict(content=delta))])
+
+
+class ReplayOpenAI:
+    """Stands in for the ``openai`` module, answering from a ``CassettePlayer``."""
+
+    def __init__(self, player: CassettePlayer):
+        self.player = player
+        self.api_key = None
+        self.api_base = ""
+        self.ChatCompletion = SimpleNamespace(create=self._chat_completion)
+        self.Audio = SimpleNamespace(transcribe=self._transcribe)
+
+    def _chat_completion(self, **kwargs):
+        request = {name: kwargs.get(name) for name in ("model", "messages", "max_tokens", "temperature", "stream")}
+        response = self.player.play(self.player.next(CHAT, request))
+        if "chunks" in response:
+            return self.player.stream(response["chunks"])
+        return _attr(response)
+
+    def _transcribe(self, model: str, file, language: Optional[str] = None, **kwargs):
+        request = {"model": model, "language": language, "audio_sha1": hashlib.sha1(file.read()).hexdigest()}
+        return _AttrDict(self.player.play(self.player.next(TRANSCRIBE, request)))
+
+
+class ReplayAnthropic:
+    """Stands in for ``anthropic.Anthropic()``, answering from a ``CassettePlayer``."""
+
+    def __init__(self, player: CassettePlayer):
+        self.player = player
+        self.messages = SimpleNamespace(with_raw_response=SimpleNamespace(create=self._create))
+        self.models = SimpleNamespace(list=lambda **kwargs: [])
+
+    def _create(self, **kwargs):
+        request = {name: kwargs.get(name) for name in ("model", "max_tokens", "messages")}
+        response = self.player.play(self.player.next(CLAUDE, request))
+        parsed = SimpleNamespace(
+            content=[SimpleNamespace(text=text) for text in response["content"]],
+            usage=SimpleNamespace(**response["usage"]),
+        )
+        return SimpleNamespace(headers=response["headers"], parse=lambda: parsed)
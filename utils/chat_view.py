@@ -0,0 +1,153 @@
+"""Chat view helpers for the Streamlit frontend.
+
+Everything here is plain Python so the rendering cost can be measured
+without a running Streamlit server.
+"""
+
+import html
+import json
+import re
+from functools import lru_cache
+from typing import Iterable, Optional, Tuple
+
+from services.turn_record import Turn
+
+
+def minify_css(css: str) -> str:
+    """Strip comments and whitespace from a stylesheet."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{}:;,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+# Minified once at import and copied into the page once (see css_injector_html)
+APP_CSS = minify_css("""
+.main-header {
+    text-align: center;
+    color: #2E8B57;
+    font-size: 2.5em;
+    margin-bottom: 30px;
+    font-weight: bold;
+}
+
+.status-box {
+    color: #031a2e;
+    padding: 20px;
+    border-radius: 10px;
+    margin: 20px 0;
+    text-align: center;
+}
+
+.status-listening {
+    border: 2px solid #4CAF50;
+}
+
+.status-processing {
+    border: 2px solid #FF9800;
+}
+
+.status-ready {
+    border: 2px solid #2196F3;
+}
+
+.response-box {
+    background-color: #F5F5F5;
+    padding: 20px;
+    border-radius: 10px;
+    margin: 20px 0;
+    border-left: 5px solid #2E8B57;
+}
+
+.emotion-indicator {
+    display: inline-block;
+    padding: 5px 15px;
+    border-radius: 20px;
+    margin: 5px;
+    font-weight: bold;
+}
+
+.emotion-positive {
+    background-color: #4CAF50;
+    color: white;
+}
+
+.emotion-negative {
+    background-color: #F44336;
+    color: white;
+}
+
+.emotion-neutral {
+    background-color: #9E9E9E;
+    color: white;
+}
+
+.sidebar-info {
+    background-color: #031a2e;
+    padding: 15px;
+    border-radius: 10px;
+    margin: 10px 0;
+}
+
+.chat-bubble {
+    padding: 10px 15px;
+    border-radius: 10px;
+    margin: 8px 0;
+}
+
+.chat-user {
+    background-color: rgba(33, 150, 243, 0.12);
+}
+
+.chat-therapist {
+    background-color: rgba(46, 139, 87, 0.12);
+    border-right: 4px solid #2E8B57;
+}
+
+.arabic-text {
+    font-family: 'Tahoma', 'Arial Unicode MS', sans-serif;
+    font-size: 1.2em;
+    line-height: 1.6;
+    direction: rtl;
+}
+""")
+
+
+@lru_cache(maxsize=4096)
+def message_html(text: str) -> str:
+    """HTML for one chat bubble; each message is escaped and formatted once."""
+    return f'<p class="arabic-text">{html.escape(text)}</p>'
+
+
+def turn_html(turn: Turn) -> Tuple[str, str]:
+    return message_html(turn.user), message_html(turn.therapist)
+
+
+def turn_block_html(turn: Turn) -> str:
+    """HTML for one turn of the history: the user's bubble, then the therapist's."""
+    user_html, therapist_html = turn_html(turn)
+    return (f'<div class="chat-bubble chat-user">{user_html}</div>'
+            f'<div class="chat-bubble chat-therapist">{therapist_html}</div>')
+
+
+def history_html(turns: Iterable[Turn]) -> str:
+    """One HTML block for a run of turns, rendered as a single element."""
+    return "".join(turn_block_html(turn) for turn in turns)
+
+
+def css_injector_html(css: str, element_id: str = "omani-therapist-css") -> str:
+    """A zero-height component page that copies ``css`` into the app page's <head>.
+
+    The style element outlives the component, so later reruns need not
+    send the stylesheet again.
+    """
+    css_literal = json.dumps(css).replace("</", "<\\/")
+    return ("<script>(function(){var d=window.parent.document;"
+            f"var s=d.getElementById({json.dumps(element_id)});"
+            f"if(!s){{s=d.createElement('style');s.id={json.dumps(element_id)};d.head.appendChild(s);}}"
+            f"s.textContent={css_literal};}})();</script>")
+
+
+def history_size(turns: list, cursor: Optional[int]) -> int:
+    """Total turns in the session given a window and its ``recent_turns`` cursor."""
+    return len(turns) + (cursor - 1 if cursor else 0)
@@ -0,0 +1,193 @@
+"""Circuit breakers for the external provider endpoints.
+
+A breaker watches the outcome and duration of the recent calls to one
+endpoint ("openai.chat", "openai.transcribe", "anthropic.messages"):
+
+- closed: calls go through. Once at least ``min_calls`` calls within the
+  last ``window_s`` include ``failure_rate`` failures, or ``slow_rate``
+  calls slower than ``slow_call_s``, the breaker opens.
+- open: calls fail at once with ``CircuitOpen``, so callers take their
+  alternative path (Claude instead of GPT, no validation, the local
+  Whisper, a canned reply) instead of waiting for a struggling provider
+  to time out. After ``open_s`` the breaker turns half-open.
+- half-open: ``half_open_calls`` probe calls go through. If they all
+  succeed the breaker closes; a failed or slow probe opens it again.
+
+Calls are made through ``ProviderRateLimiter.call(..., breaker=...)``,
+which checks the breaker before queueing for a rate limit slot. Settings
+per endpoint are in ``CONFIG.circuit_breakers``. Every state
+change is logged and passed to the listeners added with
+``add_breaker_listener``.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an endpoint whose breaker is open."""
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker driven by the error rate and latency of recent calls."""
+
+    def __init__(self, name: str, failure_rate: float = 0.5, slow_call_s: float = 10.0,
+                 slow_rate: float = 0.8, window_s: float = 60.0, min_calls: int = 4,
+                 open_s: float = 30.0, half_open_calls: int = 1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_s = slow_call_s
+        self.slow_rate = slow_rate
+        self.window_s = window_s
+        self.min_calls = min_calls
+        self.open_s = open_s
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0  # probe calls let through while half-open
+        self._probe_successes = 0
+        self._calls = deque()  # (finished at, failed, slow)
+        self._lock = threading.Lock()
+
+        self.rejected = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.transitions: deque = deque(maxlen=20)
+
+    def _transition(self, state: str, reason: str) -> Dict[str, Any]:
+        event = {"breaker": self.name, "from": self.state, "to": state, "reason": reason, "at": time.time()}
+        self.state = state
+        self.transitions.append(event)
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state != CLOSED:
+            self._probes = self._probe_successes = 0
+        else:
+            self._calls.clear()
+        return event
+
+    def before_call(self):
+        """Let a call through, or raise ``CircuitOpen``."""
+        event = None
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_s:
+                event = self._transition(HALF_OPEN, f"{self.open_s:.0f}s since opening")
+            if self.state == OPEN or (self.state == HALF_OPEN and self._probes >= self.half_open_calls):
+                self.rejected += 1
+                rejected = True
+            else:
+                rejected = False
+                if self.state == HALF_OPEN:
+                    self._probes += 1
+        if event:
+            _notify(event)
+        if rejected:
+            raise CircuitOpen(f"{self.name}: circuit open")
+
+    def record(self, seconds: float, failed: bool):
+        """Count the outcome of a call let through by ``before_call``."""
+        slow = seconds >= self.slow_call_s
+        event = None
+        with self._lock:
+            self.failures += int(failed)
+            self.slow_calls += int(slow)
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    event = self._transition(OPEN, f"probe {'failed' if failed else f'took {seconds:.1f}s'}")
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        event = self._transition(CLOSED, "probes succeeded")
+            elif self.state == CLOSED:
+                now = time.monotonic()
+                self._calls.append((now, failed, slow))
+                while self._calls and self._calls[0][0] < now - self.window_s:
+                    self._calls.popleft()
+                calls = len(self._calls)
+                if calls >= self.min_calls:
+                    failure_share = sum(1 for _, call_failed, _ in self._calls if call_failed) / calls
+                    slow_share = sum(1 for _, _, call_slow in self._calls if call_slow) / calls
+                    if failure_share >= self.failure_rate:
+                        event = self._transition(OPEN, f"{failure_share:.0%} of {calls} calls failed")
+                    elif slow_share >= self.slow_rate:
+                        event = self._transition(
+                            OPEN, f"{slow_share:.0%} of {calls} calls took over {self.slow_call_s:.0f}s")
+        if event:
+            _notify(event)
+
+    def release(self):
+        """Give back a half-open probe slot of a call that ended without an outcome (cancelled, throttled)."""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_calls": len(self._calls),
+                "failures": self.failures,
+                "slow_calls": self.slow_calls,
+                "rejected": self.rejected,
+                "transitions": list(self.transitions)[-5:],
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+
+def _notify(event: Dict[str, Any]):
+    log = logger.warning if event["to"] == OPEN else logger.info
+    log(f"Circuit {event['breaker']}: {event['from']} -> {event['to']} ({event['reason']})")
+    for listener in list(_listeners):
+        try:
+            listener(event)
+        except Exception as e:
+            logger.error(f"Error in circuit breaker listener: {str(e)}")
+
+
+def add_breaker_listener(listener: Callable[[Dict[str, Any]], None]) -> Callable[[], None]:
+    """Call ``listener(event)`` on every state change; returns a function that removes it.
+
+    Events are dicts with ``breaker``, ``from``, ``to``, ``reason`` and ``at`` (epoch seconds).
+    """
+    _listeners.append(listener)
+    return lambda: _listeners.remove(listener) if listener in _listeners else None
+
+
+def get_circuit_breaker(endpoint: str) -> Optional[CircuitBreaker]:
+    """The process-wide breaker of an endpoint, or None when breakers are off."""
+    if not CONFIG.circuit_breaker_enabled:
+        return None
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            settings = {**CONFIG.circuit_breakers.get("default", {}), **CONFIG.circuit_breakers.get(endpoint, {})}
+            _breakers[endpoint] = CircuitBreaker(endpoint, **settings)
+        return _breakers[endpoint]
+
+
+def reset_circuit_breakers():
+    """Forget all breakers; services keep the ones they were created with, so recreate them afterwards."""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def circuit_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    """State, outcomes and recent transitions of every breaker created so far."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
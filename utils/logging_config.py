@@ -1,23 +1,207 @@
-"""Logging configuration for the application."""
+"""Logging configuration for the application.
 
+Records are put on a queue by the thread that logs them and written to
+disk by a single listener thread, so a slow disk never stalls a turn.
+The log file rotates by size or daily (``CONFIG.log_rotation``), and
+verbose INFO/DEBUG logs of selected loggers can be sampled down with
+``CONFIG.log_sampling``. Warnings and errors are never sampled.
+"""
+import atexit
 import logging
+import logging.handlers
 import os
-from datetime import datetime
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from config import CONFIG
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["NonBlockingQueueHandler"] = None
+_setup_lock = threading.Lock()
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of the INFO-and-below records of each configured logger.
+
+    Sampling is by count rather than random (a rate of 0.25 keeps every
+    fourth record), so the kept logs stay evenly spread over time. A rate
+    applies to the named logger and its children.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = dict(rates)
+        self._resolved: Dict[str, float] = {}
+        self._credit: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.sampled_out = 0
+
+    def _rate(self, name: str) -> float:
+        # Unlocked: resolving is idempotent, so a race only repeats the lookup
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            logger_name = name
+            while logger_name:
+                if logger_name in self.rates:
+                    rate = self.rates[logger_name]
+                    break
+                logger_name = logger_name.rpartition(".")[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0:
+            return True
+        with self._lock:
+            credit = self._credit.get(record.name, 1.0) + rate
+            keep = credit >= 1.0
+            self._credit[record.name] = credit - 1.0 if keep else credit
+            if not keep:
+                self.sampled_out += 1
+        return keep
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that never waits and measures its own cost.
+
+    Only the message arguments are merged here; formatting happens on the
+    listener thread. When the queue is full the record is dropped and
+    counted instead of blocking the caller. Time spent in ``handle`` is
+    accumulated for the calling thread, see ``measure_logging``.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.handled = 0
+        self.seconds = 0.0
+        self._local = threading.local()
+        # Records are handled on every thread that logs; guards the counters above
+        self._counters_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Arguments may be mutated after the call returns, so merge them now
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._counters_lock:
+                self.dropped += 1
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        started = time.perf_counter()
+        try:
+            return super().handle(record)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._counters_lock:
+                self.handled += 1
+                self.seconds += elapsed
+            turn = getattr(self._local, "turn", None)
+            if turn is not None:
+                turn["records"] += 1
+                turn["seconds"] += elapsed
+
+
+def _file_handler() -> logging.Handler:
+    os.makedirs(CONFIG.log_dir, exist_ok=True)
+    path = os.path.join(CONFIG.log_dir, CONFIG.log_file)
+    if CONFIG.log_rotation == "time":
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when=CONFIG.log_rotate_when, backupCount=CONFIG.log_backup_count, encoding="utf-8")
+    return logging.handlers.RotatingFileHandler(
+        path, maxBytes=CONFIG.log_max_bytes, backupCount=CONFIG.log_backup_count, encoding="utf-8")
+
 
 def setup_logging():
-    """Setup logging configuration."""
-    log_dir = "logs"
-    os.makedirs(log_dir, exist_ok=True)
-    
-    log_filename = f"{log_dir}/therapist_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_filename),
-            logging.StreamHandler()
-        ]
-    )
-    
-    return logging.getLogger(__name__)
\ No newline at end of file
+    """Setup logging configuration.
+
+    Safe to call more than once (Streamlit re-runs the app script); only
+    the first call installs the handlers and starts the listener thread.
+    """
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is None:
+            formatter = logging.Formatter(LOG_FORMAT)
+            handlers = [_file_handler(), logging.StreamHandler()]
+            for handler in handlers:
+                handler.setFormatter(formatter)
+
+            log_queue = queue.Queue(maxsize=CONFIG.log_queue_size)
+            _queue_handler = NonBlockingQueueHandler(log_queue)
+            _queue_handler.addFilter(SamplingFilter(CONFIG.log_sampling))
+            _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+            _listener.start()
+            atexit.register(shutdown_logging)
+
+            root = logging.getLogger()
+            root.setLevel(logging.INFO)
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            root.addHandler(_queue_handler)
+    return logging.getLogger(__name__)
+
+
+def shutdown_logging():
+    """Write out whatever is still queued and stop the listener thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            logging.getLogger().removeHandler(_queue_handler)
+
+
+@contextmanager
+def measure_logging():
+    """Count the records logged by this thread inside the block and the time spent on them.
+
+    Yields a dict that is filled in on exit with ``records`` and
+    ``overhead_ms``. Time spent building log messages before they reach the
+    handler (f-strings, record creation) is not included.
+    """
+    stats = {"records": 0, "seconds": 0.0}
+    handler = _queue_handler
+    if handler is not None:
+        handler._local.turn = stats
+    report = {"records": 0, "overhead_ms": 0.0}
+    try:
+        yield report
+    finally:
+        if handler is not None:
+            handler._local.turn = None
+        report["records"] = stats["records"]
+        report["overhead_ms"] = round(stats["seconds"] * 1000, 3)
+
+
+def logging_stats() -> Dict[str, float]:
+    """Totals since startup, for the health endpoint and the debug view."""
+    handler = _queue_handler
+    if handler is None:
+        return {}
+    sampled_out = sum(getattr(f, "sampled_out", 0) for f in handler.filters)
+    with handler._counters_lock:
+        handled, seconds, dropped = handler.handled, handler.seconds, handler.dropped
+    return {
+        "records": handled,
+        "avg_overhead_us": round(seconds / handled * 1e6, 1) if handled else 0.0,
+        "queued": handler.queue.qsize(),
+        "dropped": dropped,
+        "sampled_out": sampled_out,
+    }
@@ -0,0 +1,197 @@
+"""WebSocket client for the headless pipeline server (server.py)."""
+
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+from websockets.sync.client import connect
+
+from config import CONFIG
+from utils.audio_buffer import AudioBuffer
+from utils.cancellation import CancellationToken
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteSessionManager:
+    """Drop-in replacement for SessionManager that talks to server.py.
+
+    ``on_event`` gets the same events and payloads as from SessionManager:
+    "transcript" (str), "emotion" (scores), "response_partial" (the reply
+    so far) and "response" (str), "audio_segment" (AudioBuffer per received
+    chunk) and, at the end, "audio" (the whole reply).
+    """
+
+    def __init__(self, url: Optional[str] = None, frame_bytes: int = 4096):
+        self.url = url or CONFIG.backend_url
+        self.frame_bytes = frame_bytes
+        self.connection = None
+        self.session_id = None
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = connect(self.url, max_size=None)
+            greeting = json.loads(self.connection.recv())
+            self.session_id = greeting.get("session_id")
+            logger.info(f"Connected to pipeline server, session {self.session_id}")
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def prepare_turn(self, session_history: Optional[list] = None):
+        """End-of-speech hook: make sure the WebSocket is open before the audio is sent.
+
+        The server starts its own prewarm when the turn ends.
+        """
+        try:
+            self._connect()
+        except Exception as e:
+            logger.warning(f"Could not pre-connect to the pipeline server: {str(e)}")
+        return None
+
+    def process_voice_input(self,
+                            audio_bytes: bytes,
+                            session_history: Optional[list] = None,
+                            on_event: Optional[Callable[[str, Any], None]] = None,
+                            cancel_token: Optional[CancellationToken] = None,
+                            prewarm=None,
+                            cassette=None,
+                            session_id: Optional[str] = None,
+                            turn_id: Optional[str] = None) -> Dict[str, Any]:
+        """Send one recorded WAV turn and collect the streamed events into a result.
+
+        ``cassette``, ``session_id`` and ``turn_id`` are accepted for
+        interface parity and ignored: the server records, logs and
+        checkpoints the turns it runs.
+        """
+
+        def send_turn(connection):
+            # The server only needs what Whisper uses, so send 16 kHz audio
+            recording = AudioBuffer.from_wav_bytes(audio_bytes)
+            if recording.sample_rate > CONFIG.stt_sample_rate:
+                recording = recording.resample(CONFIG.stt_sample_rate)
+            sample_rate = recording.sample_rate
+            pcm = recording.to_pcm16().tobytes()
+
+            start = {"type": "start_turn", "sample_rate": sample_rate}
+            if session_history is not None:
+                start["history"] = [turn.to_dict() for turn in session_history]
+            connection.send(json.dumps(start, ensure_ascii=False))
+            for offset in range(0, len(pcm), self.frame_bytes):
+                connection.send(pcm[offset:offset + self.frame_bytes])
+            connection.send(json.dumps({"type": "end_turn"}))
+
+        return self._run_turn(send_turn, on_event, cancel_token)
+
+    def retry_turn(self,
+                   turn_id: str,
+                   session_history: Optional[list] = None,
+                   on_event: Optional[Callable[[str, Any], None]] = None,
+                   cancel_token: Optional[CancellationToken] = None,
+                   cassette=None,
+                   session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Ask the server to resume a failed turn from its checkpoint."""
+
+        def send_turn(connection):
+            retry = {"type": "retry_turn", "turn_id": turn_id}
+            if session_history is not None:
+                retry["history"] = [turn.to_dict() for turn in session_history]
+            connection.send(json.dumps(retry, ensure_ascii=False))
+
+        return self._run_turn(send_turn, on_event, cancel_token)
+
+    def _run_turn(self, send_turn: Callable[[Any], None],
+                  on_event: Optional[Callable[[str, Any], None]],
+                  cancel_token: Optional[CancellationToken]) -> Dict[str, Any]:
+        """Send a turn with ``send_turn(connection)`` and collect the streamed events into a result."""
+        start_time = time.time()
+        result = {
+            "success": False,
+            "transcription": None,
+            "emotions": None,
+            "response_text": None,
+            "audio_file": None,
+            "processing_time": 0,
+            "error": None,
+            "cancelled": False,
+            "audio_failed": False,
+            "turn_id": None,
+            "resumed": {"stages": [], "saved_s": 0.0, "deduplicated": False, "revoiced": False, "attempt": 1}
+        }
+        unregister = None
+
+        try:
+            connection = self._connect()
+            send_turn(connection)
+            if cancel_token is not None:
+                unregister = cancel_token.on_cancel(
+                    lambda: connection.send(json.dumps({"type": "cancel"})))
+
+            def emit(event: str, payload: Any):
+                if on_event:
+                    on_event(event, payload)
+
+            deltas = []
+            response_sent = False
+            audio_chunks = []
+            audio_rate = None
+            while True:
+                message = connection.recv()
+                if isinstance(message, bytes):
+                    audio_chunks.append(message)
+                    if audio_rate:
+                        emit("audio_segment", AudioBuffer.from_pcm16(message, audio_rate))
+                    continue
+
+                event = json.loads(message)
+                kind = event["type"]
+                if kind in ("audio_start", "turn_complete") and deltas and not response_sent:
+                    # The reply is final once its audio starts, or the turn ends without audio
+                    response_sent = True
+                    emit("response", " ".join(deltas))
+                if kind == "transcript":
+                    result["transcription"] = event["text"]
+                    emit("transcript", event["text"])
+                elif kind == "emotion":
+                    result["emotions"] = event["scores"]
+                    emit("emotion", event["scores"])
+                elif kind == "text_delta":
+                    deltas.append(event["text"])
+                    emit("response_partial", " ".join(deltas))
+                elif kind == "text_reset":
+                    deltas.clear()
+                elif kind == "audio_start":
+                    audio_rate = event["sample_rate"]
+                elif kind == "turn_complete":
+                    result["success"] = event["success"]
+                    result["error"] = event["error"]
+                    result["cancelled"] = event.get("cancelled", False)
+                    result["audio_failed"] = event.get("audio_failed", False)
+                    result["degradation"] = event.get("degradation")
+                    result["turn_id"] = event.get("turn_id")
+                    result["resumed"] = event.get("resumed") or result["resumed"]
+                    break
+                elif kind == "error":
+                    result["error"] = event["error"]
+                    break
+
+            if deltas:
+                result["response_text"] = " ".join(deltas)
+            if audio_chunks and audio_rate:
+                result["audio_file"] = AudioBuffer.from_pcm16(b"".join(audio_chunks), audio_rate)
+                emit("audio", result["audio_file"])
+
+        except Exception as e:
+            logger.error(f"Error talking to pipeline server: {str(e)}")
+            self.close()
+            result["error"] = str(e)
+        finally:
+            if unregister:
+                unregister()
+
+        result["processing_time"] = time.time() - start_time
+        return result
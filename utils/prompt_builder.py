@@ -0,0 +1,66 @@
+"""Turns the indented prompt templates in the services into compact prompt text.
+
+Templates are written as indented triple-quoted strings so they read well
+in the source. Sent as-is, the indentation, blank lines and repeated
+sections are all paid for as input tokens on every request.
+"""
+
+import re
+import textwrap
+from functools import lru_cache
+from typing import Iterable, List
+
+_INNER_SPACES = re.compile(r"(?<=\S)[ \t]{2,}")
+_HEADING = re.compile(r"^\*\*[^*]+\*\*$")  # a line that is only bold text
+
+
+@lru_cache(maxsize=256)
+def minify_prompt(text: str) -> str:
+    """Dedent, strip trailing space, collapse blank lines and inner runs of spaces.
+
+    Leading indentation that remains after dedenting is kept, since it
+    nests Markdown lists. Cached, because most sections are constants.
+    """
+    lines = []
+    for line in textwrap.dedent(text.expandtabs(4)).splitlines():
+        line = _INNER_SPACES.sub(" ", line.rstrip())
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return "\n".join(lines).strip("\n")
+
+
+def build_prompt(sections: Iterable[str]) -> str:
+    """Join minified sections, dropping repeated paragraphs and headings.
+
+    A paragraph, or a heading line, that already appeared earlier in the
+    prompt is left out the second time.
+    """
+    seen = set()
+    paragraphs: List[str] = []
+    for section in sections:
+        for paragraph in minify_prompt(section).split("\n\n"):
+            key = paragraph.strip()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            lines = []
+            for line in paragraph.split("\n"):
+                heading = line.strip()
+                if _HEADING.match(heading):
+                    if heading in seen:
+                        continue
+                    seen.add(heading)
+                lines.append(line)
+            if lines:
+                paragraphs.append("\n".join(lines))
+    return "\n\n".join(paragraphs)
+
+
+def render_prompt(template: str, **values) -> str:
+    """Minify a ``str.format`` template, then fill in the values.
+
+    Filling in afterwards keeps multi-line values (user text, a model
+    reply) from defeating the dedent, and leaves them untouched.
+    """
+    text = minify_prompt(template).format(**values)
+    return re.sub(r"\n{3,}", "\n\n", text)
@@ -0,0 +1,158 @@
+"""Prosodic emotion cues from the recorded audio, independent of the transcript.
+
+``extract_prosody`` frames the whole utterance at once (40 ms frames,
+10 ms hop) and measures loudness, pitch, speaking rate and pauses with
+array operations only, so it costs a few milliseconds per second of audio
+and runs alongside transcription. ``prosody_emotions`` turns the features
+into a distribution over the text model's labels, which ``fuse_emotions``
+mixes into the text-based one.
+
+The voice mostly tells how aroused the speaker is, not whether they feel
+good or bad: flat, quiet, slow, hesitant speech leans negative (low mood),
+energetic speech is split between negative (agitation) and positive.
+"""
+
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from config import CONFIG
+from utils.audio_buffer import AudioBuffer
+
+FRAME_MS = 40  # three periods of the lowest pitch searched
+HOP_MS = 10
+MIN_PITCH_HZ = 70
+MAX_PITCH_HZ = 400
+VOICING_THRESHOLD = 0.45  # normalized autocorrelation peak of a voiced frame
+OCTAVE_TOLERANCE = 0.9  # a divisor of the best lag scoring this share of its peak wins
+SILENCE_FLOOR_DB = -50.0  # frames quieter than this are never speech
+SPEECH_RANGE_DB = 30.0  # frames this far below the loud frames count as pauses
+NUCLEUS_SPACING_MS = 120  # minimum distance between syllable nuclei
+MIN_SPEECH_S = 0.5  # shorter utterances give no prosodic estimate
+
+# Typical conversational values and spreads used to normalize the features
+_REFERENCE = {
+    "energy_db": (-26.0, 6.0),
+    "pitch_range_st": (3.0, 1.5),
+    "speaking_rate": (4.0, 1.2),
+    "pause_ratio": (0.25, 0.15),
+}
+
+
+class ProsodyFeatures(NamedTuple):
+    speech_s: float  # from the first to the last speech frame
+    energy_db: float  # median loudness of speech frames, dBFS
+    pitch_hz: float  # median F0 of voiced frames (0 if none)
+    pitch_range_st: float  # F0 standard deviation in semitones
+    speaking_rate: float  # syllable nuclei per second of speech without pauses
+    pause_ratio: float  # share of the speech span spent in pauses
+
+
+@lru_cache(maxsize=8)
+def _analysis_setup(sample_rate: int):
+    """Frame sizes, window, FFT size and the window's own normalized autocorrelation."""
+    frame = int(sample_rate * FRAME_MS / 1000)
+    hop = int(sample_rate * HOP_MS / 1000)
+    window = np.hanning(frame).astype(np.float32)
+    nfft = 1 << (2 * frame - 1).bit_length()
+    window_ac = np.fft.irfft(np.abs(np.fft.rfft(window, nfft)) ** 2, nfft)[:frame]
+    return frame, hop, window, nfft, window_ac / window_ac[0]
+
+
+def extract_prosody(audio: AudioBuffer) -> Optional[ProsodyFeatures]:
+    """Prosodic features of one utterance, or None if it holds too little speech."""
+    sample_rate = audio.sample_rate
+    frame, hop, window, nfft, window_ac = _analysis_setup(sample_rate)
+    if audio.samples.shape[0] < frame:
+        return None
+    frames = sliding_window_view(audio.samples, frame)[::hop]
+
+    # Loudness per frame, and which frames are speech rather than pauses
+    power = np.einsum("ij,ij->i", frames, frames) / frame
+    energy_db = 10 * np.log10(power + 1e-10)
+    threshold = max(SILENCE_FLOOR_DB, float(np.percentile(energy_db, 95)) - SPEECH_RANGE_DB)
+    speech = energy_db > threshold
+    active = np.flatnonzero(speech)
+    if active.size == 0:
+        return None
+    span = slice(active[0], active[-1] + 1)
+    speech_s = (active[-1] - active[0] + 1) * hop / sample_rate
+    if speech_s < MIN_SPEECH_S:
+        return None
+    pause_ratio = 1.0 - float(np.mean(speech[span]))
+
+    # Pitch: autocorrelation of every speech frame at once, via the power spectrum
+    spectrum = np.fft.rfft(frames[speech] * window, nfft)
+    autocorr = np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, nfft)[:, :frame]
+    min_lag = int(sample_rate / MAX_PITCH_HZ)
+    max_lag = min(int(sample_rate / MIN_PITCH_HZ), frame - 1)
+    normalized = autocorr[:, min_lag:max_lag] / (autocorr[:, :1] + 1e-10) / window_ac[min_lag:max_lag]
+    peak_lag = np.argmax(normalized, axis=1)
+    peak = normalized[np.arange(peak_lag.shape[0]), peak_lag]
+    voiced = peak > VOICING_THRESHOLD
+    # A multiple of the period can score as high as the period itself (and
+    # halve the pitch), so prefer a divisor of the peak lag that scores nearly as well
+    rows = np.arange(peak_lag.shape[0])[:, None]
+    best = peak_lag
+    for divisor in (2, 3):
+        around = np.rint((peak_lag + min_lag) / divisor).astype(int)[:, None] - min_lag + np.arange(-1, 2)
+        valid = (around >= 0).all(axis=1)
+        around = np.clip(around, 0, normalized.shape[1] - 1)
+        scores = normalized[rows, around]
+        candidate = around[rows[:, 0], np.argmax(scores, axis=1)]
+        best = np.where(valid & (scores.max(axis=1) >= OCTAVE_TOLERANCE * peak), candidate, best)
+    f0 = sample_rate / (best[voiced] + min_lag)
+    pitch_hz = float(np.median(f0)) if f0.size else 0.0
+    pitch_range_st = float(np.std(12 * np.log2(f0))) if f0.size > 1 else 0.0
+
+    # Speaking rate: peaks of the smoothed loudness envelope inside speech
+    envelope = np.convolve(np.sqrt(power), np.ones(5) / 5, mode="same")
+    reach = max(1, int(NUCLEUS_SPACING_MS / HOP_MS) // 2)
+    padded = np.pad(envelope, reach, mode="edge")
+    local_max = sliding_window_view(padded, 2 * reach + 1).max(axis=1)
+    nuclei = np.count_nonzero((envelope >= local_max) & speech & (envelope > 0))
+    speaking_s = max(np.count_nonzero(speech) * hop / sample_rate, 1e-3)
+
+    return ProsodyFeatures(
+        speech_s=round(float(speech_s), 3),
+        energy_db=round(float(np.median(energy_db[speech])), 2),
+        pitch_hz=round(pitch_hz, 1),
+        pitch_range_st=round(pitch_range_st, 2),
+        speaking_rate=round(float(nuclei / speaking_s), 2),
+        pause_ratio=round(pause_ratio, 3),
+    )
+
+
+def prosody_emotions(features: Optional[ProsodyFeatures]) -> Optional[Dict[str, float]]:
+    """Distribution over negative/neutral/positive implied by the speaker's arousal."""
+    if features is None:
+        return None
+
+    def z(name: str) -> float:
+        mean, spread = _REFERENCE[name]
+        return (getattr(features, name) - mean) / spread
+
+    cues = [z("energy_db"), z("speaking_rate"), -z("pause_ratio")]
+    if features.pitch_hz:
+        cues.append(z("pitch_range_st"))
+    arousal = float(np.clip(np.mean(cues), -2.0, 2.0))
+    low, high = max(0.0, -arousal) / 2, max(0.0, arousal) / 2
+    return {
+        "negative": low + high / 2,
+        "neutral": 1.0 - low - high,
+        "positive": high / 2,
+    }
+
+
+def fuse_emotions(text_emotions: Dict[str, float], voice_emotions: Optional[Dict[str, float]],
+                  weight: Optional[float] = None) -> Dict[str, float]:
+    """Mix the voice's distribution into the text's with ``weight`` (``CONFIG.prosody_weight``)."""
+    weight = CONFIG.prosody_weight if weight is None else weight
+    if not voice_emotions or weight <= 0:
+        return text_emotions
+    total = sum(text_emotions.values()) or 1.0
+    labels = list(text_emotions) + [label for label in voice_emotions if label not in text_emotions]
+    return {label: (1 - weight) * text_emotions.get(label, 0.0) / total + weight * voice_emotions.get(label, 0.0)
+            for label in labels}
@@ -0,0 +1,383 @@
+"""Client-side rate limiting for the external AI providers."""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from config import CONFIG
+from utils.cancellation import CancellationToken, TurnCancelled, run_cancellable
+from utils.circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# Lower values are served first
+PRIORITY_CRISIS = 0
+PRIORITY_NORMAL = 10
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a request waited longer than its timeout for a slot."""
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a fixed rate."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # units per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` units are available."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def clamp(self, available: float):
+        """Lower the bucket to what the provider reports as remaining."""
+        self.tokens = min(self.tokens, max(0.0, available))
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parse OpenAI style reset values ("1s", "6m0s", "20ms") or plain seconds."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    total = 0.0
+    number = ""
+    i = 0
+    try:
+        while i < len(value):
+            char = value[i]
+            if char.isdigit() or char == ".":
+                number += char
+            elif value.startswith("ms", i):
+                total += float(number or 0) / 1000
+                number = ""
+                i += 1
+            elif char in "hms":
+                total += float(number or 0) * {"h": 3600, "m": 60, "s": 1}[char]
+                number = ""
+            else:
+                return None
+            i += 1
+    except ValueError:  # e.g. "1.2.3s"
+        return None
+    return total
+
+
+def _parse_reset(value: str) -> Optional[float]:
+    """Parse a reset header into seconds from now (durations or RFC 3339 times)."""
+    seconds = _parse_duration(value)
+    if seconds is not None:
+        return seconds
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _parse_number(value: Optional[str]) -> Optional[float]:
+    """Parse a numeric header, or None when it is missing or malformed."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Ignoring malformed rate limit header value: {value!r}")
+        return None
+
+
+def _header(headers: Mapping[str, str], *names: str) -> Optional[str]:
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            value = headers.get(name.title())
+        if value is not None:
+            return str(value)
+    return None
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Check whether a provider exception is an HTTP 429."""
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+def error_headers(error: Exception) -> Mapping[str, str]:
+    """Extract response headers from an OpenAI or Anthropic exception."""
+    headers = getattr(error, "headers", None)
+    if headers is None and getattr(error, "response", None) is not None:
+        headers = getattr(error.response, "headers", None)
+    return headers or {}
+
+
+class ProviderRateLimiter:
+    """Requests-per-second and tokens-per-minute limiter with a priority queue.
+
+    Callers block in ``acquire`` until both buckets have room; waiting callers
+    are served strictly by priority, then arrival order, so crisis turns jump
+    ahead of regular traffic.
+    """
+
+    def __init__(self, name: str, requests_per_second: float, tokens_per_minute: int = 0):
+        self.name = name
+        self.request_bucket = TokenBucket(requests_per_second, max(1.0, requests_per_second))
+        self.token_bucket = None
+        if tokens_per_minute:
+            self.token_bucket = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._blocked_until = 0.0
+        self._backoff = CONFIG.rate_limit_backoff
+
+        self.total_requests = 0
+        self.throttled_responses = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def _delay(self, tokens: int, now: float) -> float:
+        delay = max(self._blocked_until - now, self.request_bucket.time_until(1, now))
+        if self.token_bucket and tokens:
+            delay = max(delay, self.token_bucket.time_until(tokens, now))
+        return delay
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def acquire(self, tokens: int = 0,
+                priority: int = PRIORITY_NORMAL,
+                timeout: Optional[float] = None,
+                cancel_token: Optional[CancellationToken] = None) -> float:
+        """Block until a request may be sent; returns the seconds spent waiting.
+
+        A cancelled turn leaves the queue without ever sending its request.
+        """
+        enqueued = time.monotonic()
+        entry = (priority, next(self._sequence))
+        unregister = cancel_token.on_cancel(self._wake) if cancel_token else None
+
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    if cancel_token is not None:
+                        cancel_token.raise_if_cancelled(f"{self.name}_queue")
+                    now = time.monotonic()
+                    delay = None
+                    if self._waiters[0] == entry:
+                        delay = self._delay(tokens, now)
+                        if delay <= 0:
+                            self.request_bucket.consume(1, now)
+                            if self.token_bucket and tokens:
+                                self.token_bucket.consume(tokens, now)
+                            break
+
+                    if timeout is not None:
+                        remaining = enqueued + timeout - now
+                        if remaining <= 0:
+                            raise RateLimitTimeout(f"{self.name}: no slot within {timeout:.1f}s")
+                        delay = remaining if delay is None else min(delay, remaining)
+                    self._cond.wait(delay)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                if unregister:
+                    unregister()
+
+            waited = time.monotonic() - enqueued
+            self.total_requests += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.last_wait = waited
+
+        if waited > 0.05:
+            logger.info(f"{self.name} request waited {waited:.2f}s for a rate limit slot")
+        return waited
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int):
+        """Return over-reserved tokens once the real usage is known."""
+        if not self.token_bucket or actual_tokens is None:
+            return
+        with self._cond:
+            difference = estimated_tokens - actual_tokens
+            if difference > 0:
+                self.token_bucket.refund(difference)
+            else:
+                self.token_bucket.consume(-difference, time.monotonic())
+            self._cond.notify_all()
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Adapt the buckets to the provider's rate limit response headers."""
+        if not headers:
+            return
+
+        with self._cond:
+            remaining_requests = _parse_number(_header(headers,
+                                                       "x-ratelimit-remaining-requests",
+                                                       "anthropic-ratelimit-requests-remaining"))
+            if remaining_requests is not None and remaining_requests <= 0:
+                reset = _parse_reset(_header(headers,
+                                             "x-ratelimit-reset-requests",
+                                             "anthropic-ratelimit-requests-reset") or "")
+                if reset:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + reset)
+
+            if self.token_bucket:
+                token_limit = _parse_number(_header(headers,
+                                                    "x-ratelimit-limit-tokens",
+                                                    "anthropic-ratelimit-tokens-limit"))
+                if token_limit is not None and token_limit > 0:
+                    self.token_bucket.capacity = token_limit
+                    self.token_bucket.rate = token_limit / 60.0
+
+                remaining_tokens = _parse_number(_header(headers,
+                                                         "x-ratelimit-remaining-tokens",
+                                                         "anthropic-ratelimit-tokens-remaining"))
+                if remaining_tokens is not None:
+                    self.token_bucket.clamp(remaining_tokens)
+
+            retry_after = _header(headers, "retry-after")
+            if retry_after is not None:
+                seconds = _parse_reset(retry_after)
+                if seconds:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+            self._cond.notify_all()
+
+    def on_rate_limited(self, headers: Mapping[str, str]):
+        """Back off after a 429, honouring Retry-After when the provider sends one."""
+        with self._cond:
+            self.throttled_responses += 1
+            retry_after = _parse_reset(_header(headers, "retry-after") or "") if headers else None
+            delay = retry_after if retry_after else self._backoff
+            self._backoff = min(self._backoff * 2, 30.0)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        self.update_from_headers(headers)
+        logger.warning(f"{self.name} returned 429, pausing requests for {delay:.2f}s")
+
+    def on_success(self, headers: Optional[Mapping[str, str]] = None):
+        with self._cond:
+            self._backoff = CONFIG.rate_limit_backoff
+        self.update_from_headers(headers or {})
+
+    def call(self, request: Callable[[], Any],
+             tokens: int = 0,
+             priority: int = PRIORITY_NORMAL,
+             cancel_token: Optional[CancellationToken] = None,
+             breaker: Optional[CircuitBreaker] = None) -> Any:
+        """Run ``request`` under the limiter, retrying when it is throttled.
+
+        With a ``breaker``, an open circuit raises ``CircuitOpen`` before the
+        request queues for a slot, and the outcome and duration of every
+        attempt are reported to it. Throttled attempts, including a last one
+        that exhausts the retries, and cancelled turns say nothing about the
+        endpoint's health and are not counted.
+        """
+        if breaker is not None:
+            breaker.before_call()
+        counted = False
+        try:
+            for attempt in range(CONFIG.rate_limit_max_retries + 1):
+                self.acquire(tokens, priority, cancel_token=cancel_token)
+                started = time.monotonic()
+                try:
+                    response = run_cancellable(request, cancel_token, self.name)
+                except TurnCancelled:
+                    raise
+                except Exception as e:
+                    if not is_rate_limit_error(e):
+                        if breaker is not None:
+                            breaker.record(time.monotonic() - started, failed=True)
+                            counted = True
+                        raise
+                    self.on_rate_limited(error_headers(e))
+                    if attempt == CONFIG.rate_limit_max_retries:
+                        raise
+                    continue
+                if breaker is not None:
+                    breaker.record(time.monotonic() - started, failed=False)
+                    counted = True
+                self.on_success()
+                return response
+        finally:
+            if breaker is not None and not counted:
+                breaker.release()
+
+    @property
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._waiters)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of queue depth and wait times."""
+        with self._cond:
+            return {
+                "provider": self.name,
+                "queue_depth": len(self._waiters),
+                "total_requests": self.total_requests,
+                "throttled_responses": self.throttled_responses,
+                "avg_wait": self.total_wait / self.total_requests if self.total_requests else 0.0,
+                "max_wait": self.max_wait,
+                "last_wait": self.last_wait,
+            }
+
+
+_limiters: Dict[str, ProviderRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> ProviderRateLimiter:
+    """Return the process-wide limiter for a provider, shared by all sessions."""
+    with _limiters_lock:
+        if provider not in _limiters:
+            limits = CONFIG.rate_limits.get(provider, {})
+            _limiters[provider] = ProviderRateLimiter(
+                provider,
+                requests_per_second=limits.get("requests_per_second", 1.0),
+                tokens_per_minute=limits.get("tokens_per_minute", 0),
+            )
+        return _limiters[provider]
+
+
+def reset_rate_limiters():
+    """Forget all limiters so the next ``get_rate_limiter`` starts from a clean state.
+
+    Services keep the limiter they were created with, so recreate them afterwards.
+    """
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    """Queue depth and wait time for every provider limiter created so far."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
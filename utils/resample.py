@@ -0,0 +1,65 @@
+"""Polyphase sample-rate conversion between pipeline stages."""
+
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Filter quality: zero crossings of the sinc on each side, Kaiser window beta,
+# and the passband edge as a fraction of the lower Nyquist frequency
+ZERO_CROSSINGS = 16
+KAISER_BETA = 8.0
+ROLLOFF = 0.94
+
+
+@lru_cache(maxsize=32)
+def _polyphase_filter(up: int, down: int) -> np.ndarray:
+    """Anti-aliasing low-pass split into ``up`` phases, taps reversed for a dot product.
+
+    Row ``r`` holds the taps that land on input samples for output phase ``r``.
+    """
+    max_rate = max(up, down)
+    length = 2 * ZERO_CROSSINGS * max_rate + 1
+    cutoff = ROLLOFF / max_rate
+    t = np.arange(length) - (length - 1) / 2
+    taps = cutoff * np.sinc(cutoff * t) * np.kaiser(length, KAISER_BETA) * up
+
+    per_phase = -(-length // up)
+    padded = np.zeros(per_phase * up)
+    padded[:length] = taps
+    phases = padded.reshape(per_phase, up).T  # phases[r, k] = taps[r + k * up]
+    return np.ascontiguousarray(phases[:, ::-1], dtype=np.float32)
+
+
+def resample(samples: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
+    """Resample mono float samples from ``from_rate`` to ``to_rate``.
+
+    Upsamples by ``up`` and downsamples by ``down`` (the reduced rate ratio)
+    without materialising the upsampled signal: every output sample is one
+    dot product of a filter phase with a strided window over the input.
+    Outputs sharing a phase are computed together as one matrix-vector product.
+    """
+    samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+    if from_rate == to_rate or samples.shape[0] == 0:
+        return samples
+
+    divisor = gcd(int(from_rate), int(to_rate))
+    up, down = int(to_rate) // divisor, int(from_rate) // divisor
+    phases = _polyphase_filter(up, down)
+    taps = phases.shape[1]
+    delay = ZERO_CROSSINGS * max(up, down)  # filter centre, in upsampled samples
+
+    out_length = -(-samples.shape[0] * up // down)
+    padded = np.zeros(samples.shape[0] + 2 * taps, dtype=np.float32)
+    padded[taps:taps + samples.shape[0]] = samples
+    windows = sliding_window_view(padded, taps)  # windows[i] = padded[i:i + taps]
+
+    output = np.empty(out_length, dtype=np.float32)
+    for first in range(min(up, out_length)):
+        position = first * down + delay
+        phase, base = position % up, position // up
+        # Output n + up reads ``down`` input samples further along
+        rows = windows[base + 1::down][:len(range(first, out_length, up))]
+        output[first::up] = rows @ phases[phase]
+    return output
@@ -0,0 +1,136 @@
+"""Keeps replies to the sentence and character budget the prompt asks for.
+
+``ResponseGovernor`` follows a streamed reply and says when to stop
+reading, so the model stops generating (and TTS never sees) anything past
+the budget. ``trim_to_budget`` applies the same cut to a finished text,
+such as a Claude reply. Replies are only cut at sentence ends.
+
+Crisis replies are exempt: the helpline sentence may come after the
+budget, and cutting it would defeat the reply.
+"""
+
+import re
+import threading
+from typing import Dict, Optional
+
+from config import CONFIG
+
+# A terminator once whitespace follows it, or a line break that does not follow one
+_SENTENCE_END = re.compile(r'[.!?؟۔…]+(?=\s)|(?<![.!?؟۔…\s])\n')
+
+_stats = {
+    "replies": 0,
+    "within_budget": 0,  # finished on their own without exceeding the budget
+    "stopped_early": 0,  # streams cut once the budget was met
+    "trimmed": 0,  # finished replies cut afterwards
+    "exempt": 0,  # crisis replies, never cut
+    "output_chars": 0,
+    "trimmed_chars": 0,
+    "max_tokens_unused": 0,  # upper bound on output tokens saved by stopping early
+}
+_stats_lock = threading.Lock()
+
+
+def _cut_point(text: str, max_sentences: int, max_chars: int) -> Optional[int]:
+    """Index to cut ``text`` at, or None while it is still within budget.
+
+    Cuts fall on sentence ends only: at the last one inside ``max_chars``,
+    or, when the first sentence alone is longer than that, at its end. A
+    reply that ends right after its last allowed sentence is within
+    budget, so a stream is only cut once text past that sentence arrives.
+    """
+    sentences = 0
+    last_end = 0
+    for match in _SENTENCE_END.finditer(text):
+        if max_chars and match.end() > max_chars and last_end:
+            return last_end
+        sentences += 1
+        last_end = match.end()
+        if (max_sentences and sentences >= max_sentences) or (max_chars and last_end > max_chars):
+            return last_end if text[last_end:].strip() else None
+    if max_chars and last_end and len(text.rstrip()) > max_chars:
+        return last_end
+    return None
+
+
+class ResponseGovernor:
+    """Accumulates streamed text until the reply reaches its budget."""
+
+    def __init__(self, max_sentences: Optional[int] = None, max_chars: Optional[int] = None,
+                 exempt: bool = False):
+        self.max_sentences = CONFIG.response_max_sentences if max_sentences is None else max_sentences
+        self.max_chars = CONFIG.response_max_chars if max_chars is None else max_chars
+        self.exempt = exempt  # a crisis reply: read and keep all of it
+        self.received = ""
+        self.cut: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return not self.exempt and bool(self.max_sentences or self.max_chars)
+
+    def feed(self, delta: str) -> bool:
+        """Add the next piece of the stream; True once the budget is met and reading should stop."""
+        self.received += delta
+        if self.enabled and self.cut is None:
+            self.cut = _cut_point(self.received, self.max_sentences, self.max_chars)
+        return self.cut is not None
+
+    def settled(self) -> str:
+        """The complete sentences received so far that the budget will keep, to pass on while streaming."""
+        end = 0
+        for count, match in enumerate(_SENTENCE_END.finditer(self.received), 1):
+            if self.enabled and count > 1 and ((self.max_sentences and count > self.max_sentences)
+                                               or (self.max_chars and match.end() > self.max_chars)):
+                break
+            end = match.end()
+        if self.cut is not None:
+            end = min(end, self.cut)
+        return self.received[:end].strip()
+
+    @property
+    def text(self) -> str:
+        return (self.received if self.cut is None else self.received[:self.cut]).strip()
+
+    def finish(self, max_tokens: int = 0, tokens_received: int = 0) -> str:
+        """Record the outcome of the reply and return its text within budget."""
+        stopped_early = self.cut is not None
+        if not stopped_early and self.enabled:
+            # The last sentence may end the text without whitespace after it
+            self.cut = _cut_point(self.received + "\n", self.max_sentences, self.max_chars)
+        text = self.text
+        with _stats_lock:
+            _stats["replies"] += 1
+            _stats["output_chars"] += len(text)
+            _stats["trimmed_chars"] += len(self.received.strip()) - len(text)
+            if stopped_early:
+                _stats["stopped_early"] += 1
+                _stats["max_tokens_unused"] += max(0, max_tokens - tokens_received)
+            elif self.cut is not None:
+                _stats["trimmed"] += 1
+            elif self.exempt:
+                _stats["exempt"] += 1
+            else:
+                _stats["within_budget"] += 1
+        return text
+
+
+def trim_to_budget(text: str, max_sentences: Optional[int] = None, exempt: bool = False) -> str:
+    """Cut a finished reply to the configured budget (or to ``max_sentences``); ``exempt`` keeps it whole."""
+    governor = ResponseGovernor(max_sentences, exempt=exempt)
+    governor.received = text
+    return governor.finish()
+
+
+def reset_response_budget_stats():
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+def response_budget_stats() -> Dict[str, float]:
+    """How often replies kept to the budget on their own, and what cutting saved."""
+    with _stats_lock:
+        stats = dict(_stats)
+    budgeted = stats["replies"] - stats["exempt"]
+    stats["adherence"] = round(stats["within_budget"] / budgeted, 3) if budgeted else 0.0
+    return stats
@@ -0,0 +1,118 @@
+"""Splitting a reply into synthesis segments and joining the audio back together.
+
+Segments are synthesized independently (and in parallel), so each one
+comes back with its own level and edges. Levels are evened out per
+segment and neighbouring segments are joined with a short equal-power
+crossfade, so the reply plays as one utterance.
+"""
+
+import re
+from typing import List, Optional
+
+import numpy as np
+
+from config import CONFIG
+from utils.text_utils import split_sentences
+
+_PHRASE_BREAK = re.compile(r'(?<=[،,؛;:])\s+')
+
+
+def _pack(pieces: List[str], max_chars: int, separator: str = " ") -> List[str]:
+    """Greedily join consecutive pieces into chunks of at most ``max_chars``."""
+    chunks: List[str] = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + len(separator) + len(piece) <= max_chars:
+            chunks[-1] += separator + piece
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def plan_segments(text: str, max_chars: Optional[int] = None, min_chars: Optional[int] = None) -> List[str]:
+    """Sentences, with long ones split at phrase breaks (then words) and short ones merged.
+
+    Short segments are merged into their neighbour because every XTTS call
+    has a fixed cost and very short inputs come out with unnatural prosody.
+    """
+    max_chars = max_chars or CONFIG.tts_max_segment_chars
+    min_chars = CONFIG.tts_min_segment_chars if min_chars is None else min_chars
+
+    segments: List[str] = []
+    for sentence in split_sentences(text):
+        if len(sentence) <= max_chars:
+            segments.append(sentence)
+            continue
+        for phrase in _pack(_PHRASE_BREAK.split(sentence), max_chars):
+            if len(phrase) <= max_chars:
+                segments.append(phrase)
+            else:
+                segments.extend(_pack(phrase.split(), max_chars))
+
+    merged: List[str] = []
+    for segment in segments:
+        if merged and (len(segment) < min_chars or len(merged[-1]) < min_chars):
+            merged[-1] += " " + segment
+        else:
+            merged.append(segment)
+    return merged
+
+
+def speech_rms(samples: np.ndarray, frame: int = 512, gate_dbfs: float = -50.0) -> float:
+    """RMS over the frames louder than ``gate_dbfs``, so pauses don't lower the estimate."""
+    usable = samples.shape[0] - samples.shape[0] % frame
+    if usable == 0:
+        return float(np.sqrt(np.mean(samples ** 2))) if samples.size else 0.0
+    frame_power = np.mean(samples[:usable].reshape(-1, frame) ** 2, axis=1)
+    active = frame_power[frame_power > 10 ** (gate_dbfs / 10)]
+    return float(np.sqrt(np.mean(active))) if active.size else 0.0
+
+
+def normalize_loudness(samples: np.ndarray, target_dbfs: Optional[float] = None,
+                       max_gain_db: Optional[float] = None) -> np.ndarray:
+    """Scale a segment towards ``target_dbfs`` speech RMS, within ``max_gain_db`` and without clipping."""
+    target_dbfs = CONFIG.tts_target_dbfs if target_dbfs is None else target_dbfs
+    max_gain_db = CONFIG.tts_max_gain_db if max_gain_db is None else max_gain_db
+    rms = speech_rms(samples)
+    if rms <= 0:
+        return samples
+    gain_db = float(np.clip(target_dbfs - 20 * np.log10(rms), -max_gain_db, max_gain_db))
+    gain = 10 ** (gain_db / 20)
+    peak = float(np.max(np.abs(samples)))
+    if peak * gain > 0.98:
+        gain = 0.98 / peak
+    return (samples * np.float32(gain)).astype(np.float32, copy=False)
+
+
+class SegmentJoiner:
+    """Joins segments in order with an equal-power crossfade, emitting audio as it becomes final.
+
+    The last ``crossfade_ms`` of each segment is held back until the next
+    segment arrives (or ``flush`` is called), since it gets mixed with
+    that segment's start.
+    """
+
+    def __init__(self, sample_rate: int, crossfade_ms: Optional[int] = None):
+        crossfade_ms = CONFIG.tts_crossfade_ms if crossfade_ms is None else crossfade_ms
+        self.overlap = int(sample_rate * crossfade_ms / 1000)
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._started = False
+
+    def push(self, samples: np.ndarray) -> np.ndarray:
+        samples = np.asarray(samples, dtype=np.float32)
+        if self._started:
+            count = min(self._tail.shape[0], samples.shape[0])
+            if count:
+                ramp = np.linspace(0.0, np.pi / 2, count + 2, dtype=np.float32)[1:-1]
+                mixed = self._tail[-count:] * np.cos(ramp) + samples[:count] * np.sin(ramp)
+                samples = np.concatenate([self._tail[:-count], mixed, samples[count:]])
+            else:
+                samples = np.concatenate([self._tail, samples])
+        self._started = True
+
+        hold = min(self.overlap, samples.shape[0] // 2)
+        self._tail = samples[samples.shape[0] - hold:]
+        return samples[:samples.shape[0] - hold]
+
+    def flush(self) -> np.ndarray:
+        tail, self._tail = self._tail, np.zeros(0, dtype=np.float32)
+        return tail
@@ -28,7 +28,8 @@ def detect_crisis_keywords(text: str, keywords: list) -> bool:
     normalized_text = normalize_arabic_text(text.lower())
     
     for keyword in keywords:
-        if keyword.lower() in normalized_text:
+        # Keywords are normalized the same way, or any with hamza or taa marbuta never match
+        if normalize_arabic_text(keyword.lower()) in normalized_text:
             return True
     
     return False
@@ -36,4 +37,19 @@ def detect_crisis_keywords(text: str, keywords: list) -> bool:
 def is_arabic_text(text: str) -> bool:
     """Check if text contains Arabic characters."""
     arabic_pattern = re.compile(r'[\u0600-\u06FF]')
-    return bool(arabic_pattern.search(text))
\ No newline at end of file
+    return bool(arabic_pattern.search(text))
+
+def split_sentences(text: str) -> list:
+    """Split text into sentences on Arabic and Latin terminators."""
+    if not text:
+        return []
+    parts = re.split(r'(?<=[.!?؟۔])\s+|\n+', text.strip())
+    return [part.strip() for part in parts if part.strip()]
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate used to reserve rate limit budget before a call."""
+    if not text:
+        return 0
+    # Arabic script tokenizes at roughly two characters per token, Latin at four
+    arabic_chars = len(re.findall(r'[\u0600-\u06FF]', text))
+    return arabic_chars // 2 + (len(text) - arabic_chars) // 4 + 1
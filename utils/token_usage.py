@@ -0,0 +1,102 @@
+"""Input and output tokens of provider requests, per stage and per turn.
+
+Stages are the kinds of request the pipeline makes ("gpt",
+"claude_validation", "claude_fallback"). Each has an optional input
+token budget in ``CONFIG.prompt_token_budgets``.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+_stages: Dict[str, Dict[str, int]] = {}
+_stages_lock = threading.Lock()
+_local = threading.local()
+
+
+def _stage(stage: str) -> Dict[str, int]:
+    return _stages.setdefault(stage, {
+        "requests": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "max_input_tokens": 0,
+        "estimated_input_tokens": 0,
+        "over_budget": 0,
+    })
+
+
+def input_budget(stage: str) -> int:
+    """Input token budget of a stage; 0 means unlimited."""
+    return CONFIG.prompt_token_budgets.get(stage, 0)
+
+
+def exceeds_budget(stage: str, estimated_input: int) -> bool:
+    """Check a prompt against its stage budget, counting and logging overruns."""
+    budget = input_budget(stage)
+    if not budget or estimated_input <= budget:
+        return False
+    with _stages_lock:
+        _stage(stage)["over_budget"] += 1
+    logger.warning(f"{stage} prompt is over budget: ~{estimated_input} tokens (budget {budget})")
+    return True
+
+
+def record_tokens(stage: str, input_tokens: int, output_tokens: int, estimated_input: int = 0):
+    """Record one completed request, as reported by the provider."""
+    with _stages_lock:
+        stats = _stage(stage)
+        stats["requests"] += 1
+        stats["input_tokens"] += input_tokens
+        stats["output_tokens"] += output_tokens
+        stats["max_input_tokens"] = max(stats["max_input_tokens"], input_tokens)
+        stats["estimated_input_tokens"] += estimated_input
+
+    turn = getattr(_local, "turn", None)
+    if turn is not None:
+        usage = turn.setdefault(stage, {"input": 0, "output": 0})
+        usage["input"] += input_tokens
+        usage["output"] += output_tokens
+
+
+@contextmanager
+def track_turn_tokens():
+    """Collect the tokens of the requests this thread makes inside the block.
+
+    Yields a dict of stage -> {"input", "output"}, filled in as requests complete.
+    """
+    turn: Dict[str, Dict[str, int]] = {}
+    previous: Optional[dict] = getattr(_local, "turn", None)
+    _local.turn = turn
+    try:
+        yield turn
+    finally:
+        _local.turn = previous
+
+
+def reset_token_usage():
+    """Forget the totals, e.g. between load test runs."""
+    with _stages_lock:
+        _stages.clear()
+
+
+def token_usage_stats() -> Dict[str, Dict[str, float]]:
+    """Totals per stage since startup, with averages and the stage budget."""
+    with _stages_lock:
+        report = {}
+        for stage, stats in _stages.items():
+            requests = stats["requests"]
+            report[stage] = {
+                **stats,
+                "avg_input_tokens": round(stats["input_tokens"] / requests, 1) if requests else 0.0,
+                "avg_output_tokens": round(stats["output_tokens"] / requests, 1) if requests else 0.0,
+                # How far the pre-request estimate (used to reserve rate limit budget) is off
+                "estimate_ratio": round(stats["estimated_input_tokens"] / stats["input_tokens"], 2)
+                if stats["input_tokens"] else 0.0,
+                "budget": input_budget(stage),
+            }
+        return report